@@ -0,0 +1,330 @@
+"""
+activity_log.py
+Append-only activity event log (JSON Lines) with capped retention and tail queries.
+
+logs/activity_log.json was one JSON array, so every event (bot started,
+settings updated, ...) loaded, extended and rewrote the whole file, and
+/api/activity-log served all of it.  Events are now single lines appended to
+segment files (activity-000001.jsonl, ...) in logs/activity/.  A segment is
+closed once it reaches segment_bytes; whole segments beyond max_bytes (or
+older than max_age_days) are deleted, so retention costs nothing per write and
+nothing is ever rewritten.
+
+Queries are served from an in-memory index of the newest index_size events
+(overall and per tag).  Readers in another process - the dashboard API - call
+refresh() (done by every query) to pick up only the bytes appended since the
+last poll, so writes and polls stay constant-time as history grows.  since()
+older than the index falls back to scanning the segments that can contain it.
+
+    log = ActivityLog()
+    log.append("bot_control", "Bot Started", "Trading bot process initiated.", tag="status")
+    log.tail(50)
+    log.since("2025-09-15T15:00:00", tag="settings")
+"""
+
+import bisect
+import json
+import logging
+import os
+import sys
+import threading
+from datetime import datetime, timedelta
+
+logger = logging.getLogger("activity_log")
+
+_BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DIR = os.path.join(_BASE_DIR, "logs", "activity")
+LEGACY_FILE = os.path.join(_BASE_DIR, "logs", "activity_log.json")
+SEGMENT_PREFIX = "activity-"
+SEGMENT_SUFFIX = ".jsonl"
+
+
+class _Recent:
+    """Newest-last event list capped at size (trimmed in halves, so appends are amortised O(1))."""
+
+    def __init__(self, size):
+        self.size = size
+        self.events = []
+        self.stamps = []
+        self.trimmed = False
+
+    def add(self, event):
+        self.events.append(event)
+        self.stamps.append(event["timestamp"])
+        if len(self.events) > 2 * self.size:
+            del self.events[:-self.size]
+            del self.stamps[:-self.size]
+            self.trimmed = True
+
+    def tail(self, n):
+        return self.events[-n:] if n > 0 else []
+
+    def covers(self, timestamp):
+        """True if every indexed event at or after timestamp is still held."""
+        return not self.trimmed or timestamp > self.stamps[0]
+
+    def since(self, timestamp):
+        return self.events[bisect.bisect_left(self.stamps, timestamp):]
+
+
+class ActivityLog:
+    """
+    directory: segment files live here (created if missing).
+    segment_bytes / max_bytes: roll segments at this size; drop the oldest once all exceed max_bytes.
+    max_age_days: also drop segments whose newest event is older than this (None = keep).
+    index_size: events kept in memory for tail/since queries (overall and per tag).
+    """
+
+    def __init__(self, directory=DEFAULT_DIR, segment_bytes=256 * 1024, max_bytes=4 * 1024 * 1024,
+                 max_age_days=None, index_size=1000):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.index_size = index_size
+        self._lock = threading.Lock()
+        self._recent = _Recent(index_size)
+        self._by_tag = {}
+        self._segment = None
+        self._offset = 0
+        self._file = None
+        self._horizon = ""  # events older than this were left on disk when the index was loaded
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    # ------------------------------------------------------------------
+    # Segments
+    # ------------------------------------------------------------------
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{number:06d}{SEGMENT_SUFFIX}")
+
+    def segments(self):
+        numbers = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                try:
+                    numbers.append(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+                except ValueError:
+                    continue
+        return sorted(numbers)
+
+    def _read(self, number, offset=0):
+        """(events, end offset) for the complete lines of a segment from offset."""
+        events = []
+        try:
+            with open(self._segment_path(number), "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # a writer is mid-line; pick it up on the next refresh
+                    offset += len(line)
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        logger.warning(f"Skipping corrupt line in activity segment {number}")
+        except FileNotFoundError:
+            pass
+        return events, offset
+
+    def _index(self, event):
+        self._recent.add(event)
+        tag = event.get("tag")
+        if tag is not None:
+            recent = self._by_tag.get(tag)
+            if recent is None:
+                recent = self._by_tag[tag] = _Recent(self.index_size)
+            recent.add(event)
+
+    def _load_index(self):
+        numbers = self.segments()
+        if not numbers:
+            return
+        # Read newest segments until the index is full (or everything is read)
+        chosen, count = [], 0
+        for number in reversed(numbers):
+            chosen.append(number)
+            count += self._count_lines(number)
+            if count >= self.index_size:
+                break
+        for number in reversed(chosen):
+            events, self._offset = self._read(number)
+            if number == chosen[-1] and len(chosen) < len(numbers) and events:
+                self._horizon = events[0]["timestamp"]
+            for event in events:
+                self._index(event)
+        self._segment = numbers[-1]
+
+    def _count_lines(self, number):
+        with open(self._segment_path(number), "rb") as f:
+            return sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 16), b""))
+
+    def _enforce_retention(self):
+        numbers = self.segments()
+        sizes = {n: os.path.getsize(self._segment_path(n)) for n in numbers}
+        total = sum(sizes.values())
+        cutoff = None
+        if self.max_age_days is not None:
+            cutoff = (datetime.now() - timedelta(days=self.max_age_days)).isoformat()
+        for number in numbers[:-1]:  # never the segment being written
+            expired = False
+            if cutoff is not None:
+                events, _ = self._read(number)
+                expired = not events or events[-1]["timestamp"] < cutoff
+            if total <= self.max_bytes and not expired:
+                break
+            os.remove(self._segment_path(number))
+            total -= sizes[number]
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+    def append(self, type, title, details="", tag="system", timestamp=None, **extra):
+        """Record one event (same fields as the old activity_log.json entries)."""
+        event = {"type": type, "title": title, "details": details,
+                 "timestamp": timestamp or datetime.now().isoformat(), "tag": tag}
+        event.update(extra)
+        line = (json.dumps(event, separators=(",", ":"), default=str) + "\n").encode()
+        with self._lock:
+            self._refresh()
+            if self._segment is None or (self._offset and self._offset + len(line) > self.segment_bytes):
+                self._switch(self._segment + 1 if self._segment else 1)
+                self._enforce_retention()
+            if self._file is None:
+                self._file = open(self._segment_path(self._segment), "ab")
+            self._file.write(line)
+            self._file.flush()
+            # Index through the normal read path so lines other processes appended meanwhile keep their order
+            self._refresh()
+        return event
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+    def _switch(self, number):
+        self._segment, self._offset = number, 0
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _refresh(self):
+        """Index what other processes appended since the last look (only the new bytes are read)."""
+        if self._segment is None or not os.path.exists(self._segment_path(self._segment)):
+            # Not started yet, or our segment was dropped by retention in another process
+            newer = [n for n in self.segments() if self._segment is None or n > self._segment]
+            if not newer:
+                return
+            self._switch(newer[0])
+        while True:
+            events, self._offset = self._read(self._segment, self._offset)
+            for event in events:
+                self._index(event)
+            if not os.path.exists(self._segment_path(self._segment + 1)):
+                return
+            self._switch(self._segment + 1)
+
+    def refresh(self):
+        with self._lock:
+            self._refresh()
+
+    def tail(self, n=50, tag=None):
+        """Newest n events (optionally of one tag), newest first - the order the dashboard shows."""
+        with self._lock:
+            self._refresh()
+            recent = self._recent if tag is None else self._by_tag.get(tag)
+            return list(reversed(recent.tail(n))) if recent else []
+
+    def since(self, timestamp, tag=None, limit=None):
+        """Events at or after an ISO timestamp (optionally of one tag), newest first."""
+        timestamp = timestamp.isoformat() if isinstance(timestamp, datetime) else str(timestamp)
+        with self._lock:
+            self._refresh()
+            recent = self._recent if tag is None else self._by_tag.get(tag, _Recent(self.index_size))
+            if timestamp >= self._horizon and recent.covers(timestamp):
+                events = recent.since(timestamp)
+            else:
+                events = None
+        if events is None:
+            events = [e for e in self._scan_since(timestamp) if tag is None or e.get("tag") == tag]
+        events = list(reversed(events))
+        return events[:limit] if limit else events
+
+    def _scan_since(self, timestamp):
+        """Events at or after timestamp read from disk, starting at the newest segment that begins before it."""
+        numbers = self.segments()
+        start = 0
+        for i in range(len(numbers) - 1, -1, -1):
+            with open(self._segment_path(numbers[i]), "rb") as f:
+                first = f.readline()
+            try:
+                if first and json.loads(first)["timestamp"] <= timestamp:
+                    start = i
+                    break
+            except (ValueError, KeyError):
+                continue
+        out = []
+        for number in numbers[start:]:
+            events, _ = self._read(number)
+            out.extend(e for e in events if e["timestamp"] >= timestamp)
+        return out
+
+    def tags(self):
+        with self._lock:
+            self._refresh()
+            return sorted(self._by_tag)
+
+
+def migrate_legacy(log, path=LEGACY_FILE):
+    """Import logs/activity_log.json into an empty activity log (oldest first); returns events imported."""
+    if log.segments() or not os.path.exists(path):
+        return 0
+    try:
+        with open(path) as f:
+            events = json.load(f)
+    except ValueError as e:
+        logger.error(f"Skipping unreadable legacy activity log {path}: {e}")
+        return 0
+    events = sorted(events, key=lambda e: e.get("timestamp", ""))
+    for event in events:
+        event = dict(event)
+        log.append(event.pop("type", "bot"), event.pop("title", "Update"), event.pop("details", ""),
+                   tag=event.pop("tag", "system"), timestamp=event.pop("timestamp", None), **event)
+    logger.info(f"Migrated {len(events)} activity events from {path}")
+    return len(events)
+
+
+def main():
+    """
+    python -m STOCKDATA.activity_log [tail N | since TIMESTAMP] [--tag TAG]
+    JSON for the dashboard's /api/activity-log (newest first).
+    """
+    args = sys.argv[1:]
+    tag = None
+    if "--tag" in args:
+        i = args.index("--tag")
+        tag = args[i + 1]
+        del args[i:i + 2]
+    log = ActivityLog(os.environ.get("ACTIVITY_LOG_DIR", DEFAULT_DIR))
+    migrate_legacy(log)
+    command = args[0] if args else "tail"
+    if command == "since":
+        events = log.since(args[1], tag=tag)
+    else:
+        events = log.tail(int(args[1]) if len(args) > 1 else 200, tag=tag)
+    json.dump(events, sys.stdout, indent=2, default=str)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
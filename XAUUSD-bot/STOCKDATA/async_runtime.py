@@ -0,0 +1,136 @@
+"""
+async_runtime.py
+asyncio runtime for the trading loop.
+
+MetaTrader5 calls block and the API is not thread safe, so they all run on one
+dedicated executor thread, in submission order.  Indicator computation runs on a
+separate worker thread, so it overlaps with terminal round-trips (the MT5 calls
+release the GIL while waiting on the terminal).  Logging, notifications and
+state persistence are fire-and-forget background jobs: the order path never
+awaits them, so a slow Telegram call or disk write cannot delay the next order.
+
+    rt = AsyncRuntime(mt5)
+    tick = await rt.mt5.symbol_info_tick("XAUUSD")
+    rates = await rt.mt5.run(BAR_CACHE.get, "XAUUSD", tf, 300)   # any MT5-bound function
+    signal = await rt.compute(check_for_signal, rates)
+    rt.background.submit(log, "...")
+"""
+
+import asyncio
+import functools
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("async_runtime")
+
+
+class MT5Executor:
+    """Awaitable proxy: `await executor.order_send(request)` runs on the MT5 thread."""
+
+    def __init__(self, mt5):
+        self._mt5 = mt5
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mt5")
+
+    async def run(self, fn, *args, **kwargs):
+        """Run any function that touches the terminal on the MT5 thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn on the MT5 thread from another worker thread and wait for it (never from the MT5 thread)."""
+        return self._pool.submit(fn, *args, **kwargs).result()
+
+    def __getattr__(self, name):
+        attr = getattr(self._mt5, name)
+        if not callable(attr):
+            return attr  # constants such as TIMEFRAME_M5
+
+        async def call(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        call.__name__ = name
+        return call
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+
+class BackgroundTasks:
+    """
+    Bounded fire-and-forget queue drained by worker threads.
+    submit() never blocks: when the queue is full the job is dropped and counted.
+    """
+
+    def __init__(self, workers=2, max_pending=1000):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self.dropped = 0
+        self.failed = 0
+        self._threads = [threading.Thread(target=self._worker, name=f"bg-{i}", daemon=True)
+                         for i in range(workers)]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, fn, *args, **kwargs):
+        try:
+            self._queue.put_nowait((fn, args, kwargs))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                fn, args, kwargs = job
+                try:
+                    fn(*args, **kwargs)
+                except Exception as e:
+                    self.failed += 1
+                    logger.error(f"Background job {getattr(fn, '__name__', fn)} failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def join(self):
+        """Block until everything submitted so far has run."""
+        self._queue.join()
+
+    def shutdown(self):
+        self.join()
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+
+
+class AsyncRuntime:
+    """MT5 executor + compute thread + background I/O, with one shutdown."""
+
+    def __init__(self, mt5, background_workers=2, max_pending=1000):
+        self.mt5 = MT5Executor(mt5)
+        self.background = BackgroundTasks(background_workers, max_pending)
+        self._compute = ThreadPoolExecutor(max_workers=1, thread_name_prefix="compute")
+
+    async def compute(self, fn, *args, **kwargs):
+        """Run CPU work (indicators, signal checks) off the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._compute, functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self):
+        self.background.shutdown()
+        self._compute.shutdown()
+        self.mt5.shutdown()
+
+    def run(self, coro):
+        """asyncio.run(coro), shutting the executors down afterwards."""
+        try:
+            return asyncio.run(coro)
+        finally:
+            self.shutdown()
@@ -0,0 +1,332 @@
+"""
+backtest.py
+Event-driven backtester that replays MT5 rates through the live signal functions.
+
+Bars are replayed in order; after each close the strategy's own signal function
+(check_for_signal / check_macd_signal) is called on the closed bars with a
+streaming indicator engine, exactly as the live loop does, so each bar costs
+O(1).  An entry fills at the next bar's open plus the simulated spread and
+slippage, SL/TP come from the strategy module's sl_tp_prices (sl_points /
+tp_points x point), and exits are found with a vectorised scan of the following
+bars.  Only one position per strategy is open at a time and the cooldown and
+max-spread checks of the live loop apply.
+
+Runs offline: without the MetaTrader5 package the strategy modules get
+STOCKDATA.offline_mt5 from broker.get_backend().
+
+    python -m STOCKDATA.backtest XAUUSD_M5.csv --strategy macd --spread 25
+    python -m STOCKDATA.backtest data/bars/XAUUSD/M5.bars --strategy macd
+"""
+
+import argparse
+import functools
+import importlib
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from STOCKDATA.bar_cache import RATES_DTYPE
+from STOCKDATA.bar_store import BARS_EXT, open_bars
+from STOCKDATA.modules.indicator_engine import EMACrossEngine, MACDEngine
+
+logger = logging.getLogger("backtest")
+
+TRADE_DTYPE = np.dtype([
+    ("entry_time", "<i8"),
+    ("exit_time", "<i8"),
+    ("side", "i1"),          # 1 buy, -1 sell
+    ("entry", "<f8"),
+    ("exit", "<f8"),
+    ("sl", "<f8"),
+    ("tp", "<f8"),
+    ("reason", "U4"),        # sl, tp, end
+    ("points", "<f8"),
+    ("profit", "<f8"),
+])
+
+INTRABAR_MODES = ("sl_first", "tp_first")
+_TAIL = 8
+
+
+def _ema_engine(config):
+    return EMACrossEngine(config["ema_fast"], config["ema_slow"])
+
+
+def _macd_engine(config):
+    return MACDEngine(config["macd_fast"], config["macd_slow"], config["macd_signal"])
+
+
+# name -> (module, signal function, engine factory taking the strategy CONFIG)
+STRATEGIES = {
+    "moving_average_crossover": ("STOCKDATA.modules.moving_average_crossover", "check_for_signal", _ema_engine),
+    "macd": ("STOCKDATA.modules.macd", "check_macd_signal", _macd_engine),
+}
+
+
+# ----------------------------------------------------------------------
+# Data loading
+# ----------------------------------------------------------------------
+_COLUMN_ALIASES = {"tickvol": "tick_volume", "vol": "real_volume", "volume": "tick_volume"}
+
+
+def load_rates(path):
+    """
+    Read MT5 rates from CSV (copy_rates export or the terminal's <DATE> <TIME> history
+    export) or Parquet into a RATES_DTYPE array sorted by time, duplicates dropped.
+    A bar_store .bars file is returned as its read-only memory map.
+    """
+    if path.lower().endswith(BARS_EXT):
+        return open_bars(path)
+    if path.lower().endswith((".parquet", ".pq")):
+        df = pd.read_parquet(path)
+    else:
+        with open(path) as f:
+            sep = "\t" if "\t" in f.readline() else ","
+        df = pd.read_csv(path, sep=sep)
+    df.columns = [_COLUMN_ALIASES.get(c, c) for c in (c.strip("<>").lower() for c in df.columns)]
+
+    if "date" in df.columns and "time" in df.columns:
+        stamp = pd.to_datetime(df["date"].astype(str) + " " + df["time"].astype(str))
+        seconds = stamp.to_numpy("datetime64[s]").astype(np.int64)
+    elif pd.api.types.is_numeric_dtype(df["time"]):
+        seconds = df["time"].to_numpy(np.int64)
+        if seconds.size and seconds.max() > 10 ** 11:  # milliseconds
+            seconds = seconds // 1000
+    else:
+        seconds = pd.to_datetime(df["time"]).to_numpy("datetime64[s]").astype(np.int64)
+
+    rates = np.zeros(len(df), dtype=RATES_DTYPE)
+    rates["time"] = seconds
+    for field in RATES_DTYPE.names[1:]:
+        if field in df.columns:
+            rates[field] = df[field].to_numpy()
+    rates = rates[np.argsort(rates["time"], kind="stable")]
+    keep = np.ones(len(rates), dtype=bool)
+    keep[1:] = rates["time"][1:] != rates["time"][:-1]
+    return rates[keep]
+
+
+# ----------------------------------------------------------------------
+# Fill model
+# ----------------------------------------------------------------------
+class FillModel:
+    """
+    Bars are bid prices, as MT5 stores them; the ask is bid + spread.
+    spread_points: fixed spread, or None to use each bar's recorded spread.
+    slippage_points: adverse slippage on market fills (entries and stop exits);
+    slippage_jitter adds a uniform 0..jitter points on top (seeded, reproducible).
+    Take-profits are limit fills at the level.
+    """
+
+    def __init__(self, spread_points=None, slippage_points=0.0, slippage_jitter=0.0, seed=0):
+        self.spread_points = spread_points
+        self.slippage_points = slippage_points
+        self.slippage_jitter = slippage_jitter
+        self.rng = np.random.default_rng(seed)
+
+    def spreads(self, rates):
+        """Spread in points for every bar."""
+        if self.spread_points is not None:
+            return np.full(len(rates), float(self.spread_points))
+        return rates["spread"].astype(np.float64)
+
+    def slippage(self):
+        if self.slippage_jitter > 0:
+            return self.slippage_points + self.rng.uniform(0, self.slippage_jitter)
+        return self.slippage_points
+
+    def entry_price(self, side, bid_open, spread, point):
+        if side > 0:
+            return bid_open + (spread + self.slippage()) * point
+        return bid_open - self.slippage() * point
+
+
+# ----------------------------------------------------------------------
+# Replay
+# ----------------------------------------------------------------------
+def strategy_signals(rates, strategy, config=None, warmup=50):
+    """
+    Replay bars through the strategy's live signal function.
+    Returns an int8 array: signals[i] is the signal seen when bar i-1 closed
+    (1 buy, -1 sell, 0 none), i.e. the one that would trade at bar i's open.
+    """
+    module_name, fn_name, engine_factory = STRATEGIES[strategy]
+    module = importlib.import_module(module_name)
+    fn = getattr(module, fn_name)
+    cfg = dict(module.CONFIG, **(config or {}))
+    engine = engine_factory(cfg)
+    signals = np.zeros(len(rates), dtype=np.int8)
+    start = max(warmup, 2)
+    for i in range(start, len(rates)):
+        # The engine only needs an overlap with what it has seen; a short tail keeps
+        # each call O(1) (a growing rates[:i] view gets copied by searchsorted).
+        window = rates[:i] if i == start else rates[i - _TAIL:i]
+        signal = fn(window, engine)
+        if signal == "buy":
+            signals[i] = 1
+        elif signal == "sell":
+            signals[i] = -1
+    return signals
+
+
+def _find_exit(rates, spreads, start, side, sl, tp, point, intrabar, chunk=32):
+    """(bar index, exit bid/ask, reason) of the first bar from start that reaches SL or TP."""
+    n = len(rates)
+    pos = start
+    while pos < n:
+        end = min(pos + chunk, n)
+        chunk *= 2  # most trades close within a few dozen bars; widen the scan for the rest
+        high = rates["high"][pos:end]
+        low = rates["low"][pos:end]
+        if side > 0:  # long exits on the bid
+            sl_hit = low <= sl
+            tp_hit = high >= tp
+        else:         # short exits on the ask
+            ask_offset = spreads[pos:end] * point
+            sl_hit = high + ask_offset >= sl
+            tp_hit = low + ask_offset <= tp
+        hit = sl_hit | tp_hit
+        if hit.any():
+            k = int(hit.argmax())
+            i = pos + k
+            opened = rates["open"][i] + (0.0 if side > 0 else spreads[i] * point)
+            if i > start and (opened - sl) * side <= 0:
+                return i, opened, "sl"   # gapped through the stop
+            if i > start and (opened - tp) * side >= 0:
+                return i, opened, "tp"
+            if sl_hit[k] and (not tp_hit[k] or intrabar == "sl_first"):
+                return i, sl, "sl"
+            return i, tp, "tp"
+        pos = end
+    last = n - 1
+    return last, rates["close"][last] + (0.0 if side > 0 else spreads[last] * point), "end"
+
+
+def simulate_trades(rates, signals, sl_tp, config, point, contract_size=100.0, fill=None,
+                    intrabar="sl_first"):
+    """
+    Turn per-bar signals into trades.
+    sl_tp(signal, price, point) -> (sl, tp) is the strategy's own SL/TP function.
+    config supplies lot, cooldown_seconds and max_spread_points as in the live CONFIG.
+    Returns a TRADE_DTYPE array.
+    """
+    if intrabar not in INTRABAR_MODES:
+        raise ValueError(f"intrabar must be one of {INTRABAR_MODES}")
+    fill = fill or FillModel()
+    spreads = fill.spreads(rates)
+    times = rates["time"]
+    lot = config["lot"]
+    cooldown = config.get("cooldown_seconds", 0)
+    max_spread = config.get("max_spread_points")
+    candidates = np.flatnonzero(signals)
+    trades = []
+    next_free = 0
+    last_entry = None
+    for i in candidates.tolist():
+        if i < next_free:
+            continue  # position still open: the live loop skips duplicate entries
+        if last_entry is not None and times[i] - last_entry < cooldown:
+            continue
+        if max_spread is not None and spreads[i] > max_spread:
+            continue
+        side = int(signals[i])
+        entry = fill.entry_price(side, rates["open"][i], spreads[i], point)
+        sl, tp = sl_tp("buy" if side > 0 else "sell", entry, point)
+        exit_i, exit_price, reason = _find_exit(rates, spreads, i, side, sl, tp, point, intrabar)
+        if reason == "sl":
+            exit_price -= side * fill.slippage() * point
+        diff = (exit_price - entry) * side
+        trades.append((times[i], times[exit_i], side, entry, exit_price, sl, tp, reason,
+                       diff / point, diff * lot * contract_size))
+        last_entry = times[i]
+        next_free = exit_i + 1
+    return np.array(trades, dtype=TRADE_DTYPE)
+
+
+def trade_metrics(trades):
+    """Trade count, win rate, net profit, profit factor, average trade and max drawdown."""
+    profit = trades["profit"]
+    wins = profit > 0
+    gross_win = float(profit[wins].sum())
+    gross_loss = float(-profit[~wins].sum())
+    equity = np.cumsum(profit)
+    drawdown = np.maximum.accumulate(np.concatenate([[0.0], equity]))[1:] - equity
+    return {
+        "trades": int(profit.size),
+        "win_rate": float(wins.mean()) if profit.size else 0.0,
+        "net_profit": float(profit.sum()),
+        "profit_factor": gross_win / gross_loss if gross_loss > 0 else float("inf"),
+        "avg_trade": float(profit.mean()) if profit.size else 0.0,
+        "max_drawdown": float(drawdown.max()) if profit.size else 0.0,
+    }
+
+
+class BacktestResult:
+    def __init__(self, strategy, trades, bars, elapsed):
+        self.strategy = strategy
+        self.trades = trades
+        self.bars = bars
+        self.elapsed = elapsed
+        self.equity = np.cumsum(trades["profit"])
+
+    def summary(self):
+        summary = {"strategy": self.strategy, "bars": self.bars}
+        summary.update(trade_metrics(self.trades))
+        summary["seconds"] = round(self.elapsed, 3)
+        return summary
+
+    def to_frame(self):
+        df = pd.DataFrame(self.trades)
+        for col in ("entry_time", "exit_time"):
+            df[col] = pd.to_datetime(df[col], unit="s")
+        return df
+
+
+def run_backtest(rates, strategy="moving_average_crossover", config=None, point=0.01,
+                 contract_size=100.0, fill=None, intrabar="sl_first", warmup=50):
+    """
+    Backtest one strategy on a rates array.
+    config overrides the strategy module's CONFIG (sl_points, tp_points, lot, ...).
+    """
+    t0 = time.perf_counter()
+    module = importlib.import_module(STRATEGIES[strategy][0])
+    cfg = dict(module.CONFIG, **(config or {}))
+    signals = strategy_signals(rates, strategy, cfg, warmup)
+    sl_tp = functools.partial(module.sl_tp_prices, config=cfg)
+    trades = simulate_trades(rates, signals, sl_tp, cfg, point, contract_size, fill, intrabar)
+    return BacktestResult(strategy, trades, len(rates), time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay MT5 rates through a strategy")
+    parser.add_argument("path", help="CSV or Parquet of MT5 rates")
+    parser.add_argument("--strategy", default="moving_average_crossover", choices=sorted(STRATEGIES))
+    parser.add_argument("--point", type=float, default=0.01)
+    parser.add_argument("--contract-size", type=float, default=100.0)
+    parser.add_argument("--spread", type=float, default=None, help="fixed spread in points (default: per-bar spread)")
+    parser.add_argument("--slippage", type=float, default=0.0, help="slippage in points on market fills")
+    parser.add_argument("--sl-points", type=float)
+    parser.add_argument("--tp-points", type=float)
+    parser.add_argument("--lot", type=float)
+    parser.add_argument("--intrabar", default="sl_first", choices=INTRABAR_MODES)
+    parser.add_argument("--trades-csv", help="write the trade list here")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+    overrides = {k: v for k, v in (("sl_points", args.sl_points), ("tp_points", args.tp_points),
+                                   ("lot", args.lot)) if v is not None}
+    rates = load_rates(args.path)
+    result = run_backtest(rates, args.strategy, overrides, args.point, args.contract_size,
+                          FillModel(args.spread, args.slippage), args.intrabar)
+    for key, value in result.summary().items():
+        print(f"{key:>14}: {value}")
+    if args.trades_csv:
+        os.makedirs(os.path.dirname(os.path.abspath(args.trades_csv)), exist_ok=True)
+        result.to_frame().to_csv(args.trades_csv, index=False)
+
+
+if __name__ == "__main__":
+    main()
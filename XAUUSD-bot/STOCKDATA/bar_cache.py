@@ -0,0 +1,266 @@
+"""
+bar_cache.py
+Local OHLC bar cache with delta fetches from MT5.
+
+Strategies used to pull the full 100-300 bar window with copy_rates_from_pos on
+every poll.  BarCache keeps one ring buffer per (symbol, timeframe); after the
+first load it only asks the terminal for a few of the newest bars, replaces the
+still-forming last bar and appends whatever closed since.  get() hands back a
+read-only view into the buffer (no copy, no DataFrame rebuild).
+
+With a bar_store.BarStore attached, closed bars are persisted as they arrive
+and a key seen for the first time is filled from the store's tail and then
+delta-fetched, instead of pulling the whole window from the terminal.  If
+the bars fetched start after the store's last bar (the bot was down), the gap
+is backfilled with copy_rates_range() before they are appended.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from STOCKDATA.scheduler import timeframe_seconds
+
+logger = logging.getLogger("bar_cache")
+
+# Layout of the structured arrays returned by MetaTrader5.copy_rates_*
+RATES_DTYPE = np.dtype([
+    ("time", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("tick_volume", "<u8"),
+    ("spread", "<i4"),
+    ("real_volume", "<u8"),
+])
+
+
+class BarRing:
+    """
+    Append-only bar buffer whose live window is always one contiguous slice.
+    Storage is twice the capacity; when the write position reaches the end the
+    newest `capacity` bars are moved into a fresh buffer, so appends are O(1)
+    amortised.  Closed bars already handed out are never overwritten: a wrap,
+    a clear() or a window replaced whole also start a fresh buffer, and only the
+    forming bar (replace_last) changes under an earlier view.
+    """
+
+    def __init__(self, capacity, dtype=RATES_DTYPE):
+        self.capacity = capacity
+        self._buf = np.zeros(capacity * 2, dtype=dtype)
+        self._start = 0
+        self._end = 0
+        self.loaded_for = 0  # bar count requested by the last full load
+        self.refreshed_at = 0.0
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def last_time(self):
+        return int(self._buf["time"][self._end - 1]) if self._end > self._start else None
+
+    def clear(self):
+        # Earlier views keep the old buffer; the next extend writes into a new one
+        self._buf = np.zeros_like(self._buf)
+        self._start = self._end = 0
+
+    def extend(self, records):
+        n = len(records)
+        if n == 0:
+            return
+        if n >= self.capacity:
+            self._buf = np.zeros_like(self._buf)
+            self._buf[:self.capacity] = records[n - self.capacity:]
+            self._start, self._end = 0, self.capacity
+            return
+        if self._end + n > self._buf.shape[0]:
+            keep = min(len(self), self.capacity - n)
+            fresh = np.zeros_like(self._buf)
+            fresh[:keep] = self._buf[self._end - keep:self._end]
+            self._buf, self._start, self._end = fresh, 0, keep
+        self._buf[self._end:self._end + n] = records
+        self._end += n
+        if len(self) > self.capacity:
+            self._start = self._end - self.capacity
+
+    def replace_last(self, record):
+        self._buf[self._end - 1] = record
+
+    def view(self, n=None):
+        n = len(self) if n is None else min(n, len(self))
+        v = self._buf[self._end - n:self._end]
+        v.flags.writeable = False
+        return v
+
+
+class BarCache:
+    """
+    Per-(symbol, timeframe) bar cache in front of copy_rates_from_pos.
+
+    mt5: the MetaTrader5 module (or anything exposing copy_rates_from_pos/last_error).
+    capacity: bars kept per key; requests for more fall back to a direct fetch.
+    probe: bars requested on a delta fetch; doubled until it overlaps the cache.
+    store: optional BarStore for warm starts and persisting closed bars.
+    """
+
+    def __init__(self, mt5, capacity=1000, probe=3, store=None):
+        self.mt5 = mt5
+        self.capacity = capacity
+        self.probe = max(probe, 2)
+        self.store = store
+        self._rings = {}
+        self._stored = {}  # key -> time of the newest bar handed to the store
+        self._lock = threading.Lock()
+        self.stats = {"full_fetches": 0, "delta_fetches": 0, "bars_fetched": 0, "store_loads": 0}
+
+    def _fetch(self, symbol, timeframe, count):
+        rates = self.mt5.copy_rates_from_pos(symbol, timeframe, 0, count)
+        if rates is None:
+            raise RuntimeError(f"Failed to get rates for {symbol}: {self.mt5.last_error()}")
+        self.stats["bars_fetched"] += len(rates)
+        return rates
+
+    def _warm_load(self, ring, symbol, timeframe, count):
+        """Fill the ring from the store and catch up with a delta fetch. False if the store can't cover it."""
+        try:
+            stored = self.store.tail(symbol, timeframe, max(count, min(self.capacity, count * 2)))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Bar store read for {symbol}/{timeframe} failed: {e}")
+            return False
+        if len(stored) < count:
+            return False
+        ring.clear()
+        ring.extend(stored)
+        # The stored tail is only current once the terminal's bars are seen to overlap it
+        if not self._delta(ring, symbol, timeframe, count, require_overlap=True):
+            ring.clear()
+            return False
+        ring.loaded_for = count
+        self.stats["store_loads"] += 1
+        return True
+
+    def _persist(self, key, ring):
+        """Hand the closed bars the store hasn't seen yet to it (the forming bar stays out)."""
+        if len(ring) < 2:
+            return
+        closed = ring.view()[:-1]
+        if self._stored.get(key) == int(closed["time"][-1]):
+            return
+        try:
+            if key not in self._stored:
+                self._backfill(key, int(closed["time"][0]))
+            self.store.append(key[0], key[1], closed)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Bar store write for {key[0]}/{key[1]} failed: {e}")
+            return
+        self._stored[key] = int(closed["time"][-1])
+
+    def _backfill(self, key, first):
+        """Store the bars between the store's last bar and first, which append() alone would never fill."""
+        symbol, timeframe = key
+        last = self.store.last_time(symbol, timeframe)
+        try:
+            seconds = timeframe_seconds(timeframe)
+        except ValueError:
+            return
+        if last is None or first - last <= seconds:
+            return
+        since = datetime.fromtimestamp(last + 1, timezone.utc)
+        until = datetime.fromtimestamp(first - 1, timezone.utc)
+        try:
+            gap = self.mt5.copy_rates_range(symbol, timeframe, since, until)
+        except Exception as e:
+            gap = None
+            logger.error(f"copy_rates_range({symbol}) for the store gap failed: {e}")
+        if gap is None:
+            logger.warning(f"Bar store for {symbol}/{timeframe} keeps a gap {since:%Y-%m-%d %H:%M} - "
+                           f"{until:%Y-%m-%d %H:%M}: the terminal returned no bars for it")
+            return
+        self.stats["bars_fetched"] += len(gap)
+        written = self.store.append(symbol, timeframe, gap)
+        if written:
+            logger.info(f"Backfilled {written} {symbol}/{timeframe} bars missing from the store")
+
+    def _full_load(self, ring, symbol, timeframe, count):
+        rates = self._fetch(symbol, timeframe, max(count, min(self.capacity, count * 2)))
+        self.stats["full_fetches"] += 1
+        ring.clear()
+        ring.extend(rates)
+        ring.loaded_for = count
+
+    def _delta(self, ring, symbol, timeframe, count, require_overlap=False):
+        """
+        Refresh the forming bar and append new ones. False if no overlap was found,
+        or, with require_overlap, if the terminal returned no bars to check against.
+        """
+        last_time = ring.last_time
+        k = self.probe
+        while True:
+            rates = self._fetch(symbol, timeframe, k)
+            self.stats["delta_fetches"] += 1
+            if len(rates) == 0:
+                return not require_overlap
+            times = rates["time"]
+            if times[0] <= last_time:
+                idx = int(np.searchsorted(times, last_time))
+                if idx < len(rates) and times[idx] == last_time:
+                    ring.replace_last(rates[idx])
+                    ring.extend(rates[idx + 1:])
+                    return True
+                return False
+            if k >= count:
+                return False
+            k = min(k * 2, count)
+
+    def get(self, symbol, timeframe, count, max_age=0.0):
+        """
+        Latest `count` bars (oldest first, forming bar last) as a read-only view of
+        the cache - same content as copy_rates_from_pos(symbol, timeframe, 0, count).
+        The view is live: it may change on the next get() for the same key.
+        max_age: serve without asking the terminal if the key was refreshed less
+        than this many seconds ago (lets many readers share one delta fetch).
+        """
+        if count > self.capacity:
+            return self._fetch(symbol, timeframe, count)
+        key = (symbol, timeframe)
+        with self._lock:
+            ring = self._rings.get(key)
+            if ring is None:
+                ring = BarRing(self.capacity)
+                self._rings[key] = ring
+            now = time.monotonic()
+            if len(ring) >= count and max_age > 0 and now - ring.refreshed_at < max_age:
+                return ring.view(count)
+            if len(ring) == 0:
+                if self.store is None or not self._warm_load(ring, symbol, timeframe, count):
+                    self._full_load(ring, symbol, timeframe, count)
+            elif not self._delta(ring, symbol, timeframe, count):
+                logger.info(f"Bar cache for {symbol}/{timeframe} lost overlap, reloading")
+                self._full_load(ring, symbol, timeframe, count)
+            if len(ring) < count and ring.loaded_for < count:
+                # Asked for more history than cached: reload at the larger size
+                self._full_load(ring, symbol, timeframe, count)
+            ring.refreshed_at = now
+            if self.store is not None:
+                self._persist(key, ring)
+            return ring.view(count)
+
+    def invalidate(self, symbol=None, timeframe=None):
+        """Drop cached bars for a symbol/timeframe (None matches everything)."""
+        with self._lock:
+            for key in list(self._rings):
+                if (symbol is None or key[0] == symbol) and (timeframe is None or key[1] == timeframe):
+                    del self._rings[key]
+
+
+def rates_to_frame(rates, utc=False):
+    """DataFrame with a datetime 'time' column, as the old get_rates/get_data returned."""
+    df = pd.DataFrame(rates)
+    df["time"] = pd.to_datetime(df["time"], unit="s", utc=utc)
+    return df
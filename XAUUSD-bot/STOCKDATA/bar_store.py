@@ -0,0 +1,302 @@
+"""
+bar_store.py
+Local append-only bar history, memory-mapped, with a time index.
+
+Nothing kept market history, so every backtest and every warmup went back
+to the terminal.  BarStore keeps one series per (symbol, timeframe):
+
+    <root>/<SYMBOL>/<TF>.bars   closed bars, raw RATES_DTYPE records (the copy_rates layout)
+    <root>/<SYMBOL>/<TF>.idx    their open times as a contiguous int64 column
+
+Both files only grow.  append() writes the bars newer than the last stored
+one (so handing it an overlapping window is fine), records first and index
+second.  It never inserts before the stored tail, so bars missing between the
+tail and the first bar handed over (downtime) have to be appended before it:
+BarCache backfills such a gap with copy_rates_range() first.  On open the
+shorter of the two decides the length, which drops a torn tail.  Reads
+memory-map the files read-only: range() / tail() binary search the time
+column and return a slice of the record map - no copy, no parsing, valid
+after later appends.  Appends hold an OS file lock on the
+series, so the bots, the hub and an import can share one store.
+
+    store = BarStore()                                  # data/bars next to the package
+    store.append("XAUUSD", mt5.TIMEFRAME_M5, rates[:-1])  # closed bars only
+    week = store.range("XAUUSD", "M5", start=1727740800, end=1728345600)
+    warm = store.tail("XAUUSD", "M5", 300)
+
+BarCache(mt5, store=store) persists what it fetches and warms cold keys from
+the store; backtest.load_rates() opens .bars files directly.  The bots get
+their store from store_from_env(): STOCKDATA_BAR_STORE=<dir> moves it, =off
+disables it, and it is only on when the backend in use is the real MetaTrader5
+module - simulated or offline bars never reach the live history.
+
+    python -m STOCKDATA.bar_store [--dir DIR] list
+    python -m STOCKDATA.bar_store import XAUUSD M5 XAUUSD_M5.csv
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from STOCKDATA.bar_cache import RATES_DTYPE
+
+logger = logging.getLogger("bar_store")
+
+_BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DIR = os.path.join(_BASE_DIR, "data", "bars")
+BARS_EXT = ".bars"
+INDEX_EXT = ".idx"
+STORE_ENV = "STOCKDATA_BAR_STORE"
+_TIME_DTYPE = np.dtype("<i8")
+_HOUR_FLAG, _WEEK_FLAG, _MONTH_FLAG = 0x4000, 0x8000, 0xC000
+
+
+def timeframe_name(timeframe):
+    """MT5 timeframe constant (or name) -> 'M5', 'H1', 'D1', 'W1', 'MN1'."""
+    if isinstance(timeframe, str):
+        return timeframe.upper().replace("TIMEFRAME_", "")
+    tf = int(timeframe)
+    if tf & _MONTH_FLAG == _MONTH_FLAG:
+        return f"MN{tf & ~_MONTH_FLAG}"
+    if tf & _WEEK_FLAG:
+        return f"W{tf & ~_WEEK_FLAG}"
+    if tf & _HOUR_FLAG:
+        hours = tf & ~_HOUR_FLAG
+        return "D1" if hours == 24 else f"H{hours}"
+    return f"M{tf}"
+
+
+@contextlib.contextmanager
+def _file_lock(path):
+    """Exclusive cross-process lock on path (created if missing)."""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def open_bars(path):
+    """Read-only memory map of a .bars file (length from its .idx when present)."""
+    size = os.path.getsize(path) // RATES_DTYPE.itemsize
+    index = path[:-len(BARS_EXT)] + INDEX_EXT
+    if os.path.exists(index):
+        size = min(size, os.path.getsize(index) // _TIME_DTYPE.itemsize)
+    if size == 0:
+        return np.zeros(0, dtype=RATES_DTYPE)
+    return np.memmap(path, dtype=RATES_DTYPE, mode="r", shape=(size,))
+
+
+class _Series:
+    """Files and current maps of one (symbol, timeframe)."""
+
+    def __init__(self, bars_path, index_path):
+        self.bars_path = bars_path
+        self.index_path = index_path
+        self.lock_path = bars_path + ".lock"
+        self.length = 0
+        self.bars = np.zeros(0, dtype=RATES_DTYPE)
+        self.times = np.zeros(0, dtype=_TIME_DTYPE)
+        self.lock = threading.Lock()
+
+    def disk_length(self):
+        if not os.path.exists(self.bars_path) or not os.path.exists(self.index_path):
+            return 0
+        return min(os.path.getsize(self.bars_path) // RATES_DTYPE.itemsize,
+                   os.path.getsize(self.index_path) // _TIME_DTYPE.itemsize)
+
+    def remap(self):
+        """Map whatever is on disk now (another process may have appended)."""
+        length = self.disk_length()
+        if length != self.length:
+            if length == 0:
+                self.bars = np.zeros(0, dtype=RATES_DTYPE)
+                self.times = np.zeros(0, dtype=_TIME_DTYPE)
+            else:
+                self.bars = np.memmap(self.bars_path, dtype=RATES_DTYPE, mode="r", shape=(length,))
+                self.times = np.memmap(self.index_path, dtype=_TIME_DTYPE, mode="r", shape=(length,))
+            self.length = length
+        return self
+
+
+class BarStore:
+    """
+    root: directory holding <SYMBOL>/<TF>.bars|.idx (created on first append).
+    fsync: fsync both files after every append.
+    """
+
+    def __init__(self, root=DEFAULT_DIR, fsync=False):
+        self.root = root
+        self.fsync = fsync
+        self._series = {}
+        self._lock = threading.Lock()
+        self.stats = {"appends": 0, "bars_written": 0, "reads": 0}
+
+    def _get(self, symbol, timeframe):
+        key = (symbol, timeframe_name(timeframe))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                base = os.path.join(self.root, key[0], key[1])
+                series = self._series[key] = _Series(base + BARS_EXT, base + INDEX_EXT)
+                self._repair(series)
+            return series
+
+    @staticmethod
+    def _repair(series):
+        """Cut both files to the length they agree on (a crash between the two writes)."""
+        length = series.disk_length()
+        for path, itemsize in ((series.bars_path, RATES_DTYPE.itemsize), (series.index_path, _TIME_DTYPE.itemsize)):
+            if os.path.exists(path) and os.path.getsize(path) != length * itemsize:
+                logger.warning(f"Truncating torn tail of {path} to {length} bars")
+                with open(path, "r+b") as f:
+                    f.truncate(length * itemsize)
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+    def append(self, symbol, timeframe, rates):
+        """Store the closed bars of rates newer than the last stored one; returns how many were written."""
+        if rates is None or not len(rates):
+            return 0
+        series = self._get(symbol, timeframe)
+        os.makedirs(os.path.dirname(series.bars_path), exist_ok=True)
+        with series.lock, _file_lock(series.lock_path):
+            series.remap()
+            last = int(series.times[-1]) if series.length else None
+            times = rates["time"]
+            new = rates if last is None else rates[int(np.searchsorted(times, last, side="right")):]
+            if not len(new):
+                return 0
+            new = np.ascontiguousarray(new, dtype=RATES_DTYPE)
+            if len(new) > 1 and np.any(np.diff(new["time"]) <= 0):
+                raise ValueError(f"{symbol}/{timeframe_name(timeframe)} bars are not in strictly increasing time order")
+            for path, data in ((series.bars_path, new), (series.index_path, new["time"].astype(_TIME_DTYPE))):
+                with open(path, "ab") as f:
+                    f.write(data.tobytes())
+                    if self.fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+            series.remap()
+        self.stats["appends"] += 1
+        self.stats["bars_written"] += len(new)
+        return len(new)
+
+    # ------------------------------------------------------------------
+    # Reading (zero-copy slices of the read-only maps)
+    # ------------------------------------------------------------------
+    def _mapped(self, symbol, timeframe):
+        series = self._get(symbol, timeframe)
+        with series.lock:
+            series.remap()
+            self.stats["reads"] += 1
+            return series.bars, series.times
+
+    def range(self, symbol, timeframe, start=None, end=None):
+        """Bars with start <= time <= end (epoch seconds; None is open-ended)."""
+        bars, times = self._mapped(symbol, timeframe)
+        lo = 0 if start is None else int(np.searchsorted(times, start, side="left"))
+        hi = len(times) if end is None else int(np.searchsorted(times, end, side="right"))
+        return bars[lo:hi]
+
+    def tail(self, symbol, timeframe, count, end=None):
+        """The last count bars (at or before end, if given)."""
+        bars, times = self._mapped(symbol, timeframe)
+        hi = len(times) if end is None else int(np.searchsorted(times, end, side="right"))
+        return bars[max(hi - count, 0):hi]
+
+    def last_time(self, symbol, timeframe):
+        _, times = self._mapped(symbol, timeframe)
+        return int(times[-1]) if len(times) else None
+
+    def __len__(self):
+        return len(self.keys())
+
+    def keys(self):
+        """(symbol, timeframe name) of every series on disk."""
+        found = []
+        if not os.path.isdir(self.root):
+            return found
+        for symbol in sorted(os.listdir(self.root)):
+            folder = os.path.join(self.root, symbol)
+            if os.path.isdir(folder):
+                found.extend((symbol, name[:-len(BARS_EXT)]) for name in sorted(os.listdir(folder))
+                             if name.endswith(BARS_EXT))
+        return found
+
+    def info(self):
+        """{"SYMBOL/TF": {"bars", "first", "last"}} for every series."""
+        out = {}
+        for symbol, tf in self.keys():
+            bars, times = self._mapped(symbol, tf)
+            out[f"{symbol}/{tf}"] = {"bars": len(times), "first": int(times[0]) if len(times) else None,
+                                     "last": int(times[-1]) if len(times) else None}
+        return out
+
+
+def store_from_env(backend=None):
+    """
+    BarStore at $STOCKDATA_BAR_STORE (default DEFAULT_DIR); None if "off" or if
+    backend (default: the process backend) is not the MetaTrader5 terminal.
+    """
+    from STOCKDATA.broker import get_backend, is_terminal
+
+    value = os.environ.get(STORE_ENV, DEFAULT_DIR)
+    if value.lower() in ("", "off", "0") or not is_terminal(backend if backend is not None else get_backend()):
+        return None
+    return BarStore(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local bar history store")
+    parser.add_argument("--dir", default=os.environ.get(STORE_ENV, DEFAULT_DIR))
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="series with bar counts and time span")
+    load = sub.add_parser("import", help="append bars from a CSV/Parquet rates export")
+    load.add_argument("symbol")
+    load.add_argument("timeframe", help="M5, H1, ...")
+    load.add_argument("path")
+    dump = sub.add_parser("export", help="write a time range to CSV")
+    dump.add_argument("symbol")
+    dump.add_argument("timeframe")
+    dump.add_argument("path")
+    dump.add_argument("--start", type=int)
+    dump.add_argument("--end", type=int)
+    args = parser.parse_args()
+
+    store = BarStore(args.dir)
+    if args.command == "import":
+        from STOCKDATA.backtest import load_rates
+        rates = load_rates(args.path)
+        print(json.dumps({"read": len(rates), "written": store.append(args.symbol, args.timeframe, rates)}))
+    elif args.command == "export":
+        import pandas as pd
+        bars = store.range(args.symbol, args.timeframe, args.start, args.end)
+        pd.DataFrame(np.asarray(bars)).to_csv(args.path, index=False)
+        print(json.dumps({"written": len(bars)}))
+    else:
+        print(json.dumps(store.info(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+benchmarks.py
+Per-cycle latency and throughput of the strategy hot paths at 1, 9 and 50 symbols.
+
+Every benchmark runs against simulator.SimulatedMT5 (installed with
+broker.set_backend before the strategy modules are imported), replaying
+seeded synthetic M5 bars, so runs are deterministic and need no terminal.  A
+cycle advances the simulator one bar (not timed) and then does, for every
+symbol, what the live loop does on a bar close:
+
+    indicators.calc_ema        calc_ema(close, 9) and (21) over the lookback
+    indicators.calc_macd       calc_macd(close) over the lookback
+    indicators.ema_engine      EMACrossEngine.update + crossover with the new bar
+    indicators.macd_engine     MACDEngine.update + crossover with the new bar
+    check_for_signal           BAR_CACHE.get + check_for_signal with a per-symbol engine
+    check_macd_signal          BAR_CACHE.get + check_macd_signal with a per-symbol engine
+    run_strategy               main.run_strategy (fetch, both engines, orders on confluence)
+
+Reported per benchmark and symbol count: min / median / p95 / mean cycle time
+in ms and throughput in symbol-evaluations per second.  --json writes the
+results; --compare fails (exit 1) if a median got slower than the baseline by
+more than --tolerance.
+
+    python -m STOCKDATA.benchmarks --symbols 1 9 50 --cycles 200 --json bench.json
+    python -m STOCKDATA.benchmarks --compare bench.json --tolerance 0.25
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+from STOCKDATA.broker import set_backend
+from STOCKDATA.simulator import SimulatedMT5, synthetic_bars
+
+logger = logging.getLogger("benchmarks")
+
+BENCHMARKS = ("indicators.calc_ema", "indicators.calc_macd", "indicators.ema_engine", "indicators.macd_engine",
+              "check_for_signal", "check_macd_signal", "run_strategy")
+SYMBOL_COUNTS = (1, 9, 50)
+LOOKBACK = 300
+
+
+def make_simulator(n_symbols, cycles, seed=0):
+    """SimulatedMT5 with n_symbols synthetic symbols and enough bars for cycles steps."""
+    n = LOOKBACK + cycles + 2
+    bars = {f"SYM{i:02d}": synthetic_bars(n, seed=seed + i, start_price=1000.0 + 50 * i) for i in range(n_symbols)}
+    return SimulatedMT5(bars, start=LOOKBACK + 1, seed=seed)
+
+
+def _stats(samples, n_symbols):
+    ms = np.asarray(samples) * 1000.0
+    total = float(np.sum(samples))
+    return {"symbols": n_symbols, "cycles": len(samples), "min_ms": round(float(ms.min()), 4),
+            "median_ms": round(float(np.median(ms)), 4), "p95_ms": round(float(np.percentile(ms, 95)), 4),
+            "mean_ms": round(float(ms.mean()), 4),
+            "throughput": round(n_symbols * len(samples) / total, 1) if total else None}
+
+
+class Bench:
+    """One benchmark over one simulator: setup(symbol) -> state, run(symbol, state) timed per cycle."""
+
+    def __init__(self, sim, modules):
+        self.sim = sim
+        self.main, self.mac, self.macd = modules
+        self.symbols = list(sim.bars)
+        self.timeframe = sim.timeframe
+
+    def run(self, name, cycles):
+        setup, body = getattr(self, "setup_" + name.split(".")[-1]), getattr(self, "run_" + name.split(".")[-1])
+        states = {s: setup(s) for s in self.symbols}
+        samples = []
+        for _ in range(cycles):
+            if not self.sim.step():
+                break
+            inputs = {s: self.prepare(name, s) for s in self.symbols}
+            start = time.perf_counter()
+            for symbol in self.symbols:
+                body(symbol, states[symbol], inputs[symbol])
+            samples.append(time.perf_counter() - start)
+        return samples
+
+    def prepare(self, name, symbol):
+        """Untimed per-cycle input: bars for the pure indicator benchmarks, nothing for the fetching ones."""
+        if name.startswith("indicators."):
+            return self.sim.copy_rates_from_pos(symbol, self.timeframe, 0, LOOKBACK)
+        return None
+
+    # --- indicators ---
+    def setup_calc_ema(self, symbol):
+        return None
+
+    def run_calc_ema(self, symbol, state, rates):
+        close = self.mac.rates_to_frame(rates)["close"]
+        self.mac.calc_ema(close, self.mac.CONFIG["ema_fast"])
+        self.mac.calc_ema(close, self.mac.CONFIG["ema_slow"])
+
+    def setup_calc_macd(self, symbol):
+        return None
+
+    def run_calc_macd(self, symbol, state, rates):
+        close = self.macd.rates_to_frame(rates)["close"]
+        self.macd.calc_macd(close, self.macd.CONFIG["macd_fast"], self.macd.CONFIG["macd_slow"],
+                            self.macd.CONFIG["macd_signal"])
+
+    def setup_ema_engine(self, symbol):
+        return self.mac.EMACrossEngine(self.mac.CONFIG["ema_fast"], self.mac.CONFIG["ema_slow"])
+
+    def run_ema_engine(self, symbol, engine, rates):
+        engine.update(rates["time"][:-1], rates["close"][:-1])
+        engine.crossover(forming_close=rates["close"][-1])
+
+    def setup_macd_engine(self, symbol):
+        return self.macd.MACDEngine(self.macd.CONFIG["macd_fast"], self.macd.CONFIG["macd_slow"],
+                                    self.macd.CONFIG["macd_signal"])
+
+    run_macd_engine = run_ema_engine
+
+    # --- strategy entry points (bar fetch included, as in the live loops) ---
+    setup_check_for_signal = setup_ema_engine
+    setup_check_macd_signal = setup_macd_engine
+
+    def run_check_for_signal(self, symbol, engine, _):
+        rates = self.mac.BAR_CACHE.get(symbol, self.timeframe, LOOKBACK)
+        self.mac.check_for_signal(rates[:-1], engine)
+
+    def run_check_macd_signal(self, symbol, engine, _):
+        rates = self.macd.BAR_CACHE.get(symbol, self.timeframe, LOOKBACK)
+        self.macd.check_macd_signal(rates[:-1], engine)
+
+    def setup_run_strategy(self, symbol):
+        return (self.main.EMACrossEngine(9, 21), self.main.MACDEngine(12, 26, 9))
+
+    def run_run_strategy(self, symbol, engines, _):
+        # run_strategy trades CONFIG["symbol"] with the module-level engines; swap them per symbol
+        self.main.CONFIG["symbol"] = symbol
+        self.main.EMA_ENGINE, self.main.MACD_ENGINE = engines
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.main.run_strategy()
+
+
+def _import_modules():
+    from STOCKDATA import main
+    from STOCKDATA.modules import macd, moving_average_crossover
+    return main, moving_average_crossover, macd
+
+
+def run_benchmarks(symbol_counts=SYMBOL_COUNTS, cycles=200, names=BENCHMARKS, seed=0):
+    """{name: {str(n_symbols): stats}}; each (name, n) gets a fresh simulator and fresh caches."""
+    results = {}
+    for n_symbols in symbol_counts:
+        for name in names:
+            sim = set_backend(make_simulator(n_symbols, cycles, seed))
+            modules = _import_modules()
+            # Modules bound their mt5 at first import; point them (and their caches) at this simulator
+            for module in modules:
+                module.mt5 = sim
+                module.BAR_CACHE = module.BarCache(sim)
+                module.SYMBOLS = module.SymbolCache(sim)
+                module.ROUTER = module.OrderRouter(sim, symbol_cache=module.SYMBOLS, budget=module.ROUTER.budget)
+            samples = Bench(sim, modules).run(name, cycles)
+            results.setdefault(name, {})[str(n_symbols)] = _stats(samples, n_symbols)
+            logger.info(f"{name} x{n_symbols}: {results[name][str(n_symbols)]}")
+    return results
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Regressions as (name, n_symbols, baseline median, new median) where the median grew beyond tolerance."""
+    regressions = []
+    for name, by_count in results.items():
+        for count, stats in by_count.items():
+            before = baseline.get(name, {}).get(count)
+            if before and stats["median_ms"] > before["median_ms"] * (1 + tolerance):
+                regressions.append((name, int(count), before["median_ms"], stats["median_ms"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark strategy hot paths against the simulator")
+    parser.add_argument("--symbols", type=int, nargs="+", default=list(SYMBOL_COUNTS))
+    parser.add_argument("--cycles", type=int, default=200)
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results here")
+    parser.add_argument("--compare", help="baseline JSON from an earlier --json run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed median slowdown (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+    results = run_benchmarks(args.symbols, args.cycles, args.only, args.seed)
+    print(f"{'benchmark':<24}{'symbols':>8}{'min ms':>10}{'median ms':>11}{'p95 ms':>10}{'evals/s':>12}")
+    for name, by_count in results.items():
+        for count, s in by_count.items():
+            print(f"{name:<24}{count:>8}{s['min_ms']:>10.3f}{s['median_ms']:>11.3f}{s['p95_ms']:>10.3f}"
+                  f"{s['throughput']:>12.1f}")
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name, count, before, after in regressions:
+            print(f"REGRESSION {name} x{count}: median {before:.3f} ms -> {after:.3f} ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
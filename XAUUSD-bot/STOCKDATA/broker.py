@@ -0,0 +1,89 @@
+"""
+broker.py
+Pluggable broker backend: the object every module uses as `mt5`.
+
+Modules used to `import MetaTrader5 as mt5` at the top, so nothing could be
+imported (let alone timed) where the package is not installed.  A backend is
+anything with the MetaTrader5 module API - the calls in BACKEND_CALLS plus its
+constants.  get_backend() picks one per process:
+
+    STOCKDATA_BACKEND=mt5      MetaTrader5, or offline_mt5 if it is not installed (default)
+    STOCKDATA_BACKEND=offline  offline_mt5 (constants only, terminal calls fail)
+    STOCKDATA_BACKEND=sim      simulator.SimulatedMT5 replaying STOCKDATA_SIM_DATA
+                               (a bar CSV/Parquet, or a directory of <SYMBOL>.csv files)
+
+Benchmarks and tests call set_backend(SimulatedMT5(...)) before importing the
+strategy modules.  hub_from_env() still wraps whatever is chosen here.
+"""
+
+import logging
+import os
+import threading
+
+logger = logging.getLogger("broker")
+
+BACKEND_ENV = "STOCKDATA_BACKEND"
+SIM_DATA_ENV = "STOCKDATA_SIM_DATA"
+
+# Calls the bot relies on; every backend provides them
+BACKEND_CALLS = (
+    "initialize", "login", "shutdown", "last_error", "terminal_info", "account_info",
+    "symbol_info", "symbol_info_tick", "symbol_select", "symbols_get",
+    "copy_rates_from", "copy_rates_from_pos", "copy_rates_range",
+    "positions_get", "orders_get", "history_deals_get", "order_send",
+)
+
+_backend = None
+_lock = threading.Lock()
+
+
+def check_backend(backend):
+    """Raise TypeError if backend lacks one of BACKEND_CALLS."""
+    missing = [name for name in BACKEND_CALLS if not callable(getattr(backend, name, None))]
+    if missing:
+        raise TypeError(f"{backend!r} is not a broker backend, missing {missing}")
+    return backend
+
+
+def load_backend(name=None):
+    """Build the backend called name (default: $STOCKDATA_BACKEND, else "mt5")."""
+    name = (name or os.environ.get(BACKEND_ENV) or "mt5").lower()
+    if name == "mt5":
+        try:
+            import MetaTrader5 as mt5
+        except ImportError:  # Linux / CI: constants only, terminal calls fail
+            from STOCKDATA import offline_mt5 as mt5
+        return mt5
+    if name == "offline":
+        from STOCKDATA import offline_mt5
+        return offline_mt5
+    if name == "sim":
+        from STOCKDATA.simulator import SimulatedMT5
+        path = os.environ.get(SIM_DATA_ENV)
+        if not path:
+            raise RuntimeError(f"{BACKEND_ENV}=sim needs {SIM_DATA_ENV} (bar file or directory)")
+        return SimulatedMT5.from_path(path)
+    raise ValueError(f"Unknown broker backend {name!r} (mt5, offline or sim)")
+
+
+def is_terminal(backend):
+    """True for the real MetaTrader5 module (not offline_mt5, a simulator or a stub)."""
+    return getattr(backend, "__name__", None) == "MetaTrader5"
+
+
+def get_backend():
+    """The process-wide backend (loaded on first use)."""
+    global _backend
+    with _lock:
+        if _backend is None:
+            _backend = check_backend(load_backend())
+            logger.debug(f"Broker backend: {getattr(_backend, '__name__', type(_backend).__name__)}")
+        return _backend
+
+
+def set_backend(backend):
+    """Install backend for this process; modules imported afterwards use it."""
+    global _backend
+    with _lock:
+        _backend = check_backend(backend)
+    return backend
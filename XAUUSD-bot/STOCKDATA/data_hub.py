@@ -0,0 +1,456 @@
+"""
+data_hub.py
+Shared market-data hub: one process owns the MT5 session, strategies talk to it.
+
+Every strategy script (macd.py, moving_average_crossover.py, main.py) used to run
+its own mt5.initialize() and poll symbol_info / symbol_info_tick / account_info /
+positions_get for the same feed.  The hub:
+
+- serves those calls from short-lived snapshots (ticks, account, positions) and
+  from a BarCache (bars), so terminal load does not grow with the number of
+  strategy processes;
+- publishes new closed bars, tick changes and account/position snapshots to
+  processes that subscribe;
+- forwards order_send and anything else unchanged, serialised on one lock.
+
+Clients use HubClient, which looks like the MetaTrader5 module (constants and
+functions), so a strategy only swaps its `mt5` object:
+
+    hub:       STOCKDATA_HUB_KEY=<secret> python -m STOCKDATA.data_hub            (needs the terminal)
+    strategy:  STOCKDATA_HUB_KEY=<secret> STOCKDATA_HUB=127.0.0.1:6150 python -m STOCKDATA.modules.macd
+
+Hub and clients authenticate with STOCKDATA_HUB_KEY; there is no default key.
+Any object with the MetaTrader5 API can be passed as `mt5`.  --selfcheck runs
+a hub on simulator.SimulatedMT5 with a few clients, compares their answers
+with direct calls and reports the terminal calls made:
+
+    python -m STOCKDATA.data_hub --selfcheck --clients 3
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+from types import SimpleNamespace
+
+from STOCKDATA.bar_cache import BarCache
+from STOCKDATA.symbol_cache import load_symbols
+
+logger = logging.getLogger("data_hub")
+
+DEFAULT_ADDRESS = ("127.0.0.1", 6150)
+AUTHKEY_ENV = "STOCKDATA_HUB_KEY"
+
+
+def hub_authkey():
+    """Shared secret from $STOCKDATA_HUB_KEY; RuntimeError if it is not set."""
+    value = os.environ.get(AUTHKEY_ENV)
+    if not value:
+        raise RuntimeError(f"{AUTHKEY_ENV} must be set to the hub's shared secret")
+    return value.encode()
+
+
+class Record(SimpleNamespace):
+    """Picklable stand-in for the MT5 named tuples (attribute access + _asdict())."""
+
+    def _asdict(self):
+        return dict(vars(self))
+
+
+def to_record(obj):
+    """Convert MT5 result objects (and tuples of them) into picklable Records."""
+    if obj is None:
+        return None
+    if hasattr(obj, "_asdict"):
+        return Record(**{k: to_record(v) for k, v in obj._asdict().items()})
+    if isinstance(obj, tuple):
+        return tuple(to_record(o) for o in obj)
+    return obj
+
+
+def parse_address(value):
+    host, _, port = value.rpartition(":")
+    return (host or DEFAULT_ADDRESS[0], int(port))
+
+
+class _Snapshot:
+    """Value refreshed from the terminal at most once per ttl seconds."""
+
+    __slots__ = ("value", "at")
+
+    def __init__(self):
+        self.value = None
+        self.at = 0.0
+
+
+class DataHub:
+    """
+    mt5: MetaTrader5 module (or a stand-in with the same API).
+    authkey: connection secret (default: hub_authkey()).
+    tick_ttl / account_ttl / positions_ttl / bar_ttl: max age of a served snapshot, seconds.
+    poll_interval: how often subscribed topics are refreshed and published.
+    bar_store: optional BarStore the bar cache persists to and warms from.
+    """
+
+    SNAPSHOT_CALLS = ("symbol_info_tick", "symbol_info", "account_info", "positions_get", "orders_get")
+    LOCAL_CALLS = ("initialize", "login", "shutdown")
+
+    def __init__(self, mt5, address=DEFAULT_ADDRESS, authkey=None,
+                 tick_ttl=0.25, account_ttl=1.0, positions_ttl=0.5, symbol_info_ttl=60.0,
+                 bar_ttl=0.25, poll_interval=0.5, bar_capacity=1000, bar_store=None):
+        self.mt5 = mt5
+        self.address = address
+        self.authkey = authkey if authkey is not None else hub_authkey()
+        self.ttl = {
+            "symbol_info_tick": tick_ttl,
+            "symbol_info": symbol_info_ttl,
+            "account_info": account_ttl,
+            "positions_get": positions_ttl,
+            "orders_get": positions_ttl,
+        }
+        self.bar_ttl = bar_ttl
+        self.poll_interval = poll_interval
+        self.bars = BarCache(mt5, capacity=bar_capacity, store=bar_store)
+        self.constants = {k: getattr(mt5, k) for k in dir(mt5)
+                          if k.isupper() and isinstance(getattr(mt5, k), (int, float, str))}
+        self._mt5_lock = threading.Lock()  # the MT5 API is not thread safe
+        self._snapshots = {}
+        self._snap_lock = threading.Lock()
+        self._subscribers = {}  # conn -> set of topics
+        self._sub_lock = threading.Lock()
+        self._published = {}
+        self._listener = None
+        self._stop = threading.Event()
+        self.stats = {"requests": 0, "terminal_calls": 0}
+
+    # ------------------------------------------------------------------
+    # Terminal access
+    # ------------------------------------------------------------------
+    def _terminal(self, name, *args, **kwargs):
+        with self._mt5_lock:
+            self.stats["terminal_calls"] += 1
+            return getattr(self.mt5, name)(*args, **kwargs)
+
+    def _snapshot(self, name, args, kwargs):
+        key = (name, args, tuple(sorted(kwargs.items())))
+        with self._snap_lock:
+            snap = self._snapshots.get(key)
+            if snap is None:
+                snap = self._snapshots[key] = _Snapshot()
+        now = time.monotonic()
+        if snap.value is None or now - snap.at > self.ttl[name]:
+            snap.value = to_record(self._terminal(name, *args, **kwargs))
+            snap.at = now
+        return snap.value
+
+    def call(self, name, args=(), kwargs=None):
+        """Execute one client request."""
+        kwargs = kwargs or {}
+        self.stats["requests"] += 1
+        if name in self.LOCAL_CALLS:
+            return True  # the hub owns the session
+        if name == "copy_rates_from_pos" and len(args) >= 4 and args[2] == 0:
+            with self._mt5_lock:
+                return self.bars.get(args[0], args[1], args[3], max_age=self.bar_ttl).copy()
+        if name in self.SNAPSHOT_CALLS:
+            return self._snapshot(name, tuple(args), kwargs)
+        if name.startswith("_") or not callable(getattr(self.mt5, name, None)):
+            raise AttributeError(f"MT5 has no function {name}")
+        return to_record(self._terminal(name, *args, **kwargs))
+
+    # ------------------------------------------------------------------
+    # Publishing
+    # ------------------------------------------------------------------
+    def _topic_value(self, topic):
+        kind = topic[0]
+        if kind == "bar":
+            rates = self.call("copy_rates_from_pos", (topic[1], topic[2], 0, 2))
+            return rates[:1] if len(rates) == 2 else None  # last closed bar
+        if kind == "tick":
+            return self._snapshot("symbol_info_tick", (topic[1],), {})
+        if kind == "account":
+            return self._snapshot("account_info", (), {})
+        if kind == "positions":
+            return self._snapshot("positions_get", (), {})
+        raise ValueError(f"Unknown topic {topic}")
+
+    @staticmethod
+    def _fingerprint(value):
+        if value is None:
+            return None
+        if hasattr(value, "tobytes"):
+            return value.tobytes()
+        return repr(value)
+
+    def publish_once(self):
+        """Refresh every subscribed topic once and push the ones that changed."""
+        with self._sub_lock:
+            topics = set().union(*self._subscribers.values()) if self._subscribers else set()
+        for topic in topics:
+            try:
+                value = self._topic_value(topic)
+            except Exception as e:
+                logger.error(f"Refreshing {topic} failed: {e}")
+                continue
+            fp = self._fingerprint(value)
+            if value is None or self._published.get(topic) == fp:
+                continue
+            self._published[topic] = fp
+            self._broadcast(topic, value)
+
+    def _broadcast(self, topic, value):
+        with self._sub_lock:
+            targets = [c for c, t in self._subscribers.items() if topic in t]
+        for conn in targets:
+            try:
+                conn.send(("event", topic, value))
+            except (OSError, EOFError):
+                self._drop_subscriber(conn)
+
+    def _drop_subscriber(self, conn):
+        with self._sub_lock:
+            self._subscribers.pop(conn, None)
+
+    def _poll_loop(self):
+        while not self._stop.is_set():
+            self.publish_once()
+            self._stop.wait(self.poll_interval)
+
+    # ------------------------------------------------------------------
+    # Serving
+    # ------------------------------------------------------------------
+    def _handle(self, conn):
+        try:
+            conn.send(("hello", self.constants))
+            while not self._stop.is_set():
+                try:
+                    msg = conn.recv()
+                except (EOFError, OSError):
+                    break
+                kind = msg[0]
+                if kind == "subscribe":
+                    with self._sub_lock:
+                        self._subscribers.setdefault(conn, set()).update(msg[1])
+                    # new subscribers get the current state straight away
+                    for topic in msg[1]:
+                        self._published.pop(topic, None)
+                    continue
+                if kind == "unsubscribe":
+                    self._drop_subscriber(conn)
+                    continue
+                _, name, args, kwargs = msg
+                try:
+                    reply = ("ok", self.call(name, args, kwargs))
+                except Exception as e:
+                    reply = ("err", f"{type(e).__name__}: {e}")
+                conn.send(reply)
+        finally:
+            self._drop_subscriber(conn)
+            conn.close()
+
+    def serve_forever(self, initialize=True):
+        """Own the MT5 session and serve clients until stop() is called."""
+        if initialize and not self.mt5.initialize():
+            raise RuntimeError(f"MT5 initialize() failed, code={self.mt5.last_error()}")
+        self._listener = Listener(self.address, authkey=self.authkey)
+        self.address = self._listener.address
+        logger.info(f"Data hub listening on {self.address}")
+        threading.Thread(target=self._poll_loop, name="hub-poll", daemon=True).start()
+        try:
+            while not self._stop.is_set():
+                try:
+                    conn = self._listener.accept()
+                except (OSError, EOFError):
+                    if self._stop.is_set():
+                        break
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        finally:
+            if initialize:
+                self.mt5.shutdown()
+
+    def start(self, initialize=True):
+        """serve_forever() on a background thread; returns once listening."""
+        t = threading.Thread(target=self.serve_forever, args=(initialize,), name="hub", daemon=True)
+        t.start()
+        while self._listener is None and t.is_alive():
+            time.sleep(0.01)
+        return t
+
+    def stop(self):
+        self._stop.set()
+        if self._listener is not None:
+            try:
+                # unblock accept()
+                Client(self.address, authkey=self.authkey).close()
+            except OSError:
+                pass
+            self._listener.close()
+
+
+class HubClient:
+    """
+    MetaTrader5-like facade over a hub connection. Constants come from the hub,
+    every other attribute is a remote call (initialize/shutdown are no-ops on the
+    hub side).
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None):
+        authkey = authkey if authkey is not None else hub_authkey()
+        self._address = address
+        self._authkey = authkey
+        self._conn = Client(address, authkey=authkey)
+        self._lock = threading.Lock()
+        _, self._constants = self._conn.recv()
+        self._last_error = (1, "Success")
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        constants = self.__dict__.get("_constants", {})
+        if name in constants:
+            return constants[name]
+
+        def remote(*args, **kwargs):
+            return self._call(name, args, kwargs)
+
+        remote.__name__ = name
+        return remote
+
+    def _call(self, name, args, kwargs):
+        with self._lock:
+            self._conn.send(("call", name, args, kwargs))
+            status, payload = self._conn.recv()
+        if status == "err":
+            self._last_error = (-1, payload)
+            raise RuntimeError(f"Hub call {name} failed: {payload}")
+        return payload
+
+    def last_error(self):
+        try:
+            return self._call("last_error", (), {})
+        except RuntimeError:
+            return self._last_error
+
+    def shutdown(self):
+        self._conn.close()
+        return True
+
+    def subscribe(self, topics):
+        """
+        Open a dedicated connection receiving pushed updates. topics is a list of
+        ("bar", symbol, timeframe), ("tick", symbol), ("account",), ("positions",).
+        Returns a Subscription; iterate it or call next_event(timeout).
+        """
+        return Subscription(self._address, self._authkey, topics)
+
+
+class Subscription:
+    def __init__(self, address, authkey, topics):
+        self._conn = Client(address, authkey=authkey)
+        self._conn.recv()  # hello
+        self._conn.send(("subscribe", [tuple(t) for t in topics]))
+
+    def next_event(self, timeout=None):
+        """(topic, value) or None if nothing arrived within timeout seconds."""
+        if not self._conn.poll(timeout):
+            return None
+        _, topic, value = self._conn.recv()
+        return topic, value
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.next_event(None)
+            except (EOFError, OSError):
+                return
+
+    def close(self):
+        self._conn.close()
+
+
+def hub_from_env(default_mt5):
+    """HubClient if STOCKDATA_HUB=host:port is set, otherwise the given MT5 module."""
+    value = os.environ.get("STOCKDATA_HUB")
+    if not value:
+        return default_mt5
+    client = HubClient(parse_address(value))
+    logger.info(f"Using market-data hub at {value}")
+    return client
+
+
+def selfcheck(clients=3, polls=20):
+    """
+    Hub on a SimulatedMT5 with `clients` HubClients polling the same feed.
+    Returns the hub's terminal call count next to what the clients would
+    have made calling the terminal directly; raises AssertionError on a mismatch.
+    """
+    from STOCKDATA.simulator import SimulatedMT5, synthetic_bars
+
+    sim = SimulatedMT5({"XAUUSD": synthetic_bars(600, seed=1, start_price=2300.0)}, start=400, seed=1)
+    ttl = 0.05
+    hub = DataHub(sim, address=("127.0.0.1", 0), authkey=os.urandom(16), tick_ttl=ttl, account_ttl=ttl,
+                  positions_ttl=ttl, bar_ttl=ttl, poll_interval=ttl)
+    hub.start(initialize=False)
+    try:
+        conns = [HubClient(hub.address, authkey=hub.authkey) for _ in range(clients)]
+        subscription = conns[0].subscribe([("bar", "XAUUSD", sim.TIMEFRAME_M5)])
+        direct = 0
+        for _ in range(polls):
+            for client in conns:
+                assert client.TIMEFRAME_M5 == sim.TIMEFRAME_M5
+                rates = client.copy_rates_from_pos("XAUUSD", sim.TIMEFRAME_M5, 0, 100)
+                assert (rates == sim.copy_rates_from_pos("XAUUSD", sim.TIMEFRAME_M5, 0, 100)).all()
+                assert client.symbol_info_tick("XAUUSD").time == sim.symbol_info_tick("XAUUSD").time
+                assert client.account_info().balance == sim.account_info().balance
+                client.positions_get()
+                direct += 4
+            sim.step()
+            time.sleep(ttl * 1.5)  # let every snapshot expire so the next round sees the new bar
+        event = subscription.next_event(timeout=2.0)
+        assert event is not None and event[0][0] == "bar", f"no bar event published: {event}"
+        subscription.close()
+        for client in conns:
+            client.shutdown()
+    finally:
+        hub.stop()
+    return {"clients": clients, "polls": polls, "direct_calls": direct,
+            "hub_requests": hub.stats["requests"], "terminal_calls": hub.stats["terminal_calls"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared MT5 market-data hub")
+    parser.add_argument("--selfcheck", action="store_true", help="run against a simulated terminal and exit")
+    parser.add_argument("--clients", type=int, default=3, help="clients used by --selfcheck")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+    if args.selfcheck:
+        print(json.dumps(selfcheck(args.clients), indent=2))
+        return
+
+    from STOCKDATA.bar_store import store_from_env
+    from STOCKDATA.broker import get_backend
+
+    mt5 = get_backend()
+    authkey = hub_authkey()
+    symbols = load_symbols()
+    address = parse_address(os.environ.get("STOCKDATA_HUB", "%s:%d" % DEFAULT_ADDRESS))
+    if not mt5.initialize():
+        raise RuntimeError(f"MT5 initialize() failed, code={mt5.last_error()}")
+    for symbol in symbols:
+        mt5.symbol_select(symbol, True)
+    hub = DataHub(mt5, address=address, authkey=authkey, bar_store=store_from_env())
+    try:
+        hub.serve_forever(initialize=False)
+    except KeyboardInterrupt:
+        logger.info("Data hub stopped")
+    finally:
+        mt5.shutdown()
+
+
+if __name__ == "__main__":
+    main()
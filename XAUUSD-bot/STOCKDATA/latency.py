@@ -0,0 +1,255 @@
+"""
+latency.py
+Signal-to-fill latency and slippage instrumentation.
+
+A Trace follows one pass of a strategy loop: spans around bar fetch, indicator
+compute, risk checks, the order_send round-trip and fill confirmation are
+timed with the monotonic clock (perf_counter_ns) and recorded into
+per-(stage, symbol, strategy) histograms.  Slippage is executed minus
+requested price, signed so that positive is adverse (paid more on a buy,
+received less on a sell), and is recorded in points.
+
+LatencyRecorder.prometheus_text() renders the histograms in the Prometheus
+text format; serve_metrics() exposes it on /metrics.  Trace.finish() writes
+requested/executed price, slippage (price units) and latency (seconds, order
+start to fill) to the trade store's columns of the same name.
+
+    LATENCY = LatencyRecorder()
+    trace = LATENCY.trace("XAUUSD", "macd")
+    with trace.span("bar_fetch"):
+        rates = BAR_CACHE.get(...)
+    with trace.span("order_send"):
+        result = mt5.order_send(request)
+    trace.order_result("buy", request["price"], result, point=0.01)
+    trace.finish(store=TRADE_STORE)
+"""
+
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("latency")
+
+STAGES = ("bar_fetch", "indicators", "risk_checks", "order_send", "fill_confirm", "signal_to_fill")
+# Seconds: 100 us .. 10 s, roughly x2.5 apart
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+# Points of adverse (positive) or favourable (negative) slippage
+SLIPPAGE_BUCKETS = (-50, -20, -10, -5, -2, -1, 0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics) with count, sum, min and max."""
+
+    __slots__ = ("bounds", "counts", "count", "total", "min", "max")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (max for the +Inf bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def summary(self):
+        return {"count": self.count, "mean": self.total / self.count if self.count else None,
+                "p50": self.quantile(0.5), "p90": self.quantile(0.9), "p99": self.quantile(0.99),
+                "min": self.min, "max": self.max}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+
+
+class LatencyRecorder:
+    """Histograms keyed by (stage, symbol, strategy) plus slippage per (symbol, strategy)."""
+
+    def __init__(self, latency_buckets=LATENCY_BUCKETS, slippage_buckets=SLIPPAGE_BUCKETS):
+        self.latency_buckets = latency_buckets
+        self.slippage_buckets = slippage_buckets
+        self.latency = {}
+        self.slippage = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, symbol="", strategy=""):
+        key = (stage, symbol, strategy)
+        with self._lock:
+            hist = self.latency.get(key)
+            if hist is None:
+                hist = self.latency[key] = Histogram(self.latency_buckets)
+            hist.observe(seconds)
+
+    def observe_slippage(self, points, symbol="", strategy=""):
+        key = (symbol, strategy)
+        with self._lock:
+            hist = self.slippage.get(key)
+            if hist is None:
+                hist = self.slippage[key] = Histogram(self.slippage_buckets)
+            hist.observe(points)
+
+    @contextmanager
+    def span(self, stage, symbol="", strategy=""):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.observe(stage, (time.perf_counter_ns() - start) / 1e9, symbol, strategy)
+
+    def trace(self, symbol="", strategy=""):
+        return Trace(self, symbol, strategy)
+
+    # ------------------------------------------------------------------
+    # Export
+    # ------------------------------------------------------------------
+    def report(self):
+        """{stage: {"symbol/strategy": summary}} plus slippage summaries, for logs and the CLI."""
+        with self._lock:
+            out = {}
+            for (stage, symbol, strategy), hist in sorted(self.latency.items()):
+                out.setdefault(stage, {})[f"{symbol}/{strategy}"] = hist.summary()
+            out["slippage_points"] = {f"{s}/{st}": h.summary() for (s, st), h in sorted(self.slippage.items())}
+            return out
+
+    def prometheus_text(self):
+        lines = []
+        with self._lock:
+            for name, helptext, table, label_names in (
+                    ("stockdata_stage_latency_seconds", "Signal-to-fill stage latency", self.latency,
+                     ("stage", "symbol", "strategy")),
+                    ("stockdata_slippage_points", "Executed minus requested price in points (positive = adverse)",
+                     self.slippage, ("symbol", "strategy"))):
+                lines.append(f"# HELP {name} {helptext}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in sorted(table.items()):
+                    base = list(zip(label_names, key))
+                    cumulative = 0
+                    for bound, n in zip(hist.bounds, hist.counts):
+                        cumulative += n
+                        lines.append(f"{name}_bucket{{{_labels(base + [('le', bound)])}}} {cumulative}")
+                    lines.append(f"{name}_bucket{{{_labels(base + [('le', '+Inf')])}}} {hist.count}")
+                    lines.append(f"{name}_sum{{{_labels(base)}}} {hist.total}")
+                    lines.append(f"{name}_count{{{_labels(base)}}} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+class Trace:
+    """Timing of one signal-to-fill pass; spans are recorded as they close."""
+
+    def __init__(self, recorder, symbol, strategy):
+        self.recorder = recorder
+        self.symbol = symbol
+        self.strategy = strategy
+        self.started = time.perf_counter_ns()
+        self.spans = {}
+        self.order_started = None
+        self.filled_at = None
+        self.side = None
+        self.requested_price = None
+        self.executed_price = None
+        self.slippage = None
+        self.ticket = None
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter_ns()
+        if stage == "order_send" and self.order_started is None:
+            self.order_started = start
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            seconds = (end - start) / 1e9
+            self.spans[stage] = self.spans.get(stage, 0.0) + seconds
+            self.recorder.observe(stage, seconds, self.symbol, self.strategy)
+            if stage in ("order_send", "fill_confirm"):
+                self.filled_at = end
+
+    def order_result(self, side, requested_price, result, point=None):
+        """Take executed price and ticket from an order_send result (object or dict) and record slippage."""
+        get = result.get if isinstance(result, dict) else lambda k, d=None: getattr(result, k, d)
+        executed = get("price") or None
+        self.side = side
+        self.requested_price = requested_price
+        self.executed_price = executed
+        self.ticket = get("order") or get("deal") or None
+        if executed and requested_price:
+            sign = 1 if side == "buy" else -1
+            self.slippage = sign * (executed - requested_price)
+            if point:
+                self.recorder.observe_slippage(self.slippage / point, self.symbol, self.strategy)
+        return self.slippage
+
+    @property
+    def latency(self):
+        """Seconds from the start of order_send to the end of fill confirmation (None before an order)."""
+        if self.order_started is None or self.filled_at is None:
+            return None
+        return (self.filled_at - self.order_started) / 1e9
+
+    def finish(self, store=None, **fields):
+        """Record the whole pass as signal_to_fill and, if a ticket is known, upsert its timings to store."""
+        total = (time.perf_counter_ns() - self.started) / 1e9
+        self.recorder.observe("signal_to_fill", total, self.symbol, self.strategy)
+        if store is not None and self.ticket:
+            record = {"ticket": self.ticket, "symbol": self.symbol, "strategy": self.strategy,
+                      "requested_price": self.requested_price, "executed_price": self.executed_price,
+                      "slippage": self.slippage, "latency": self.latency}
+            record.update(fields)
+            try:
+                store.upsert(record)
+            except Exception as e:
+                logger.error(f"Writing latency for ticket {self.ticket} failed: {e}")
+        return total
+
+
+# ----------------------------------------------------------------------
+# Prometheus endpoint
+# ----------------------------------------------------------------------
+def serve_metrics(recorder, port=9108, host="127.0.0.1"):
+    """Serve recorder.prometheus_text() on http://host:port/metrics from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = recorder.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Serving latency metrics on http://{host}:{port}/metrics")
+    return server
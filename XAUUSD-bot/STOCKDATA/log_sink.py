@@ -0,0 +1,301 @@
+"""
+log_sink.py
+Background writer for runtime logs and CSV trade logs.
+
+log() used to open and close the log file for every message and
+append_trade_log() built a one-row DataFrame and called to_csv per trade.  The
+sink keeps one open handle per file on a writer thread; callers only put the
+line on a bounded queue, which never blocks - if it is full the message is
+dropped and counted, and the count is written to the log once there is room.
+Lines are buffered per file and written when flush_bytes have accumulated or
+flush_interval seconds have passed, whichever comes first.  Files configured
+with max_bytes rotate like logging.handlers.RotatingFileHandler (bot.log ->
+bot.log.1 -> ...); CSV files get their header back after a rotation.  A
+failed write or rotation (e.g. Windows refusing to rename an open bot.log) is
+logged and the writer keeps going; a failed rotation is retried after
+ROTATE_RETRY seconds, appending to the current file meanwhile.
+
+    sink = get_sink()
+    sink.configure("logs/bot.log", max_bytes=5_000_000, backups=5)
+    sink.write("logs/bot.log", "[12:00:00] No signal")
+    sink.write_csv("logs/trades.csv", {"symbol": "XAUUSD", "signal": "buy"})
+    sink.write_event(activity, "bot_log", "MACD bot", "No signal", tag="macd")
+
+write_event() hands an event to an activity_log.ActivityLog; the append runs on
+the writer thread too, stamped with the time it was queued.
+
+SinkHandler plugs the same sink into the standard logging module.
+"""
+
+import atexit
+import csv
+import io
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger("log_sink")
+
+_FLUSH = object()
+_STOP = object()
+_EVENT = object()
+ROTATE_RETRY = 60.0
+
+
+class _Target:
+    """One output file: open handle, pending lines, rotation settings, CSV columns."""
+
+    def __init__(self, path, max_bytes=0, backups=5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.file = None
+        self.size = 0
+        self.pending = []
+        self.pending_bytes = 0
+        self.fieldnames = None
+        self.rotate_after = 0.0  # monotonic time before which rotation is not retried
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(self.path, "a", encoding="utf-8", newline="")
+        self.size = self.file.tell()
+
+    def rotate(self):
+        """Shift the backups and start a new file; the file is reopened even if a rename fails."""
+        self.file.close()
+        try:
+            for i in range(self.backups - 1, 0, -1):
+                src = f"{self.path}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.path}.{i + 1}")
+            if self.backups > 0:
+                os.replace(self.path, f"{self.path}.1")
+            else:
+                os.remove(self.path)
+        finally:
+            self.open()
+
+
+class LogSink:
+    """
+    max_pending: queue bound; beyond it messages are dropped (counted in .dropped).
+    flush_bytes / flush_interval: write a file's buffer once it holds this many
+    bytes or its oldest line is this many seconds old.
+    """
+
+    def __init__(self, max_pending=10000, flush_bytes=64 * 1024, flush_interval=1.0):
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._reported_drops = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._targets = {}
+        self._config = {}
+        self._oldest = None
+        self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------
+    # Producer side (any thread, never blocks)
+    # ------------------------------------------------------------------
+    def configure(self, path, max_bytes=0, backups=5):
+        """Rotation for path: keep it under max_bytes (0 = never rotate) with this many backups."""
+        self._config[os.path.abspath(path)] = (max_bytes, backups)
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def write(self, path, line):
+        """Append a text line (newline added)."""
+        return self._put((path, line + "\n", None))
+
+    def write_csv(self, path, row):
+        """Append a dict as a CSV row; the header comes from the first row written to a new file."""
+        return self._put((path, None, dict(row)))
+
+    def write_event(self, activity, *args, **kwargs):
+        """Append an event to an ActivityLog (activity.append(*args, **kwargs)) on the writer thread."""
+        kwargs.setdefault("timestamp", datetime.now().isoformat())
+        return self._put((_EVENT, activity, (args, kwargs)))
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far is on disk (for shutdown and tests); False on timeout."""
+        done = threading.Event()
+        if not self._thread.is_alive():
+            return False
+        try:
+            self._queue.put((_FLUSH, done, None), timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        if self._thread.is_alive():
+            try:
+                self._queue.put((_STOP, None, None), timeout=timeout)
+            except queue.Full:
+                logger.error("Log sink queue still full at close; pending messages are lost")
+                return
+            self._thread.join(timeout)
+
+    # ------------------------------------------------------------------
+    # Writer thread
+    # ------------------------------------------------------------------
+    def _target(self, path):
+        key = os.path.abspath(path)
+        target = self._targets.get(key)
+        if target is None:
+            target = _Target(key, *self._config.get(key, (0, 5)))
+            target.open()
+            self._targets[key] = target
+        return target
+
+    def _csv_line(self, target, row):
+        buf = io.StringIO()
+        if target.fieldnames is None:
+            header = None
+            if target.size > 0:
+                with open(target.path, newline="", encoding="utf-8") as f:
+                    header = next(csv.reader(f), None)
+            target.fieldnames = header or list(row)
+            if not header:
+                csv.writer(buf).writerow(target.fieldnames)
+        csv.DictWriter(buf, target.fieldnames, extrasaction="ignore").writerow(row)
+        return buf.getvalue()
+
+    def _write_target(self, target):
+        if not target.pending:
+            return
+        lines = target.pending
+        target.pending = []
+        target.pending_bytes = 0
+        chunk, chunk_bytes = [], 0
+        for line in lines:
+            # Rotate on line boundaries so no file grows past max_bytes
+            if target.max_bytes and target.size + chunk_bytes + len(line) > target.max_bytes \
+                    and target.size + chunk_bytes > 0 and time.monotonic() >= target.rotate_after:
+                target.file.write("".join(chunk))
+                chunk, chunk_bytes = [], 0
+                if self._rotate(target) and target.fieldnames is not None:
+                    header = io.StringIO()
+                    csv.writer(header).writerow(target.fieldnames)
+                    chunk.append(header.getvalue())
+                    chunk_bytes = len(chunk[0])
+            chunk.append(line)
+            chunk_bytes += len(line)
+        target.file.write("".join(chunk))
+        target.file.flush()
+        target.size += chunk_bytes
+
+    @staticmethod
+    def _rotate(target):
+        """True if rotated; on failure keep appending to the reopened file and retry later."""
+        try:
+            target.rotate()
+            return True
+        except OSError as e:
+            logger.error(f"Rotating {target.path} failed, retrying in {ROTATE_RETRY:.0f}s: {e}")
+            target.rotate_after = time.monotonic() + ROTATE_RETRY
+            return False
+
+    def _flush_target(self, target):
+        try:
+            self._write_target(target)
+        except (OSError, ValueError) as e:  # ValueError: handle closed under us
+            logger.error(f"Writing {target.path} failed: {e}")
+            if target.file is None or target.file.closed:
+                try:
+                    target.open()
+                except OSError:
+                    pass
+
+    def _flush_all(self):
+        for target in self._targets.values():
+            self._flush_target(target)
+        self._oldest = None
+
+    def _run(self):
+        while True:
+            timeout = None
+            if self._oldest is not None:
+                timeout = max(self._oldest + self.flush_interval - time.monotonic(), 0.0)
+            try:
+                path, line, row = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._flush_all()
+                continue
+            if path is _STOP:
+                self._flush_all()
+                for target in self._targets.values():
+                    if target.file is not None:
+                        target.file.close()
+                return
+            if path is _FLUSH:
+                self._flush_all()
+                line.set()
+                continue
+            if path is _EVENT:
+                try:
+                    line.append(*row[0], **row[1])
+                except Exception as e:
+                    logger.error(f"Activity log append failed: {e}")
+                continue
+            try:
+                target = self._target(path)
+                if row is not None:
+                    line = self._csv_line(target, row)
+                if self.dropped > self._reported_drops and row is None:
+                    missed = self.dropped - self._reported_drops
+                    self._reported_drops = self.dropped
+                    line = f"[log_sink] {missed} messages dropped (queue full)\n" + line
+                target.pending.append(line)
+                target.pending_bytes += len(line)
+            except Exception as e:  # keep the writer alive whatever one message does
+                logger.error(f"Queuing a line for {path} failed: {e}")
+                continue
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if target.pending_bytes >= self.flush_bytes:
+                self._flush_target(target)
+            if self._oldest is not None and time.monotonic() - self._oldest >= self.flush_interval:
+                self._flush_all()
+
+
+class SinkHandler(logging.Handler):
+    """logging.Handler that hands formatted records to a LogSink."""
+
+    def __init__(self, path, sink=None, level=logging.NOTSET):
+        super().__init__(level)
+        self.path = path
+        self.sink = sink or get_sink()
+
+    def emit(self, record):
+        try:
+            self.sink.write(self.path, self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
+_default_sink = None
+_default_lock = threading.Lock()
+
+
+def get_sink():
+    """Process-wide sink, started on first use and flushed at interpreter exit."""
+    global _default_sink
+    with _default_lock:
+        if _default_sink is None:
+            _default_sink = LogSink()
+            atexit.register(_default_sink.close)
+        return _default_sink
@@ -1,8 +1,19 @@
-import MetaTrader5 as mt5
-import pandas as pd
-import time
+import asyncio
 import json
 
+from STOCKDATA.async_runtime import AsyncRuntime
+from STOCKDATA.bar_cache import BarCache, rates_to_frame
+from STOCKDATA.bar_store import store_from_env
+from STOCKDATA.broker import get_backend
+from STOCKDATA.data_hub import hub_from_env
+from STOCKDATA.order_router import OrderRouter, intent_from_request
+from STOCKDATA.scheduler import BarCloseScheduler
+from STOCKDATA.symbol_cache import SymbolCache, configured_symbols
+from STOCKDATA.modules.indicator_engine import EMACrossEngine, MACDEngine
+
+# Talk to the shared market-data hub instead of the terminal when STOCKDATA_HUB is set
+mt5 = hub_from_env(get_backend())
+
 # ================= CONFIG =================
 CONFIG = {
     "symbol": "XAUUSD",
@@ -19,20 +30,31 @@ def connect_mt5():
     if not mt5.initialize():
         raise RuntimeError("❌ MT5 initialize failed")
     print("✅ MT5 Connected")
+    SYMBOLS.preload(configured_symbols([CONFIG["symbol"]]))
 
 def disconnect_mt5():
     mt5.shutdown()
     print("🔌 MT5 Disconnected")
 
 # ================= DATA FETCH =================
+BAR_CACHE = BarCache(mt5, store=store_from_env())
+# Static symbol spec (point, digits, volume limits), loaded once at connect
+SYMBOLS = SymbolCache(mt5)
+
 def get_data(symbol, timeframe, n=200):
-    rates = mt5.copy_rates_from_pos(symbol, timeframe, 0, n)
-    df = pd.DataFrame(rates)
-    df["time"] = pd.to_datetime(df["time"], unit="s")
-    return df
+    # Delta fetch: only bars newer than the cached ones come from the terminal
+    return rates_to_frame(BAR_CACHE.get(symbol, timeframe, n))
 
 # ================= INDICATORS =================
-def ema_strategy(df):
+# Streaming engines: closed bars are committed once, the forming bar is only peeked
+EMA_ENGINE = EMACrossEngine(9, 21)
+MACD_ENGINE = MACDEngine(12, 26, 9)
+
+def ema_strategy(df, engine=None):
+    if engine is not None:
+        engine.update(df["time"].iloc[:-1], df["close"].iloc[:-1])
+        return engine.crossover(forming_close=df["close"].iloc[-1])
+
     df["ema9"] = df["close"].ewm(span=9, adjust=False).mean()
     df["ema21"] = df["close"].ewm(span=21, adjust=False).mean()
 
@@ -47,7 +69,11 @@ def ema_strategy(df):
         return "sell"
     return None
 
-def macd_strategy(df):
+def macd_strategy(df, engine=None):
+    if engine is not None:
+        engine.update(df["time"].iloc[:-1], df["close"].iloc[:-1])
+        return engine.crossover(forming_close=df["close"].iloc[-1])
+
     df["ema12"] = df["close"].ewm(span=12, adjust=False).mean()
     df["ema26"] = df["close"].ewm(span=26, adjust=False).mean()
     df["macd"] = df["ema12"] - df["ema26"]
@@ -65,25 +91,22 @@ def macd_strategy(df):
     return None
 
 # ================= ORDER SENDER =================
-def send_order(order_type):
-    symbol = CONFIG["symbol"]
+def build_order_request(order_type, tick, point):
     lot = CONFIG["lot"]
-
-    tick = mt5.symbol_info_tick(symbol)
     if order_type == "buy":
         price = tick.ask
-        sl = price - CONFIG["sl_points"] * mt5.symbol_info(symbol).point
-        tp = price + CONFIG["tp_points"] * mt5.symbol_info(symbol).point
+        sl = price - CONFIG["sl_points"] * point
+        tp = price + CONFIG["tp_points"] * point
         order_type_mt5 = mt5.ORDER_TYPE_BUY
     else:
         price = tick.bid
-        sl = price + CONFIG["sl_points"] * mt5.symbol_info(symbol).point
-        tp = price - CONFIG["tp_points"] * mt5.symbol_info(symbol).point
+        sl = price + CONFIG["sl_points"] * point
+        tp = price - CONFIG["tp_points"] * point
         order_type_mt5 = mt5.ORDER_TYPE_SELL
 
-    request = {
+    return {
         "action": mt5.TRADE_ACTION_DEAL,
-        "symbol": symbol,
+        "symbol": CONFIG["symbol"],
         "volume": lot,
         "type": order_type_mt5,
         "price": price,
@@ -94,16 +117,24 @@ def send_order(order_type):
         "comment": "EMA+MACD bot"
     }
 
-    result = mt5.order_send(request)
-    print(f"📌 Order Result: {result}")
-    return result
+# Requotes are re-priced and transient errors retried (with backoff) within a 2 s budget
+ROUTER = OrderRouter(mt5, symbol_cache=SYMBOLS, budget=2.0)
+
+def send_order(order_type):
+    symbol = CONFIG["symbol"]
+    tick = mt5.symbol_info_tick(symbol)
+    request = build_order_request(order_type, tick, SYMBOLS.point(symbol))
+
+    routed = ROUTER.send(intent_from_request(request))
+    print(f"📌 Order Result: {routed.outcome} after {routed.attempts} attempt(s): {routed.result}")
+    return routed
 
 # ================= STRATEGY RUNNER =================
 def run_strategy():
     df = get_data(CONFIG["symbol"], CONFIG["timeframe"], 300)
 
-    ema_signal = ema_strategy(df)
-    macd_signal = macd_strategy(df)
+    ema_signal = ema_strategy(df, EMA_ENGINE)
+    macd_signal = macd_strategy(df, MACD_ENGINE)
 
     print(f"EMA: {ema_signal}, MACD: {macd_signal}")
 
@@ -113,14 +144,70 @@ def run_strategy():
     else:
         print("⏸ No confluence, no trade.")
 
+# ================= ASYNC RUNNER =================
+async def fetch_fresh_bars(rt, symbol):
+    """BAR_CACHE.get, re-polled (off the MT5 thread) until the bar that just closed is no longer the forming one."""
+    timeframe = CONFIG["timeframe"]
+    return await SCHEDULER.fresh_bars_async(symbol, timeframe,
+                                            lambda: rt.mt5.run(BAR_CACHE.get, symbol, timeframe, 300))
+
+def evaluate_signals(df):
+    return ema_strategy(df, EMA_ENGINE), macd_strategy(df, MACD_ENGINE)
+
+async def run_strategy_async(rt):
+    """
+    run_strategy on the async runtime: MT5 calls go through the MT5 thread,
+    signals are computed on the compute thread while the order-side tick is
+    fetched, and console output is handed to the background.
+    """
+    symbol = CONFIG["symbol"]
+    rates = await fetch_fresh_bars(rt, symbol)
+    df = rates_to_frame(rates)
+    tick_task = asyncio.ensure_future(rt.mt5.symbol_info_tick(symbol))
+    ema_signal, macd_signal = await rt.compute(evaluate_signals, df)
+    tick = await tick_task
+
+    rt.background.submit(print, f"EMA: {ema_signal}, MACD: {macd_signal}")
+    if ema_signal == macd_signal and ema_signal is not None:
+        # Served from memory; run on the MT5 thread only because a TTL expiry reloads from the terminal
+        info = await rt.mt5.run(SYMBOLS.get, symbol)
+        request = build_order_request(ema_signal, tick, info.point)
+        # Routed on the router's own thread: its terminal calls go to the MT5 thread
+        # (ROUTER.terminal), its backoff waits do not hold that thread up
+        routed = await asyncio.wrap_future(ROUTER.submit(intent_from_request(request)))
+        rt.background.submit(print, f"🚀 Took {ema_signal.upper()} trade (confluence). 📌 Order Result: "
+                                    f"{routed.outcome} after {routed.attempts} attempt(s): {routed.result}")
+        return routed
+    rt.background.submit(print, "⏸ No confluence, no trade.")
+    return None
+
 # ================= MAIN =================
-if __name__ == "__main__":
-    connect_mt5()
+# Runs right after every bar close of CONFIG["timeframe"] instead of a fixed 60 s poll;
+# a late wakeup runs once for the latest close ("latest" catch-up)
+SCHEDULER = BarCloseScheduler(settle=1.0, jitter=0.5, catch_up="latest")
+
+async def main_async(rt):
+    await rt.mt5.run(connect_mt5)
+    ROUTER.terminal = rt.mt5.call
+    due = []
+    SCHEDULER.add(CONFIG["timeframe"], lambda symbols, close_time: due.extend(symbols), [CONFIG["symbol"]])
     try:
+        await run_strategy_async(rt)
         while True:
-            run_strategy()
-            time.sleep(60)  # run every 1 minute
+            await asyncio.sleep(SCHEDULER.delay_until_wakeup())
+            SCHEDULER.run_pending()
+            if due:
+                due.clear()
+                await run_strategy_async(rt)
+    finally:
+        await rt.mt5.run(disconnect_mt5)
+
+def main():
+    rt = AsyncRuntime(mt5)
+    try:
+        rt.run(main_async(rt))
     except KeyboardInterrupt:
         print("🛑 Bot stopped manually")
-    finally:
-        disconnect_mt5()
+
+if __name__ == "__main__":
+    main()
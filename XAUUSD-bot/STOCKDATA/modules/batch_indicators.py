@@ -0,0 +1,176 @@
+"""
+batch_indicators.py
+Indicators for many symbols at once over a stacked (symbols x bars) matrix.
+
+Instead of one pandas pipeline per symbol, every exponential average needed per
+cycle (EMA fast/slow, MACD fast/slow, ATR, RSI gain/loss) is stacked into one
+matrix and smoothed in a single pass over the bars, vectorised across rows.  The
+Python-level work is therefore proportional to the number of bars, not to
+symbols x indicators, and per-cycle cost grows sub-linearly with the symbol list.
+
+Results match calculate_atr / calculate_rsi and the ewm(adjust=False) crossover
+code to floating-point rounding.
+"""
+
+import numpy as np
+
+from STOCKDATA.modules.indicator_engine import span_to_alpha
+
+OHLC_FIELDS = ("open", "high", "low", "close")
+
+
+def stack_rates(rates_by_symbol, n=None, fields=OHLC_FIELDS):
+    """
+    Stack per-symbol bars into (symbols x bars) float64 matrices.
+
+    rates_by_symbol: {symbol: DataFrame or MT5 rates structured array}, chronological.
+    Rows are tail-aligned: the last column holds each symbol's latest bar.  n
+    defaults to the shortest history so no padding is needed.
+    Returns (symbols, {field: matrix}).
+    """
+    symbols = list(rates_by_symbol)
+    if not symbols:
+        return symbols, {f: np.empty((0, 0)) for f in fields}
+    lengths = [len(rates_by_symbol[s]) for s in symbols]
+    n = min(lengths) if n is None else min(n, min(lengths))
+    out = {f: np.empty((len(symbols), n), dtype=np.float64) for f in fields}
+    for row, sym in enumerate(symbols):
+        rates = rates_by_symbol[sym]
+        for f in fields:
+            col = rates[f]
+            out[f][row] = np.asarray(col, dtype=np.float64)[len(col) - n:]
+    return symbols, out
+
+
+def ewm_rows(x, alpha, min_periods=0):
+    """
+    ewm(alpha, adjust=False, min_periods).mean() along axis 1 of a 2-D array.
+
+    alpha / min_periods may be scalars or one value per row.  Leading NaNs (e.g. the
+    first diff of a price series) are handled like pandas; interior NaNs fall back
+    to a slower masked recurrence.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    rows, n = x.shape
+    out = np.empty_like(x)
+    if n == 0:
+        return out
+    alpha = np.broadcast_to(np.asarray(alpha, dtype=np.float64), (rows,))
+    factor = 1.0 - alpha
+    denom = factor + alpha
+
+    nan_mask = np.isnan(x)
+    observed = ~nan_mask
+    any_obs = observed.any(axis=1)
+    first_valid = np.where(any_obs, observed.argmax(axis=1), n)
+    lead = int(first_valid.max()) if rows else 0
+
+    w = x[:, 0].copy()
+    old_wt = np.ones(rows)
+    out[:, 0] = w
+    fast_from = n
+    if lead < n and not nan_mask[:, lead:].any():
+        fast_from = lead + 1
+
+    # Masked recurrence (pandas semantics) until every row has started
+    for j in range(1, min(fast_from, n)):
+        cur = x[:, j]
+        obs = observed[:, j]
+        valid = w == w
+        old_wt = np.where(valid, old_wt * factor, old_wt)
+        upd = (old_wt * w + alpha * cur) / (old_wt + alpha)
+        w = np.where(valid, np.where(obs, upd, w), cur)
+        old_wt = np.where(valid & obs, 1.0, old_wt)
+        out[:, j] = w
+
+    # Dense recurrence: three vector ops per bar for all rows at once
+    for j in range(fast_from, n):
+        w = (factor * w + alpha * x[:, j]) / denom
+        out[:, j] = w
+
+    minp = np.broadcast_to(np.maximum(np.asarray(min_periods), 1), (rows,))
+    if (minp > 1).any() or nan_mask.any():
+        nobs = np.cumsum(observed, axis=1)
+        out[nobs < minp[:, None]] = np.nan
+    return out
+
+
+def true_range_rows(high, low, close):
+    """True range per bar; the first bar has no previous close so TR = high - low."""
+    tr = high - low
+    prev_close = close[:, :-1]
+    np.maximum(tr[:, 1:], np.abs(high[:, 1:] - prev_close), out=tr[:, 1:])
+    np.maximum(tr[:, 1:], np.abs(low[:, 1:] - prev_close), out=tr[:, 1:])
+    return tr
+
+
+def compute_indicators(high, low, close, atr_period=14, rsi_period=14,
+                       ema_fast=9, ema_slow=21, macd_fast=12, macd_slow=26,
+                       macd_signal=9, full=False):
+    """
+    ATR, RSI, EMA fast/slow and MACD/signal/hist for every row of the stacked
+    (symbols x bars) high/low/close matrices.
+
+    ATR and RSI use the same ewm(span=period, min_periods=period) smoothing as
+    modules/indicators.py.  With full=False only the latest value per symbol is
+    returned, with the same fallbacks as calculate_atr/calculate_rsi (0.0 ATR,
+    50.0 RSI when undefined); full=True returns the raw (symbols x bars) series.
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    s, n = close.shape
+
+    delta = np.empty_like(close)
+    delta[:, 0] = np.nan
+    np.subtract(close[:, 1:], close[:, :-1], out=delta[:, 1:])
+    gain = np.clip(delta, 0, None)
+    loss = -np.clip(delta, None, 0)
+
+    # One stacked pass for everything that smooths a bar-aligned series
+    spans = (ema_fast, ema_slow, macd_fast, macd_slow, atr_period, rsi_period, rsi_period)
+    minps = (0, 0, 0, 0, atr_period, rsi_period, rsi_period)
+    stacked = np.concatenate([close, close, close, close,
+                              true_range_rows(high, low, close), gain, loss])
+    alphas = np.repeat([span_to_alpha(sp) for sp in spans], s)
+    smoothed = ewm_rows(stacked, alphas, np.repeat(minps, s))
+    fast, slow, m_fast, m_slow, atr, avg_gain, avg_loss = (
+        smoothed[i * s:(i + 1) * s] for i in range(len(spans)))
+
+    macd = m_fast - m_slow
+    signal = ewm_rows(macd, span_to_alpha(macd_signal))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = avg_gain / np.where(avg_loss == 0, np.nan, avg_loss)
+        rsi = 100 - (100 / (1 + rs))
+
+    result = {
+        "atr": atr,
+        "rsi": rsi,
+        "ema_fast": fast,
+        "ema_slow": slow,
+        "macd": macd,
+        "signal": signal,
+        "hist": macd - signal,
+    }
+    if full:
+        return result
+
+    latest = {k: v[:, -1].copy() for k, v in result.items()}
+    enough = n >= atr_period + 1
+    last_atr = latest["atr"]
+    latest["atr"] = np.where(enough & ~np.isnan(last_atr) & (last_atr > 0), last_atr, 0.0)
+    latest["rsi"] = np.where((n >= rsi_period + 1) & ~np.isnan(latest["rsi"]), latest["rsi"], 50.0)
+    return latest
+
+
+def crossover_signals(fast, slow):
+    """
+    Vectorised crossover of two (symbols x bars) series on their last two columns.
+    Returns an object array of "buy" / "sell" / None per symbol.
+    """
+    prev_f, prev_s = fast[:, -2], slow[:, -2]
+    last_f, last_s = fast[:, -1], slow[:, -1]
+    out = np.full(fast.shape[0], None, dtype=object)
+    out[(prev_f < prev_s) & (last_f > last_s)] = "buy"
+    out[(prev_f > prev_s) & (last_f < last_s)] = "sell"
+    return out
@@ -0,0 +1,231 @@
+"""
+indicator_engine.py
+Stateful (streaming) EMA / MACD indicators.
+
+The strategy loops used to re-run ``Series.ewm(span=..., adjust=False)`` over the
+whole 200-300 bar window on every poll only to read the last two values.  The
+classes here are seeded once from history and then advanced in O(1) per new
+closed bar.
+
+Values are bit-for-bit identical to pandas ``ewm(adjust=False).mean()`` computed
+over the same bars (the recurrence below is the one pandas uses internally; gaps
+are skipped with the weights decaying across them, as with ignore_na=False).  Note that an engine keeps its seed bar, whereas
+re-running ewm over a sliding window re-seeds on every poll; the difference is
+the seed transient, which has decayed to nothing after a few multiples of span.
+"""
+
+import numpy as np
+
+NaN = float("nan")
+
+
+def span_to_alpha(span):
+    """Smoothing factor for a span, computed the same way pandas does (via com)."""
+    if span < 1:
+        raise ValueError(f"span must be >= 1, got {span}")
+    com = (span - 1) / 2.0
+    return 1.0 / (1.0 + com)
+
+
+def ewm_adjust_false(values, alpha, min_periods=0):
+    """
+    Full-series ``ewm(alpha=alpha, adjust=False, min_periods=min_periods).mean()``
+    on a 1-D array-like. Returns a float64 ndarray of the same length.
+    """
+    vals = np.asarray(values, dtype=np.float64)
+    out = np.empty(vals.shape[0], dtype=np.float64)
+    minp = max(min_periods, 1)
+    old_wt_factor = 1.0 - alpha
+    weighted = NaN
+    old_wt = 1.0
+    nobs = 0
+    # Plain float loop: for a few hundred bars this beats per-element numpy ops
+    for i, cur in enumerate(vals.tolist()):
+        is_observation = cur == cur
+        nobs += is_observation
+        if weighted == weighted:
+            old_wt *= old_wt_factor
+            if is_observation:
+                if weighted != cur:
+                    weighted = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+                old_wt = 1.0
+        elif is_observation:
+            weighted = cur
+        out[i] = weighted if nobs >= minp else NaN
+    return out
+
+
+class StreamingEMA:
+    """
+    EMA advanced one value at a time.
+    update() commits a value, peek() returns what the EMA would be for a value
+    without committing it (used for the still-forming candle).
+    Pass alpha instead of span for other smoothings (e.g. Wilder's 1/period).
+    """
+
+    __slots__ = ("span", "alpha", "min_periods", "_old_wt_factor", "_weighted", "_old_wt", "nobs")
+
+    def __init__(self, span=None, min_periods=0, alpha=None):
+        if (span is None) == (alpha is None):
+            raise ValueError("pass exactly one of span or alpha")
+        self.span = span
+        self.alpha = span_to_alpha(span) if alpha is None else float(alpha)
+        self.min_periods = max(min_periods, 1)
+        self._old_wt_factor = 1.0 - self.alpha
+        self.reset()
+
+    def reset(self):
+        self._weighted = NaN
+        self._old_wt = 1.0
+        self.nobs = 0
+
+    @property
+    def value(self):
+        return self._weighted if self.nobs >= self.min_periods else NaN
+
+    def _step(self, cur, weighted, old_wt):
+        if weighted == weighted:
+            old_wt *= self._old_wt_factor
+            if cur == cur:
+                if weighted != cur:
+                    weighted = (old_wt * weighted + self.alpha * cur) / (old_wt + self.alpha)
+                old_wt = 1.0
+        elif cur == cur:
+            weighted = cur
+        return weighted, old_wt
+
+    def update(self, value):
+        value = float(value)
+        self._weighted, self._old_wt = self._step(value, self._weighted, self._old_wt)
+        self.nobs += value == value
+        return self.value
+
+    def peek(self, value):
+        value = float(value)
+        weighted, _ = self._step(value, self._weighted, self._old_wt)
+        return weighted if self.nobs + (value == value) >= self.min_periods else NaN
+
+    def seed(self, values):
+        self.reset()
+        for v in np.asarray(values, dtype=np.float64).tolist():
+            self.update(v)
+        return self.value
+
+
+def _cross(prev_a, prev_b, last_a, last_b):
+    """'buy' when a crosses above b, 'sell' when it crosses below, else None."""
+    if prev_a < prev_b and last_a > last_b:
+        return "buy"
+    if prev_a > prev_b and last_a < last_b:
+        return "sell"
+    return None
+
+
+class _BarEngine:
+    """
+    Base for engines fed with closed bars keyed by bar time.
+    update() only processes bars newer than the last one seen; if the window no
+    longer overlaps what we processed (bot slept, history rewritten) it re-seeds.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.last_time = None
+        self.bars = 0
+
+    def update(self, times, closes):
+        """Feed closed bars (chronological). Returns the number of new bars consumed."""
+        times = np.asarray(times)
+        n = times.shape[0]
+        if n == 0:
+            return 0
+        start = 0
+        if self.last_time is not None:
+            idx = int(np.searchsorted(times, self.last_time, side="right"))
+            if idx > 0 and times[idx - 1] == self.last_time:
+                start = idx
+            else:
+                self.reset()
+        if start < n:
+            for c in np.asarray(closes, dtype=np.float64)[start:].tolist():
+                self._push(c)
+            self.bars += n - start
+            self.last_time = times[-1]
+        return n - start
+
+    def _push(self, close):
+        raise NotImplementedError
+
+
+class EMACrossEngine(_BarEngine):
+    """Fast/slow EMA pair with crossover detection on the last two closed bars."""
+
+    def __init__(self, fast=9, slow=21):
+        self.fast = StreamingEMA(fast)
+        self.slow = StreamingEMA(slow)
+        super().__init__()
+
+    def reset(self):
+        super().reset()
+        self.fast.reset()
+        self.slow.reset()
+        self.prev = (NaN, NaN)
+        self.last = (NaN, NaN)
+
+    def _push(self, close):
+        self.prev = self.last
+        self.last = (self.fast.update(close), self.slow.update(close))
+
+    def peek(self, close):
+        """(fast, slow) for a not-yet-closed bar at this close."""
+        return self.fast.peek(close), self.slow.peek(close)
+
+    def crossover(self, forming_close=None):
+        """
+        Crossover between the previous and last closed bar, or - when
+        forming_close is given - between the last closed bar and the forming one.
+        """
+        if forming_close is None:
+            prev, last = self.prev, self.last
+        else:
+            prev, last = self.last, self.peek(forming_close)
+        return _cross(prev[0], prev[1], last[0], last[1])
+
+
+class MACDEngine(_BarEngine):
+    """MACD(fast, slow, signal) with signal-line crossover detection."""
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.fast = StreamingEMA(fast)
+        self.slow = StreamingEMA(slow)
+        self.signal = StreamingEMA(signal)
+        super().__init__()
+
+    def reset(self):
+        super().reset()
+        self.fast.reset()
+        self.slow.reset()
+        self.signal.reset()
+        self.prev = (NaN, NaN, NaN)
+        self.last = (NaN, NaN, NaN)
+
+    def _push(self, close):
+        macd = self.fast.update(close) - self.slow.update(close)
+        sig = self.signal.update(macd)
+        self.prev = self.last
+        self.last = (macd, sig, macd - sig)
+
+    def peek(self, close):
+        """(macd, signal, hist) for a not-yet-closed bar at this close."""
+        macd = self.fast.peek(close) - self.slow.peek(close)
+        sig = self.signal.peek(macd)
+        return macd, sig, macd - sig
+
+    def crossover(self, forming_close=None):
+        if forming_close is None:
+            prev, last = self.prev, self.last
+        else:
+            prev, last = self.last, self.peek(forming_close)
+        return _cross(prev[0], prev[1], last[0], last[1])
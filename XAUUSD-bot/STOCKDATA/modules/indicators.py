@@ -3,6 +3,8 @@ import numpy as np
 import math
 import logging
 
+from STOCKDATA.modules.indicator_engine import StreamingEMA, ewm_adjust_false, span_to_alpha
+
 indicators_logger = logging.getLogger(__name__)
 indicators_logger.setLevel(logging.INFO)
 
@@ -13,62 +15,114 @@ if not indicators_logger.handlers:
     indicators_logger.addHandler(console_handler)
     indicators_logger.propagate = False
 
-def calculate_atr(df: pd.DataFrame, period: int = 14) -> float:
+SMOOTHING_MODES = ("ema", "wilder")
+
+def _smoothing_alpha(period: int, smoothing: str) -> float:
+    """'ema' = ewm(span=period) as used so far, 'wilder' = Wilder's RMA (alpha = 1/period)."""
+    if smoothing == "ema":
+        return span_to_alpha(period)
+    if smoothing == "wilder":
+        return 1.0 / period
+    raise ValueError(f"Unknown smoothing '{smoothing}', expected one of {SMOOTHING_MODES}")
+
+def true_range(high, low, close) -> np.ndarray:
+    """
+    True Range per bar from plain arrays.
+    True Range = max[(high - low), abs(high - previous close), abs(low - previous close)]
+    The first bar has no previous close, so its TR is high - low (as pandas' max(axis=1) skipping NaN).
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    tr = high - low
+    prev_close = close[:-1]
+    np.fmax(tr[1:], np.abs(high[1:] - prev_close), out=tr[1:])
+    np.fmax(tr[1:], np.abs(low[1:] - prev_close), out=tr[1:])
+    return tr
+
+def atr_values(high, low, close, period: int = 14, smoothing: str = "ema", full: bool = False):
+    """
+    ATR from NumPy arrays, no DataFrame copies.
+    Returns the last ATR (NaN if undefined), or the whole series when full=True.
+    """
+    tr = true_range(high, low, close)
+    alpha = _smoothing_alpha(period, smoothing)
+    if full:
+        return ewm_adjust_false(tr, alpha, min_periods=period)
+    return StreamingEMA(alpha=alpha, min_periods=period).seed(tr)
+
+def rsi_values(close, period: int = 14, smoothing: str = "ema", full: bool = False):
+    """
+    RSI from a NumPy array of closes.
+    Returns the last RSI (NaN if undefined), or the whole series when full=True
+    (first value NaN, as with Series.diff()).
+    """
+    close = np.asarray(close, dtype=np.float64)
+    delta = np.diff(close)
+    alpha = _smoothing_alpha(period, smoothing)
+    if full:
+        if close.shape[0] == 0:
+            return np.empty(0)
+        avg_gain = ewm_adjust_false(np.maximum(delta, 0.0), alpha, min_periods=period)
+        avg_loss = ewm_adjust_false(-np.minimum(delta, 0.0), alpha, min_periods=period)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rs = avg_gain / np.where(avg_loss == 0, np.nan, avg_loss)
+        rsi = np.empty(delta.shape[0] + 1)
+        rsi[0] = np.nan
+        rsi[1:] = 100 - (100 / (1 + rs))
+        return rsi
+
+    # Last value only: both averages in one pass over plain floats, no temporaries
+    gain_ema = StreamingEMA(alpha=alpha, min_periods=period)
+    loss_ema = StreamingEMA(alpha=alpha, min_periods=period)
+    for d in delta.tolist():
+        gain_ema.update(d if d > 0 else (0.0 if d == d else d))
+        loss_ema.update(-d if d < 0 else (-0.0 if d == d else d))
+    avg_gain, avg_loss = gain_ema.value, loss_ema.value
+    if avg_loss == 0 or math.isnan(avg_loss) or math.isnan(avg_gain):
+        return float("nan")
+    return 100 - (100 / (1 + avg_gain / avg_loss))
+
+def calculate_atr(df: pd.DataFrame, period: int = 14, smoothing: str = "ema", full: bool = False):
     """
     Calculates the Average True Range (ATR).
     ATR = Moving Average of True Range.
     True Range = max[(high - low), abs(high - previous close), abs(low - previous close)]
+    smoothing: "ema" (ewm span=period, the historical default) or "wilder".
+    full=True returns the ATR series aligned with df.index instead of the last value.
     """
+    if full:
+        return pd.Series(atr_values(df['high'].to_numpy(), df['low'].to_numpy(), df['close'].to_numpy(),
+                                    period, smoothing, full=True), index=df.index)
+
     if df.empty or len(df) < period + 1: # Need at least period + 1 candles for ATR
         indicators_logger.warning(f"Not enough data for ATR calculation (need >{period} candles, got {len(df)}). Returning 0.0.")
         return 0.0
 
-    df_copy = df.copy() # Work on a copy to avoid SettingWithCopyWarning
-    
-    # Calculate True Range (TR)
-    high_low = df_copy['high'] - df_copy['low']
-    high_prev_close = np.abs(df_copy['high'] - df_copy['close'].shift())
-    low_prev_close = np.abs(df_copy['low'] - df_copy['close'].shift())
-    
-    # Combine the three components and take the maximum for each row
-    true_range = pd.DataFrame({'high_low': high_low, 
-                               'high_prev_close': high_prev_close, 
-                               'low_prev_close': low_prev_close}).max(axis=1)
-    
-    # Calculate ATR as the simple moving average of True Range
-    atr_series = true_range.ewm(span=period, adjust=False, min_periods=period).mean() # Using EMA for ATR as is common
-    
-    last_atr = atr_series.iloc[-1]
-    
+    last_atr = atr_values(df['high'].to_numpy(), df['low'].to_numpy(), df['close'].to_numpy(), period, smoothing)
+
     if math.isnan(last_atr) or last_atr <= 0:
         indicators_logger.warning(f"Calculated ATR is NaN or non-positive ({last_atr}). Returning 0.0.")
         return 0.0
         
     return last_atr
 
-def calculate_rsi(series: pd.Series, period: int = 14) -> float:
+def calculate_rsi(series: pd.Series, period: int = 14, smoothing: str = "ema", full: bool = False):
     """
     Calculates the Relative Strength Index (RSI).
     RSI = 100 - (100 / (1 + RS))
     RS = Average Gain / Average Loss
+    smoothing: "ema" (ewm span=period, the historical default) or "wilder".
+    full=True returns the RSI series aligned with series.index instead of the last value.
     """
+    if full:
+        return pd.Series(rsi_values(series.to_numpy(), period, smoothing, full=True), index=series.index)
+
     if series.empty or len(series) < period + 1:
         indicators_logger.warning(f"Not enough data for RSI calculation (need >{period} values, got {len(series)}). Returning 50.0 (neutral).")
         return 50.0
 
-    delta = series.diff()
-    gain = delta.clip(lower=0)
-    loss = -delta.clip(upper=0)
-
-    avg_gain = gain.ewm(span=period, adjust=False, min_periods=period).mean()
-    avg_loss = loss.ewm(span=period, adjust=False, min_periods=period).mean()
-
-    # Avoid division by zero
-    rs = avg_gain / avg_loss.replace(0, np.nan) # Replace 0 with NaN to avoid division by zero
-    
-    rsi_series = 100 - (100 / (1 + rs))
-    
-    last_rsi = rsi_series.iloc[-1]
+    last_rsi = rsi_values(series.to_numpy(), period, smoothing)
 
     if math.isnan(last_rsi):
         indicators_logger.warning("Calculated RSI is NaN. Returning 50.0 (neutral).")
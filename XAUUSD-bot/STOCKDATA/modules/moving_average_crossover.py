@@ -11,13 +11,34 @@ pip install MetaTrader5 pandas numpy
 Run: python xauusd_ema_bot.py
 """
 
-import MetaTrader5 as mt5
-import pandas as pd
+import asyncio
 import numpy as np
-import time
 import json
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+
+from STOCKDATA.activity_log import ActivityLog
+from STOCKDATA.async_runtime import AsyncRuntime
+from STOCKDATA.bar_cache import BarCache, rates_to_frame
+from STOCKDATA.bar_store import store_from_env
+from STOCKDATA.broker import get_backend
+from STOCKDATA.data_hub import hub_from_env
+from STOCKDATA.latency import LatencyRecorder, serve_metrics
+from STOCKDATA.log_sink import get_sink
+from STOCKDATA.order_router import OrderRouter, intent_from_request, is_done, result_dict
+from STOCKDATA.perf_stats import DEFAULT_SNAPSHOT, ClosedTradeRecorder, PerfStats, RiskGate
+from STOCKDATA.position_book import PositionBook, PositionReportWriter
+from STOCKDATA.scheduler import BarCloseScheduler
+from STOCKDATA.state_store import open_bot_state
+from STOCKDATA.symbol_cache import SymbolCache, configured_symbols
+from STOCKDATA.tick_stream import TickStream
+from STOCKDATA.trade_archive import refresh_in_background
+from STOCKDATA.trade_journal import TradeJournal
+from STOCKDATA.trade_store import TradeStore
+from STOCKDATA.modules.indicator_engine import EMACrossEngine
+
+# Talk to the shared market-data hub instead of the terminal when STOCKDATA_HUB is set
+mt5 = hub_from_env(get_backend())
 
 # ---------------------------
 # CONFIG (edit as needed)
@@ -37,13 +58,27 @@ CONFIG = {
     "cooldown_seconds": 60 * 3,     # 3 minutes cooldown after placing trade
     "trade_comment": "EMA9-21-M5",
     "log_folder": "logs",
-    "dry_run": False                # if True, won't send real orders (for testing)
+    "dry_run": False,               # if True, won't send real orders (for testing)
+    "bar_close_settle": 1.0,        # seconds after a bar close before re-checking (terminal publishes the bar)
+    "bar_close_jitter": 0.5,        # random extra delay so several bots don't wake at once
+    "log_max_bytes": 5 * 1024 * 1024,  # rotate bot.log at this size
+    "log_backups": 5,               # rotated bot.log files to keep
+    "metrics_port": None,           # serve latency histograms on /metrics (e.g. 9108)
+    "tick_stream": False,           # build bars from ticks and wake on intrabar events (tick_stream.py)
+    "order_budget_seconds": 2.0     # requotes / transient errors are retried within this budget
 }
 
 # Ensure log folder
 os.makedirs(CONFIG["log_folder"], exist_ok=True)
 TRADE_LOG_CSV = os.path.join(CONFIG["log_folder"], "trades.csv")
 RUNTIME_LOG = os.path.join(CONFIG["log_folder"], "bot.log")
+# Buffered background writer: log() and append_trade_log() never wait on the disk
+LOG_SINK = get_sink()
+LOG_SINK.configure(RUNTIME_LOG, max_bytes=CONFIG["log_max_bytes"], backups=CONFIG["log_backups"])
+# Every log() line also becomes an activity event (logs/activity, read by the dashboard)
+ACTIVITY = ActivityLog()
+# Crash-safe record of this bot's order attempts and closed trades (one journal per bot)
+TRADE_JOURNAL = TradeJournal(os.path.join(CONFIG["log_folder"], "journal_ema"), fsync="batch")
 
 # ---------------------------
 # Utilities: logging
@@ -52,13 +87,19 @@ def log(msg):
     ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     line = f"[{ts}] {msg}"
     print(line)
-    with open(RUNTIME_LOG, "a") as f:
-        f.write(line + "\n")
+    LOG_SINK.write(RUNTIME_LOG, line)
+    LOG_SINK.write_event(ACTIVITY, "bot_log", "EMA crossover bot", msg, tag="moving_average_crossover")
 
 def append_trade_log(row: dict):
-    df = pd.DataFrame([row])
-    header = not os.path.exists(TRADE_LOG_CSV)
-    df.to_csv(TRADE_LOG_CSV, mode="a", index=False, header=header)
+    LOG_SINK.write_csv(TRADE_LOG_CSV, row)
+    # Closes (with profit) are journaled by ClosedTradeRecorder
+    try:
+        TRADE_JOURNAL.append({"strategy": "moving_average_crossover", "symbol": row["symbol"], "side": row["signal"],
+                              "lot": row["lot"], "entry_time": row["timestamp"], "entry_price": row["price"],
+                              "sl": row["sl"], "tp": row["tp"], "retcode": row["retcode"],
+                              "comment": row["comment"]})
+    except OSError as e:
+        log(f"Trade journal write failed: {e}")
 
 # ---------------------------
 # MT5 Connection helpers
@@ -66,6 +107,8 @@ def append_trade_log(row: dict):
 def mt5_connect():
     if not mt5.initialize():
         raise RuntimeError(f"MT5 initialize() failed, code={mt5.last_error()}")
+    # Symbol specs for config.json's symbols and this bot's, so the first order skips symbol_info
+    SYMBOLS.preload(configured_symbols([CONFIG["symbol"]]))
     log("MT5 initialized")
 
 def mt5_shutdown():
@@ -75,13 +118,36 @@ def mt5_shutdown():
 # ---------------------------
 # Market data helpers
 # ---------------------------
+# Per-(symbol, timeframe) bar cache shared by get_rates and the main loop
+BAR_CACHE = BarCache(mt5, store=store_from_env())
+# Static symbol spec (point, digits, volume limits); live prices still come from symbol_info_tick
+SYMBOLS = SymbolCache(mt5)
+# One positions_get per loop iteration; this bot's positions are diffed into logs/positions_YYYY-MM-DD.txt
+# (the archive is refreshed once a day rolls over)
+POSITIONS = PositionBook(mt5, max_age=1.0)
+POSITIONS.subscribe(PositionReportWriter(CONFIG["log_folder"], magic=CONFIG["magic"],
+                                         comment_contains=CONFIG["trade_comment"],
+                                         on_new_day=lambda path: refresh_in_background()))
+# Daily limits from config.json's risk_settings over this bot's trades; refuses entries if unreadable
+PERF_STATS = PerfStats(DEFAULT_SNAPSHOT.replace(".json", "_moving_average_crossover.json"))
+RISK_GATE = RiskGate(PERF_STATS)
+POSITIONS.subscribe(ClosedTradeRecorder(mt5, PERF_STATS, "moving_average_crossover", magic=CONFIG["magic"],
+                                        journal=TRADE_JOURNAL))
+# Signal-to-fill spans and slippage (histograms; per-order timings go to the trade store)
+LATENCY = LatencyRecorder()
+# Retcode-aware sends: requotes re-priced, transient errors retried with backoff, within the budget
+ROUTER = OrderRouter(mt5, symbol_cache=SYMBOLS, budget=CONFIG["order_budget_seconds"])
+# Wakes the loop right after each bar close instead of fixed sleeps
+SCHEDULER = BarCloseScheduler(settle=CONFIG["bar_close_settle"], jitter=CONFIG["bar_close_jitter"])
+
+def log_tick_event(event, stream):
+    # Intrabar events from the tick stream (bar closes are handled by the loop itself)
+    if event.type != "bar_close":
+        log(f"Tick event {event.type} {event.symbol} @ {event.price:.5f}: {event.detail}")
+
 def get_rates(symbol, timeframe, n):
-    rates = mt5.copy_rates_from_pos(symbol, timeframe, 0, n)
-    if rates is None:
-        raise RuntimeError(f"Failed to get rates for {symbol}: {mt5.last_error()}")
-    df = pd.DataFrame(rates)
-    df['time'] = pd.to_datetime(df['time'], unit='s')
-    return df
+    # Served from the bar cache: only the newest bars are fetched from the terminal
+    return rates_to_frame(BAR_CACHE.get(symbol, timeframe, n))
 
 def calc_ema(series, period):
     return series.ewm(span=period, adjust=False).mean()
@@ -90,14 +156,14 @@ def calc_ema(series, period):
 # Trading helpers
 # ---------------------------
 def symbol_info_ok(symbol):
-    info = mt5.symbol_info(symbol)
+    info = SYMBOLS.get(symbol, refresh=True)
     if info is None:
         log(f"Symbol {symbol} not found on server")
         return False
     if not info.visible:
         # try to enable
         mt5.symbol_select(symbol, True)
-        info = mt5.symbol_info(symbol)
+        info = SYMBOLS.get(symbol, refresh=True)
         if info is None or not info.visible:
             log(f"Symbol {symbol} not visible and cannot be selected")
             return False
@@ -110,24 +176,14 @@ def get_account_health():
     return {"balance": info.balance, "equity": info.equity, "leverage": info.leverage}
 
 def has_open_trade_for_magic(symbol, magic):
-    orders = mt5.positions_get(symbol=symbol)
-    if orders is None:
-        return False
-    for o in orders:
-        # Some brokers don't expose magic; compare comment or ticket if necessary.
-        try:
-            if int(o.magic) == magic:
-                return True
-        except Exception:
-            # fallback to comment match
-            if CONFIG["trade_comment"] in o.comment:
-                return True
-    return False
+    # Indexed lookup in the per-cycle positions snapshot; positions without a
+    # usable magic (some brokers) fall back to matching the trade comment
+    return POSITIONS.has(symbol, magic=magic, comment_contains=CONFIG["trade_comment"])
 
-def place_order(symbol, order_type, volume, sl_price, tp_price):
+async def place_order(rt, symbol, order_type, volume, sl_price, tp_price):
     # order_type: "buy" or "sell"
     deviation = 20
-    tick = mt5.symbol_info_tick(symbol)
+    tick = await rt.mt5.symbol_info_tick(symbol)
     if tick is None:
         return {"retcode": -1, "comment": "no_tick"}
 
@@ -157,22 +213,29 @@ def place_order(symbol, order_type, volume, sl_price, tp_price):
         log("DRY RUN - order not sent")
         return fake
 
-    result = mt5.order_send(request)
-    if result is None:
-        log(f"Order send returned None: {mt5.last_error()}")
-        return {"retcode": -1, "comment": "order_send_none"}
-    log(f"Order send result: retcode={result.retcode}, comment={getattr(result, 'comment', '')}")
-    return result._asdict() if hasattr(result, "_asdict") else result
+    # Routed on the router's own thread: its terminal calls go to the MT5 thread
+    # (ROUTER.terminal), its backoff waits do not hold that thread up
+    intent = intent_from_request(request, strategy="moving_average_crossover")
+    routed = await asyncio.wrap_future(ROUTER.submit(intent))
+    log(f"Order send result: retcode={routed.retcode} ({routed.outcome}), attempts={routed.attempts}, "
+        f"history={routed.history}")
+    return result_dict(routed.result) or {"retcode": routed.retcode, "comment": routed.outcome}
 
 # ---------------------------
 # Signal logic: EMA crossover
 # ---------------------------
-def check_for_signal(df):
+def check_for_signal(df, engine=None):
     """
     df expected to have 'close' column and be in chronological order
     We compute EMA9 and EMA21 and look for crossover on the last completed candle.
+    If an EMACrossEngine is passed, only bars newer than the last one it saw are
+    consumed (df then also needs 'time'); otherwise the EMAs are recomputed.
     Returns: "buy", "sell", or None
     """
+    if engine is not None:
+        engine.update(df['time'], df['close'])
+        return engine.crossover()
+
     df = df.copy()
     df['ema9'] = calc_ema(df['close'], CONFIG['ema_fast'])
     df['ema21'] = calc_ema(df['close'], CONFIG['ema_slow'])
@@ -194,133 +257,235 @@ def check_for_signal(df):
 # ---------------------------
 def points_to_price(symbol, price, points):
     """Convert points to price value depending on symbol point size"""
-    info = mt5.symbol_info(symbol)
+    info = SYMBOLS.get(symbol)
     if info is None:
         raise RuntimeError("Symbol info not available for point conversion")
     point = info.point
     return price + points * point
 
+def sl_tp_prices(signal, price, point, config=CONFIG):
+    """SL/TP prices for an entry at price, sl_points / tp_points away (shared with the backtester)"""
+    if signal == "buy":
+        return price - config['sl_points'] * point, price + config['tp_points'] * point
+    return price + config['sl_points'] * point, price - config['tp_points'] * point
+
 # ---------------------------
 # Main loop
 # ---------------------------
-def main_loop():
-    last_trade_time = None
-
+async def run_loop(rt):
+    """
+    The strategy loop on the async runtime: terminal calls run on the MT5 thread,
+    the signal check on the compute thread, and trade log / store writes are
+    handed to the background so the next order never waits on the disk.
+    """
     symbol = CONFIG["symbol"]
-    if not symbol_info_ok(symbol):
+    if not await rt.mt5.run(symbol_info_ok, symbol):
         log("Symbol check failed, exiting")
         return
 
+    if CONFIG['metrics_port']:
+        serve_metrics(LATENCY, CONFIG['metrics_port'])
+    trade_store = TradeStore()
+    # Cooldown and the last traded candle survive a restart (legacy JSON state is imported once)
+    state = open_bot_state("moving_average_crossover")
+    trade_times = state.table("last_trade_times")
+    traded_candles = state.table("last_executed_candle")
+    state_key = (symbol, "moving_average_crossover")
+    try:
+        last_trade_time = datetime.fromisoformat(trade_times[state_key]) if state_key in trade_times else None
+    except (TypeError, ValueError):
+        last_trade_time = None
+
+    # Tick mode: a bar counts as closed on the first tick of the next one, and a
+    # spread spike is waited out only until it normalises
+    waiter = SCHEDULER
+    if CONFIG['tick_stream']:
+        waiter = TickStream(mt5, [symbol], timeframes=(CONFIG['timeframe'],),
+                            max_spread_points=CONFIG['max_spread_points'], symbol_cache=SYMBOLS)
+        waiter.subscribe(log_tick_event)
+        # Start from the cached history: bars and the stop-hunt range are complete from the first tick
+        waiter.seed(symbol, CONFIG['timeframe'],
+                    await rt.mt5.run(BAR_CACHE.get, symbol, CONFIG['timeframe'], CONFIG['lookback']))
+    # A stop hunt re-runs the entry checks before the close (an entry skipped for spread,
+    # cooldown or an open position gets another chance; still one entry per candle)
+    wake_on = ("stop_hunt_high", "stop_hunt_low") if CONFIG['tick_stream'] else ()
+
+    async def wait_for_close():
+        if CONFIG['tick_stream']:
+            # The stream polls the terminal for ticks, so it waits on the MT5 thread
+            await rt.mt5.run(waiter.sleep_until_close, CONFIG['timeframe'], wake_on)
+        else:
+            await asyncio.sleep(SCHEDULER.delay_until_close(CONFIG['timeframe']))
+
+    # Seeded on the first closed window, then advanced one bar at a time
+    ema_engine = EMACrossEngine(CONFIG['ema_fast'], CONFIG['ema_slow'])
+
     log("Starting main loop. Fetching historical data and waiting for signals...")
-    while True:
-        try:
-            # Basic account health check
-            acc = get_account_health()
-            if acc['equity'] < CONFIG['min_equity']:
-                log(f"Equity too low ({acc['equity']}). Sleeping 60s.")
-                time.sleep(60)
-                continue
-
-            # Fetch data
-            df = get_rates(symbol, CONFIG['timeframe'], CONFIG['lookback'])
-            if df.shape[0] < CONFIG['lookback']:
-                log("Not enough bars fetched, sleeping 10s.")
-                time.sleep(10)
-                continue
-
-            # Spread check
-            info = mt5.symbol_info(symbol)
-            tick = mt5.symbol_info_tick(symbol)
-            if tick is None or info is None:
-                log("Tick or symbol info missing, retrying.")
-                time.sleep(5)
-                continue
-            spread_points = abs(tick.ask - tick.bid) / info.point
-            if spread_points > CONFIG['max_spread_points']:
-                log(f"Spread too high: {spread_points} points (max {CONFIG['max_spread_points']}). Sleeping 30s.")
-                time.sleep(30)
-                continue
-
-            # Check for signal on last completed candle (exclude in-progress candle)
-            # We will use df up to second-last bar to ensure candle closed
-            df_for_signal = df.iloc[:-1].copy()  # last closed candle is at -2 index; slicing ensures we use closed candles
-            signal = check_for_signal(df_for_signal)
-
-            if signal is None:
-                # no entry
-                # optionally print EMAs for debugging
-                e9 = calc_ema(df['close'], CONFIG['ema_fast']).iloc[-1]
-                e21 = calc_ema(df['close'], CONFIG['ema_slow']).iloc[-1]
-                log(f"No signal. EMA9={e9:.3f}, EMA21={e21:.3f}. Sleeping 20s.")
-                time.sleep(20)
-                continue
-
-            # Cooldown and duplicate checks
-            now = datetime.now()
-            if last_trade_time:
-                if (now - last_trade_time).total_seconds() < CONFIG['cooldown_seconds']:
-                    log("Recently traded. Still in cooldown. Skipping this signal.")
-                    time.sleep(10)
+    try:
+        while True:
+            try:
+                # Snapshot positions once per cycle (feeds the duplicate check and the positions report)
+                await rt.mt5.run(POSITIONS.refresh)
+                trace = LATENCY.trace(symbol, "moving_average_crossover")
+                # Basic account health check
+                acc = await rt.mt5.run(get_account_health)
+                if acc['equity'] < CONFIG['min_equity']:
+                    log(f"Equity too low ({acc['equity']}). Sleeping 60s.")
+                    await asyncio.sleep(60)
+                    continue
+
+                # Fetch data (zero-copy view of the bar cache)
+                with trace.span("bar_fetch"):
+                    if CONFIG['tick_stream']:
+                        # Bars built from the stream's ticks: the closed bar is there as soon as the close is seen
+                        rates = waiter.rates(symbol, CONFIG['timeframe'], CONFIG['lookback'])
+                    else:
+                        # Right after a close the terminal may not have the new bar yet; re-poll until it does
+                        rates = await SCHEDULER.fresh_bars_async(
+                            symbol, CONFIG['timeframe'],
+                            lambda: rt.mt5.run(BAR_CACHE.get, symbol, CONFIG['timeframe'], CONFIG['lookback']))
+                if rates.shape[0] < CONFIG['lookback']:
+                    log("Not enough bars fetched, sleeping 10s.")
+                    await asyncio.sleep(10)
                     continue
 
-            if has_open_trade_for_magic(symbol, CONFIG['magic']):
-                log("Existing open trade for this bot/magic exists. Skipping new entry.")
-                time.sleep(10)
-                continue
-
-            # Prepare order params
-            # Use current tick to compute SL/TP from price
-            tick = mt5.symbol_info_tick(symbol)
-            price = tick.ask if signal == "buy" else tick.bid
-            info = mt5.symbol_info(symbol)
-            point = info.point
-
-            # Calculate SL and TP price (1:1)
-            if signal == "buy":
-                sl_price = price - CONFIG['sl_points'] * point
-                tp_price = price + CONFIG['tp_points'] * point
-            else:
-                sl_price = price + CONFIG['sl_points'] * point
-                tp_price = price - CONFIG['tp_points'] * point
-
-            # Additional check: SL/TP reasonable (not beyond limits)
-            # Use symbol_info to check min/max deviation; many brokers have limits but skipping complex checks here.
-
-            # Place order
-            log(f"Signal: {signal.upper()} - placing order at price {price:.5f} SL={sl_price:.5f} TP={tp_price:.5f}")
-            result = place_order(symbol, signal, CONFIG['lot'], sl_price, tp_price)
-
-            # Record trade attempt
-            trade_row = {
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "symbol": symbol,
-                "signal": signal,
-                "price": price,
-                "sl": sl_price,
-                "tp": tp_price,
-                "lot": CONFIG['lot'],
-                "retcode": getattr(result, "retcode", result.get("retcode") if isinstance(result, dict) else "unknown"),
-                "comment": getattr(result, "comment", result.get("comment") if isinstance(result, dict) else ""),
-            }
-            append_trade_log(trade_row)
-
-            # If order placed (retcode 10009 or similar success codes vary by broker), set last_trade_time
-            rc = trade_row["retcode"]
-            if rc in (10009, 10004, 0, 100):  # include commonly used success-ish codes; depends on broker/API
-                last_trade_time = datetime.now()
-                log(f"Order presumed placed successfully. retcode={rc}")
-            else:
-                log(f"Order may have failed or partial. retcode={rc}, comment={trade_row['comment']}")
-
-            # wait a bit before next loop
-            time.sleep(5)
-
-        except KeyboardInterrupt:
-            log("KeyboardInterrupt received. Exiting loop.")
-            break
-        except Exception as e:
-            log(f"Exception in main loop: {e}")
-            time.sleep(5)
+                # Spread check
+                # Served from memory; run on the MT5 thread only because a TTL expiry reloads from the terminal
+                info = await rt.mt5.run(SYMBOLS.get, symbol)
+                tick = await rt.mt5.symbol_info_tick(symbol)
+                if tick is None or info is None:
+                    log("Tick or symbol info missing, retrying.")
+                    await asyncio.sleep(5)
+                    continue
+                spread_points = abs(tick.ask - tick.bid) / info.point
+                if spread_points > CONFIG['max_spread_points']:
+                    log(f"Spread too high: {spread_points} points (max {CONFIG['max_spread_points']}). Waiting up to 30s.")
+                    if CONFIG['tick_stream']:
+                        await rt.mt5.run(waiter.wait_for, ("spread_normal",), timeout=30, symbol=symbol)
+                    else:
+                        await asyncio.sleep(30)
+                    continue
+
+                # Check for signal on last completed candle (exclude in-progress candle)
+                # We will use rates up to second-last bar to ensure candle closed
+                rates_for_signal = rates[:-1]  # last closed candle is at -2 index; slicing ensures we use closed candles
+                with trace.span("indicators"):
+                    signal = await rt.compute(check_for_signal, rates_for_signal, ema_engine)
+
+                if signal is None:
+                    # no entry
+                    # optionally print EMAs for debugging (includes the in-progress candle)
+                    e9, e21 = ema_engine.peek(rates['close'][-1])
+                    log(f"No signal. EMA9={e9:.3f}, EMA21={e21:.3f}. Waiting for next bar close.")
+                    await wait_for_close()
+                    continue
+
+                # One entry per candle, also across a restart
+                candle = datetime.fromtimestamp(int(rates_for_signal['time'][-1]), timezone.utc).isoformat()
+                if traded_candles.get(state_key) == candle:
+                    log("Already traded on this candle. Skipping.")
+                    await wait_for_close()
+                    continue
+
+                # Cooldown and duplicate checks
+                now = datetime.now()
+                if last_trade_time:
+                    if (now - last_trade_time).total_seconds() < CONFIG['cooldown_seconds']:
+                        log("Recently traded. Still in cooldown. Skipping this signal.")
+                        await wait_for_close()
+                        continue
+
+                with trace.span("risk_checks"):
+                    duplicate = await rt.mt5.run(has_open_trade_for_magic, symbol, CONFIG['magic'])
+                if duplicate:
+                    log("Existing open trade for this bot/magic exists. Skipping new entry.")
+                    await wait_for_close()
+                    continue
+
+                allowed, reason = RISK_GATE.check()
+                if not allowed:
+                    log(f"Risk gate: {reason}. Skipping entry.")
+                    await wait_for_close()
+                    continue
+
+                # Prepare order params
+                # Use current tick to compute SL/TP from price
+                tick = await rt.mt5.symbol_info_tick(symbol)
+                price = tick.ask if signal == "buy" else tick.bid
+                info = await rt.mt5.run(SYMBOLS.get, symbol)
+                point = info.point
+
+                # Calculate SL and TP price (1:1)
+                sl_price, tp_price = sl_tp_prices(signal, price, point)
+
+                # Additional check: SL/TP reasonable (not beyond limits)
+                # Use symbol_info to check min/max deviation; many brokers have limits but skipping complex checks here.
+
+                # Place order
+                log(f"Signal: {signal.upper()} - placing order at price {price:.5f} SL={sl_price:.5f} TP={tp_price:.5f}")
+                with trace.span("order_send"):
+                    result = await place_order(rt, symbol, signal, CONFIG['lot'], sl_price, tp_price)
+
+                # Record trade attempt
+                trade_row = {
+                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "symbol": symbol,
+                    "signal": signal,
+                    "price": price,
+                    "sl": sl_price,
+                    "tp": tp_price,
+                    "lot": CONFIG['lot'],
+                    "retcode": getattr(result, "retcode", result.get("retcode") if isinstance(result, dict) else "unknown"),
+                    "comment": getattr(result, "comment", result.get("comment") if isinstance(result, dict) else ""),
+                }
+                rt.background.submit(append_trade_log, trade_row)
+
+                # Retcode classes from the router: placed / done / partial count, a requote does not
+                rc = trade_row["retcode"]
+                if is_done(rc) and CONFIG['dry_run']:
+                    # The fake fill opens nothing: keep it out of the daily risk counts and the trade store
+                    last_trade_time = datetime.now()
+                    log("Dry-run order, not recorded.")
+                elif is_done(rc):
+                    last_trade_time = datetime.now()
+                    PERF_STATS.record_open("moving_average_crossover", symbol)
+                    log(f"Order presumed placed successfully. retcode={rc}")
+                    with trace.span("fill_confirm"):
+                        await rt.mt5.run(POSITIONS.refresh)
+                    slippage = trace.order_result(signal, price, result, point)
+                    trace.finish(store=trade_store, timestamp=trade_row["timestamp"], trade_type=signal.upper(),
+                                 lot_size=CONFIG['lot'], stop_loss=sl_price, take_profit=tp_price,
+                                 comment=CONFIG['trade_comment'])
+                    rt.background.submit(trade_store.flush)
+                    log(f"Fill latency={trace.latency}s, slippage={slippage}")
+                else:
+                    log(f"Order may have failed or partial. retcode={rc}, comment={trade_row['comment']}")
+                if is_done(rc):
+                    trade_times[state_key] = last_trade_time.isoformat()
+                    traded_candles[state_key] = candle
+                    rt.background.submit(state.flush)
+
+                # signals only change on a bar close
+                await wait_for_close()
+
+            except Exception as e:
+                log(f"Exception in main loop: {e}")
+                await asyncio.sleep(5)
+    finally:
+        if CONFIG['tick_stream']:
+            waiter.stop()  # lets a wait in progress on the MT5 thread return
+        rt.background.join()  # queued store writes land before the state is closed
+        state.close()
+
+def main_loop():
+    rt = AsyncRuntime(mt5)
+    ROUTER.terminal = rt.mt5.call
+    try:
+        rt.run(run_loop(rt))
+    except KeyboardInterrupt:
+        log("KeyboardInterrupt received. Exiting loop.")
+    finally:
+        ROUTER.terminal = None
 
 # ---------------------------
 # Quick sanity function: test indicators on recent bars
@@ -341,6 +506,8 @@ if __name__ == "__main__":
     try:
         log("=== EMA9-21 M5 Bot Starting ===")
         mt5_connect()
+        # Fold the trade logs and position reports into trades/archive if they changed
+        refresh_in_background()
         debug_print_emas(CONFIG["symbol"], CONFIG["timeframe"], lookback=60)
         main_loop()
     except Exception as e:
@@ -350,4 +517,7 @@ if __name__ == "__main__":
             mt5_shutdown()
         except Exception:
             pass
+        TRADE_JOURNAL.close()
+        LOG_SINK.flush()
+        ACTIVITY.close()
         log("Bot stopped.")
@@ -1,9 +1,16 @@
-import MetaTrader5 as mt5
-import pandas as pd
 from datetime import datetime, timezone
 import logging
 
+from STOCKDATA.bar_cache import BarCache, rates_to_frame
+from STOCKDATA.bar_store import store_from_env
+from STOCKDATA.broker import get_backend
+from STOCKDATA.position_book import PositionBook
+
+mt5 = get_backend()
 logger = logging.getLogger("mt5_utils")
+_bar_cache = BarCache(mt5, store=store_from_env())
+# One positions_get per cycle shared by every caller of safe_positions_get
+_position_book = PositionBook(mt5, max_age=1.0)
 
 def is_mt5_connected():
     try:
@@ -13,18 +20,25 @@ def is_mt5_connected():
         logger.error(f"MT5 connection check failed: {str(e)}")
         return False
 
-def safe_positions_get(*args, **kwargs):
-    if not is_mt5_connected():
-        logger.error("MT5 not connected. Cannot fetch positions.")
-        return None
-    try:
-        positions = mt5.positions_get(*args, **kwargs)
-        if positions is None:
-            logger.error("MT5 returned None for positions_get()")
-        return positions
-    except Exception as e:
-        logger.error(f"Exception in positions_get: {str(e)}")
+def safe_positions_get(symbol=None, ticket=None, **kwargs):
+    if kwargs:
+        # group= and other terminal-side filters are not indexed by the book
+        try:
+            positions = mt5.positions_get(**kwargs)
+            if positions is None:
+                logger.error(f"MT5 returned None for positions_get(): {mt5.last_error()}")
+            return positions
+        except Exception as e:
+            logger.error(f"Exception in positions_get: {str(e)}")
+            return None
+    positions = _position_book.positions(symbol=symbol)
+    if not _position_book.ok:
+        # A failed positions_get doubles as the connection check (no separate account_info call)
+        logger.error(f"MT5 returned None for positions_get(): {mt5.last_error()}")
         return None
+    if ticket is not None:
+        return tuple(p for p in positions if p.ticket == ticket)
+    return positions
 
 def connect_to_mt5():
     # Removed mt5.initialize() call. Assume MT5 is already initialized by main bot.
@@ -41,12 +55,15 @@ def fetch_data():
     timeframe = mt5.TIMEFRAME_M15
     utc_to = datetime.now(timezone.utc)
     logging.info(f"Fetching data for {symbol}, timeframe={timeframe}, utc_to={utc_to}, bars=100")
-    rates = mt5.copy_rates_from(symbol, timeframe, utc_to, 100)
+    try:
+        # Latest 100 bars up to now, served from the bar cache (delta fetch)
+        rates = _bar_cache.get(symbol, timeframe, 100)
+    except RuntimeError:
+        rates = None
     if rates is None or len(rates) == 0:
         logging.error(f"No data fetched for {symbol}. MT5 error: {mt5.last_error()}")
         return None
-    df = pd.DataFrame(rates)
-    df['time'] = pd.to_datetime(df['time'], unit='s', utc=True)
+    df = rates_to_frame(rates, utc=True)
     logging.info(f"Data fetched: rows={len(df)}, columns={list(df.columns)}")
     return df
 
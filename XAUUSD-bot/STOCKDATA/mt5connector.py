@@ -1,4 +1,6 @@
-import MetaTrader5 as mt5
+from STOCKDATA.broker import get_backend
+
+mt5 = get_backend()
 
 # ==== Fill your credentials here ====
 account = 12345678                         # 🔑 Your MT5 account number (int)
@@ -0,0 +1,132 @@
+"""
+offline_mt5.py
+Stand-in for the MetaTrader5 package where it cannot be installed (Linux, CI).
+
+It carries the constants the bots use, with the values of the real package, so
+strategy modules import and their CONFIGs resolve; every terminal call fails the
+way a disconnected terminal does (initialize() is False, data calls return None).
+Backtests and offline tools only use the constants and the pure signal code.
+"""
+
+import logging
+
+logger = logging.getLogger("offline_mt5")
+
+OFFLINE = True
+
+TIMEFRAME_M1 = 1
+TIMEFRAME_M2 = 2
+TIMEFRAME_M3 = 3
+TIMEFRAME_M4 = 4
+TIMEFRAME_M5 = 5
+TIMEFRAME_M6 = 6
+TIMEFRAME_M10 = 10
+TIMEFRAME_M12 = 12
+TIMEFRAME_M15 = 15
+TIMEFRAME_M20 = 20
+TIMEFRAME_M30 = 30
+TIMEFRAME_H1 = 0x4000 | 1
+TIMEFRAME_H2 = 0x4000 | 2
+TIMEFRAME_H3 = 0x4000 | 3
+TIMEFRAME_H4 = 0x4000 | 4
+TIMEFRAME_H6 = 0x4000 | 6
+TIMEFRAME_H8 = 0x4000 | 8
+TIMEFRAME_H12 = 0x4000 | 12
+TIMEFRAME_D1 = 0x4000 | 24
+TIMEFRAME_W1 = 0x8000 | 1
+TIMEFRAME_MN1 = 0xC000 | 1
+
+ORDER_TYPE_BUY = 0
+ORDER_TYPE_SELL = 1
+ORDER_TYPE_BUY_LIMIT = 2
+ORDER_TYPE_SELL_LIMIT = 3
+ORDER_TYPE_BUY_STOP = 4
+ORDER_TYPE_SELL_STOP = 5
+
+POSITION_TYPE_BUY = 0
+POSITION_TYPE_SELL = 1
+
+TRADE_ACTION_DEAL = 1
+TRADE_ACTION_PENDING = 5
+TRADE_ACTION_SLTP = 6
+TRADE_ACTION_MODIFY = 7
+TRADE_ACTION_REMOVE = 8
+TRADE_ACTION_CLOSE_BY = 10
+
+ORDER_FILLING_FOK = 0
+ORDER_FILLING_IOC = 1
+ORDER_FILLING_RETURN = 2
+
+ORDER_TIME_GTC = 0
+ORDER_TIME_DAY = 1
+
+COPY_TICKS_ALL = -1
+COPY_TICKS_INFO = 1
+COPY_TICKS_TRADE = 2
+
+TRADE_RETCODE_REQUOTE = 10004
+TRADE_RETCODE_REJECT = 10006
+TRADE_RETCODE_CANCEL = 10007
+TRADE_RETCODE_PLACED = 10008
+TRADE_RETCODE_DONE = 10009
+TRADE_RETCODE_DONE_PARTIAL = 10010
+TRADE_RETCODE_ERROR = 10011
+TRADE_RETCODE_TIMEOUT = 10012
+TRADE_RETCODE_INVALID = 10013
+TRADE_RETCODE_INVALID_VOLUME = 10014
+TRADE_RETCODE_INVALID_PRICE = 10015
+TRADE_RETCODE_INVALID_STOPS = 10016
+TRADE_RETCODE_TRADE_DISABLED = 10017
+TRADE_RETCODE_MARKET_CLOSED = 10018
+TRADE_RETCODE_NO_MONEY = 10019
+TRADE_RETCODE_PRICE_CHANGED = 10020
+TRADE_RETCODE_PRICE_OFF = 10021
+TRADE_RETCODE_INVALID_EXPIRATION = 10022
+TRADE_RETCODE_ORDER_CHANGED = 10023
+TRADE_RETCODE_TOO_MANY_REQUESTS = 10024
+TRADE_RETCODE_NO_CHANGES = 10025
+TRADE_RETCODE_SERVER_DISABLES_AT = 10026
+TRADE_RETCODE_CLIENT_DISABLES_AT = 10027
+TRADE_RETCODE_LOCKED = 10028
+TRADE_RETCODE_FROZEN = 10029
+TRADE_RETCODE_INVALID_FILL = 10030
+TRADE_RETCODE_CONNECTION = 10031
+TRADE_RETCODE_ONLY_REAL = 10032
+TRADE_RETCODE_LIMIT_ORDERS = 10033
+TRADE_RETCODE_LIMIT_VOLUME = 10034
+TRADE_RETCODE_INVALID_ORDER = 10035
+TRADE_RETCODE_POSITION_CLOSED = 10036
+
+_ERROR = (-10003, "MetaTrader5 package not installed (offline mode)")
+
+
+def initialize(*args, **kwargs):
+    logger.warning("MetaTrader5 is not installed; running offline")
+    return False
+
+
+def login(*args, **kwargs):
+    return False
+
+
+def shutdown():
+    return True
+
+
+def last_error():
+    return _ERROR
+
+
+def _unavailable(*args, **kwargs):
+    return None
+
+
+terminal_info = account_info = symbol_info = symbol_info_tick = _unavailable
+symbols_get = positions_get = orders_get = history_deals_get = history_orders_get = _unavailable
+copy_rates_from = copy_rates_from_pos = copy_rates_range = _unavailable
+copy_ticks_from = copy_ticks_range = _unavailable
+order_send = order_check = order_calc_margin = order_calc_profit = _unavailable
+
+
+def symbol_select(symbol, enable=True):
+    return False
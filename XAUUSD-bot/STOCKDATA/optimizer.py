@@ -0,0 +1,239 @@
+"""
+optimizer.py
+Parameter sweep with walk-forward out-of-sample scoring, run across cores.
+
+The price history is loaded once and placed in shared memory together with one
+EMA series per distinct span in the grid (all spans smoothed in a single
+stacked ewm_rows pass), so grid points that share a span share its EMA and
+workers never recompute it.  Work is split by signal parameters: a worker
+derives the crossover signals for one (fast, slow) pair - for MACD, all signal
+spans of that pair in one more stacked pass - and then runs every trade-side
+combination (sl_points, tp_points, cooldown_seconds, ...) through
+backtest.simulate_trades, the same fill and SL/TP code as a single backtest.
+
+Walk-forward: the history is cut into rolling train/test windows.  Each
+combination is simulated once over the whole history and its trades are
+attributed to windows by entry bar.  Per fold the combination with the best
+in-sample objective is selected and scored on the following test window;
+every combination also gets its stitched out-of-sample metrics.
+
+    grid = {"ema_fast": [5, 9, 12], "ema_slow": [21, 34, 55],
+            "sl_points": [150, 200, 300], "tp_points": [150, 200, 300]}
+    result = sweep(load_rates("XAUUSD_M5.csv"), "moving_average_crossover", grid)
+    print(result.to_frame().sort_values("oos_net_profit").tail())
+"""
+
+import functools
+import importlib
+import itertools
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from STOCKDATA.backtest import STRATEGIES, FillModel, simulate_trades, trade_metrics
+from STOCKDATA.bar_cache import RATES_DTYPE
+from STOCKDATA.modules.batch_indicators import ewm_rows
+from STOCKDATA.modules.indicator_engine import span_to_alpha
+
+logger = logging.getLogger("optimizer")
+
+# Parameters that change the signal; everything else only changes trade handling
+SIGNAL_PARAMS = {
+    "moving_average_crossover": ("ema_fast", "ema_slow"),
+    "macd": ("macd_fast", "macd_slow", "macd_signal"),
+}
+OBJECTIVES = ("net_profit", "profit_factor", "avg_trade", "win_rate")
+
+
+def expand_grid(grid):
+    """{param: [values]} -> list of parameter dicts (cartesian product)."""
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def walk_forward_windows(n, folds=5, train_ratio=3):
+    """
+    Rolling (train_start, train_end, test_end) bar indices: the history is cut into
+    folds + train_ratio equal blocks, each fold trains on train_ratio blocks and
+    tests on the next one.
+    """
+    block = n // (folds + train_ratio)
+    if block < 1:
+        raise ValueError(f"{n} bars is too short for {folds} folds")
+    return [(f * block, (f + train_ratio) * block, (f + train_ratio + 1) * block) for f in range(folds)]
+
+
+# ----------------------------------------------------------------------
+# Shared arrays
+# ----------------------------------------------------------------------
+def _share(array):
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm
+
+
+_attached = {}
+
+
+def _view(name, dtype, shape):
+    """Read-only view of a shared block, attached once per worker process."""
+    if name not in _attached:
+        _attached[name] = shared_memory.SharedMemory(name=name)
+    arr = np.ndarray(shape, dtype=dtype, buffer=_attached[name].buf)
+    arr.flags.writeable = False
+    return arr
+
+
+# ----------------------------------------------------------------------
+# Worker
+# ----------------------------------------------------------------------
+def _crossover(fast, slow, warmup):
+    """Per-bar signals as backtest.strategy_signals produces them (cross on the last two closed bars)."""
+    signals = np.zeros(fast.shape[-1], dtype=np.int8)
+    prev_f, prev_s, last_f, last_s = fast[:-1], slow[:-1], fast[1:], slow[1:]
+    # a cross between closed bars j-1 and j trades at bar j+1's open
+    signals[2:][((prev_f < prev_s) & (last_f > last_s))[:-1]] = 1
+    signals[2:][((prev_f > prev_s) & (last_f < last_s))[:-1]] = -1
+    signals[:warmup] = 0
+    return signals
+
+
+def _evaluate_group(job):
+    (rates_ref, ema_ref, span_rows, strategy, signal_key, trade_combos,
+     windows, point, contract_size, fill, intrabar, warmup) = job
+    rates = _view(*rates_ref)
+    emas = _view(*ema_ref)
+    module = importlib.import_module(STRATEGIES[strategy][0])
+    times = rates["time"]
+
+    if strategy == "macd":
+        fast, slow = signal_key
+        macd = emas[span_rows[fast]] - emas[span_rows[slow]]
+        signal_spans = sorted({c["macd_signal"] for c in trade_combos})
+        lines = ewm_rows(np.broadcast_to(macd, (len(signal_spans), macd.shape[0])),
+                         [span_to_alpha(s) for s in signal_spans])
+        signal_sets = {s: _crossover(macd, lines[i], warmup) for i, s in enumerate(signal_spans)}
+        signals_for = lambda combo: signal_sets[combo["macd_signal"]]
+    else:
+        fast, slow = signal_key
+        signals = _crossover(emas[span_rows[fast]], emas[span_rows[slow]], warmup)
+        signals_for = lambda combo: signals
+
+    test_starts = np.array([w[1] for w in windows])
+    test_ends = np.array([w[2] for w in windows])
+    out = []
+    for combo in trade_combos:
+        cfg = dict(module.CONFIG, **combo)
+        sl_tp = functools.partial(module.sl_tp_prices, config=cfg)
+        trades = simulate_trades(rates, signals_for(combo), sl_tp, cfg, point, contract_size, fill, intrabar)
+        entry_bar = np.searchsorted(times, trades["entry_time"])
+        folds = []
+        for train_start, train_end, test_end in windows:
+            train = trades[(entry_bar >= train_start) & (entry_bar < train_end)]
+            test = trades[(entry_bar >= train_end) & (entry_bar < test_end)]
+            folds.append((trade_metrics(train), trade_metrics(test)))
+        in_oos = ((entry_bar[:, None] >= test_starts) & (entry_bar[:, None] < test_ends)).any(axis=1)
+        out.append((combo, folds, trade_metrics(trades[in_oos]), trade_metrics(trades)))
+    return out
+
+
+# ----------------------------------------------------------------------
+# Sweep
+# ----------------------------------------------------------------------
+class SweepResult:
+    """
+    rows: one dict per combination - its parameters, oos_* (stitched out-of-sample),
+    is_* (mean over training windows) and full_* (whole history) metrics.
+    selected: per fold, the combination with the best in-sample objective and its
+    out-of-sample metrics; walk_forward: those test windows stitched together.
+    """
+
+    def __init__(self, strategy, objective, windows, rows, selected, elapsed):
+        self.strategy = strategy
+        self.objective = objective
+        self.windows = windows
+        self.rows = rows
+        self.selected = selected
+        self.elapsed = elapsed
+
+    @property
+    def walk_forward(self):
+        tests = [s["oos"] for s in self.selected]
+        return {
+            "trades": sum(t["trades"] for t in tests),
+            "net_profit": sum(t["net_profit"] for t in tests),
+            "folds_profitable": sum(t["net_profit"] > 0 for t in tests),
+            "folds": len(tests),
+        }
+
+    def to_frame(self):
+        return pd.DataFrame(self.rows)
+
+
+def sweep(rates, strategy, grid, folds=5, train_ratio=3, objective="net_profit", point=0.01,
+          contract_size=100.0, fill=None, intrabar="sl_first", warmup=50, max_workers=None):
+    """
+    Evaluate every combination of grid (values not in the grid come from the
+    strategy's CONFIG) with walk-forward scoring.  Returns a SweepResult.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"objective must be one of {OBJECTIVES}")
+    t0 = time.perf_counter()
+    module = importlib.import_module(STRATEGIES[strategy][0])
+    signal_params = SIGNAL_PARAMS[strategy]
+    combos = [c for c in expand_grid(grid)
+              if dict(module.CONFIG, **c)[signal_params[0]] < dict(module.CONFIG, **c)[signal_params[1]]]
+    if not combos:
+        raise ValueError("grid has no combination with fast < slow")
+    windows = walk_forward_windows(len(rates), folds, train_ratio)
+
+    # One EMA per distinct span, all smoothed in one stacked pass
+    groups = {}
+    for combo in combos:
+        cfg = dict(module.CONFIG, **combo)
+        groups.setdefault((cfg[signal_params[0]], cfg[signal_params[1]]), []).append(
+            dict(combo, **{p: cfg[p] for p in signal_params}))
+    spans = sorted({s for key in groups for s in key})
+    span_rows = {s: i for i, s in enumerate(spans)}
+    close = np.ascontiguousarray(rates["close"], dtype=np.float64)
+    emas = ewm_rows(np.broadcast_to(close, (len(spans), close.shape[0])), [span_to_alpha(s) for s in spans])
+    logger.info(f"{len(combos)} combinations, {len(groups)} signal groups, {len(spans)} EMA spans "
+                f"({time.perf_counter() - t0:.2f}s to precompute)")
+
+    rates = np.ascontiguousarray(rates, dtype=RATES_DTYPE)
+    rates_shm, ema_shm = _share(rates), _share(emas)
+    max_workers = max_workers or os.cpu_count() or 1
+    # Several jobs per worker so a few large signal groups don't leave cores idle
+    per_job = max(1, -(-len(combos) // (max_workers * 4)))
+    try:
+        jobs = [((rates_shm.name, RATES_DTYPE, rates.shape), (ema_shm.name, emas.dtype, emas.shape),
+                 span_rows, strategy, key, group[i:i + per_job], windows, point, contract_size,
+                 fill or FillModel(), intrabar, warmup)
+                for key, group in groups.items() for i in range(0, len(group), per_job)]
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            evaluated = [r for chunk in pool.map(_evaluate_group, jobs) for r in chunk]
+    finally:
+        for shm in (rates_shm, ema_shm):
+            shm.close()
+            shm.unlink()
+
+    rows = []
+    for combo, fold_metrics, oos, full in evaluated:
+        row = dict(combo)
+        row.update({f"oos_{k}": v for k, v in oos.items()})
+        for key in ("net_profit", "profit_factor", "trades"):
+            row[f"is_{key}"] = float(np.mean([train[key] for train, _ in fold_metrics]))
+        row.update({f"full_{k}": v for k, v in full.items()})
+        rows.append(row)
+
+    selected = []
+    for f, window in enumerate(windows):
+        best = max(evaluated, key=lambda e: e[1][f][0][objective])
+        selected.append({"fold": f, "window": window, "params": best[0],
+                         "in_sample": best[1][f][0], "oos": best[1][f][1]})
+    return SweepResult(strategy, objective, windows, rows, selected, time.perf_counter() - t0)
@@ -0,0 +1,417 @@
+"""
+order_router.py
+Batch order routing: bounded in-flight orders, retcode classes, retry with backoff.
+
+send_order / place_order sent one order at a time, treated a None result ad
+hoc and decided success from a hand-written retcode list (10009, 10004, 0,
+100 - a requote counted as a fill).  OrderRouter takes OrderIntents, alone or
+in batches, and works up to max_in_flight of them at once.  Each retcode is
+classified (RETCODES):
+
+    done       10008 placed, 10009 done, 10010 partial
+    reprice    requote / price changed / price off / invalid price: retried at once with a fresh tick
+    transient  too many requests, no connection: not executed, retried after backoff
+    unknown    no result, error, timeout, locked ...: the order may have been executed
+    respec     invalid fill mode: symbol spec reloaded, retried with its filling mode
+    fatal      no money, market closed, invalid volume or stops, rejected, limits ...: not retried
+
+An unknown outcome is never simply resent: that could open the position twice.
+The router looks the intent up on the terminal instead - open positions, then
+deal and order history - by symbol, magic, side and volume, opened no earlier
+than its first send (server time, from the last tick, less RECONCILE_SLACK).
+Order comments are left as given.  Fills the router already reported for
+another intent are skipped, so two equal legs of a batch are told apart.
+Found filled: the intent is done.  An order found rejected or cancelled: it was
+not executed and is retried like a transient error.  Not found: the outcome
+stays unknown and the intent fails ("unreconciled") rather than risk a
+duplicate.
+
+Every retry happens inside the intent's latency budget (seconds from
+submission); a retry that could not finish inside it is not started.  Backoff is
+exponential with full jitter, from the `backoff` package when installed.
+
+Terminal calls are serialised on one lock (the MT5 API is not thread safe), or
+handed to `terminal` (e.g. AsyncRuntime's MT5 thread: backoff waits then stay on
+the router's threads instead of blocking every other terminal call), so
+"in flight" means an intent somewhere between its first send and its final
+result: while one waits out a backoff or fetches a new price, the others keep
+going instead of queueing behind it.  Results come back in submission order.
+
+    ROUTER = OrderRouter(mt5, symbol_cache=SYMBOLS, max_in_flight=4, budget=2.0)
+    results = ROUTER.route([OrderIntent("XAUUSD", "buy", 0.05, sl=2290.0, tp=2310.0, comment="TP1"),
+                            OrderIntent("XAUUSD", "buy", 0.05, sl=2290.0, tp=2320.0, comment="TP2")])
+    if results[0].ok: ...
+"""
+
+import collections
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from STOCKDATA.symbol_cache import SymbolCache
+
+try:
+    import backoff
+except ImportError:  # same capped exponential schedule, computed here
+    backoff = None
+
+logger = logging.getLogger("order_router")
+
+DONE, REPRICE, TRANSIENT, UNKNOWN, RESPEC, FATAL = "done", "reprice", "transient", "unknown", "respec", "fatal"
+
+# retcode -> (name, class); anything missing is fatal
+RETCODES = {
+    10004: ("requote", REPRICE),
+    10006: ("reject", FATAL),
+    10007: ("cancel", FATAL),
+    10008: ("placed", DONE),
+    10009: ("done", DONE),
+    10010: ("done_partial", DONE),
+    10011: ("error", UNKNOWN),
+    10012: ("timeout", UNKNOWN),
+    10013: ("invalid", FATAL),
+    10014: ("invalid_volume", FATAL),
+    10015: ("invalid_price", REPRICE),
+    10016: ("invalid_stops", FATAL),
+    10017: ("trade_disabled", FATAL),
+    10018: ("market_closed", FATAL),
+    10019: ("no_money", FATAL),
+    10020: ("price_changed", REPRICE),
+    10021: ("price_off", REPRICE),
+    10022: ("invalid_expiration", FATAL),
+    10023: ("order_changed", UNKNOWN),
+    10024: ("too_many_requests", TRANSIENT),
+    10025: ("no_changes", FATAL),
+    10026: ("server_autotrading_disabled", FATAL),
+    10027: ("client_autotrading_disabled", FATAL),
+    10028: ("locked", UNKNOWN),
+    10029: ("frozen", UNKNOWN),
+    10030: ("invalid_fill", RESPEC),
+    10031: ("connection", TRANSIENT),
+    10032: ("only_real", FATAL),
+    10033: ("limit_orders", FATAL),
+    10034: ("limit_volume", FATAL),
+    10035: ("invalid_order", FATAL),
+    10036: ("position_closed", FATAL),
+    10038: ("invalid_close_volume", FATAL),
+    10039: ("close_order_exist", FATAL),
+    10040: ("limit_positions", FATAL),
+    -1: ("no_result", UNKNOWN),  # order_send returned None or raised
+}
+
+
+def classify(retcode):
+    """(name, class) of an order_send retcode."""
+    return RETCODES.get(retcode, (f"retcode_{retcode}", FATAL))
+
+
+def is_done(retcode):
+    return classify(retcode)[1] == DONE
+
+
+# MT5 ORDER_STATE_* of history orders that were not executed
+_NOT_EXECUTED_STATES = (2, 5, 6)  # canceled, rejected, expired
+# Seconds the reconcile window reaches back before the first send (clock skew, tick age)
+RECONCILE_SLACK = 5.0
+_CLAIMS_KEPT = 10000
+
+
+_INTENT_FIELDS = ("symbol", "side", "volume", "price", "sl", "tp", "deviation", "magic", "comment", "strategy",
+                  "budget", "type_filling")
+
+OrderIntent = collections.namedtuple("OrderIntent", _INTENT_FIELDS,
+                                     defaults=(None, 0.0, 0.0, 20, 0, "", "", None, None))
+OrderIntent.__doc__ = """
+A market order to get filled.  price is the price sl/tp were computed from
+(None: take the current tick); when the order is re-priced, sl and tp move by
+the same amount so their distance to the entry is kept.  budget overrides the
+router's latency budget; type_filling overrides the broker default.
+"""
+
+
+def intent_from_request(request, strategy="", budget=None):
+    """OrderIntent for an order_send request dict (TRADE_ACTION_DEAL buy/sell)."""
+    return OrderIntent(symbol=request["symbol"], side="buy" if request.get("type", 0) == 0 else "sell",
+                       volume=float(request["volume"]), price=request.get("price") or None,
+                       sl=request.get("sl", 0.0), tp=request.get("tp", 0.0), deviation=request.get("deviation", 20),
+                       magic=request.get("magic", 0), comment=request.get("comment", ""), strategy=strategy,
+                       budget=budget, type_filling=request.get("type_filling"))
+
+
+RouteResult = collections.namedtuple("RouteResult", [
+    "intent", "ok", "retcode", "outcome", "attempts", "price", "executed_price", "elapsed", "result", "history",
+])
+
+
+def result_dict(result):
+    """order_send result (namedtuple, object or dict) as a plain dict."""
+    if result is None:
+        return {}
+    if isinstance(result, dict):
+        return dict(result)
+    if hasattr(result, "_asdict"):
+        return result._asdict()
+    return {k: getattr(result, k) for k in dir(result) if not k.startswith("_") and not callable(getattr(result, k))}
+
+
+def backoff_delays(base=2, factor=0.05, max_value=0.5):
+    """Endless capped exponential delays: factor, factor*base, ... up to max_value."""
+    if backoff is not None:
+        for value in backoff.expo(base=base, factor=factor, max_value=max_value):
+            if value is not None:  # backoff >= 2 primes the generator with a None
+                yield value
+        return
+    n = 0
+    while True:
+        yield min(factor * base ** n, max_value)
+        n += 1
+
+
+class OrderRouter:
+    """
+    mt5: MetaTrader5 module (or hub client / simulator).
+    symbol_cache: SymbolCache for point, digits and filling modes (one is made if omitted).
+    max_in_flight: intents worked on concurrently.
+    max_attempts: order_send calls per intent at most.
+    budget: seconds from submission within which an intent must be finished.
+    backoff_base / backoff_factor / backoff_max: transient-error delays (seconds), full jitter.
+    latency: optional LatencyRecorder; every attempt is observed as stage "order_send".
+    terminal: optional callable(fn, *args) running a terminal call on the caller's MT5 thread
+      (e.g. AsyncRuntime.mt5.call); by default terminal calls are serialised on the router's lock.
+    """
+
+    def __init__(self, mt5, symbol_cache=None, max_in_flight=4, max_attempts=4, budget=2.0, backoff_base=2,
+                 backoff_factor=0.05, backoff_max=0.5, latency=None, terminal=None, clock=time.monotonic,
+                 sleep=time.sleep, seed=None):
+        self.mt5 = mt5
+        self.symbol_cache = symbol_cache or SymbolCache(mt5)
+        self.max_in_flight = max_in_flight
+        self.max_attempts = max_attempts
+        self.budget = budget
+        self.backoff_base = backoff_base
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.latency = latency
+        self.terminal = terminal
+        self.clock = clock
+        self.sleep = sleep
+        self.rng = random.Random(seed)
+        self._terminal = threading.Lock()
+        self._claimed = {}  # order tickets of fills already reported, oldest first
+        self._claim_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="order")
+        self._stats_lock = threading.Lock()
+        self.stats = collections.Counter()
+
+    # ------------------------------------------------------------------
+    # Entry points
+    # ------------------------------------------------------------------
+    def submit(self, intent):
+        """Route intent in the background; returns a Future of its RouteResult."""
+        submitted = self.clock()
+        return self._pool.submit(self._route_one, intent, submitted)
+
+    def route(self, intents):
+        """Route a batch with at most max_in_flight at once; RouteResults in the order given."""
+        futures = [self.submit(intent) for intent in intents]
+        return [f.result() for f in futures]
+
+    def send(self, intent):
+        """Route one intent on the calling thread."""
+        return self._route_one(intent, self.clock())
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+    # ------------------------------------------------------------------
+    # One intent
+    # ------------------------------------------------------------------
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _call(self, fn, *args):
+        """Run one terminal call (or a function making several) serialised with all others."""
+        if self.terminal is not None:
+            return self.terminal(fn, *args)
+        with self._terminal:
+            return fn(*args)
+
+    def _quote(self, intent):
+        tick = self._call(self.mt5.symbol_info_tick, intent.symbol)
+        if tick is None:
+            return None
+        return tick.ask if intent.side == "buy" else tick.bid
+
+    def _request(self, intent, price, shift, type_filling):
+        meta = self._call(self.symbol_cache.get, intent.symbol)  # reloads from the terminal on TTL expiry
+        digits = meta.digits if meta is not None and meta.digits is not None else 5
+        request = {
+            "action": self.mt5.TRADE_ACTION_DEAL,
+            "symbol": intent.symbol,
+            "volume": float(intent.volume),
+            "type": self.mt5.ORDER_TYPE_BUY if intent.side == "buy" else self.mt5.ORDER_TYPE_SELL,
+            "price": round(float(price), digits),
+            "sl": round(float(intent.sl) + shift, digits) if intent.sl else 0.0,
+            "tp": round(float(intent.tp) + shift, digits) if intent.tp else 0.0,
+            "deviation": intent.deviation,
+            "magic": intent.magic,
+            "comment": intent.comment,
+        }
+        if type_filling is not None:
+            request["type_filling"] = type_filling
+        return request
+
+    def _send_call(self, request):
+        result = self.mt5.order_send(request)
+        return result, (self.mt5.last_error() if result is None else None)
+
+    def _order_send(self, intent, request):
+        start = time.perf_counter()
+        try:
+            result, error = self._call(self._send_call, request)
+        except Exception as e:
+            result, error = None, str(e)
+        if self.latency is not None:
+            self.latency.observe("order_send", time.perf_counter() - start, intent.symbol, intent.strategy)
+        retcode = getattr(result, "retcode", None)
+        if retcode is None and isinstance(result, dict):
+            retcode = result.get("retcode")
+        return result, (-1 if retcode is None else retcode), error
+
+    def _find(self, intent, elapsed):
+        """
+        Where the intent's orders, sent within the last `elapsed` seconds, ended up:
+        (DONE, order ticket, position or deal) if one was filled, (TRANSIENT, ticket,
+        order) if one was not executed, (UNKNOWN, None, None) if neither was found.
+        """
+        tick = self.mt5.symbol_info_tick(intent.symbol)
+        if tick is None:
+            return UNKNOWN, None, None
+        server_msc = getattr(tick, "time_msc", 0) or int(tick.time) * 1000
+        start = server_msc - int((elapsed + RECONCILE_SLACK) * 1000)
+        side = self.mt5.ORDER_TYPE_BUY if intent.side == "buy" else self.mt5.ORDER_TYPE_SELL
+
+        def mine(item, ticket, opened_msc):
+            return (ticket not in self._claimed and item.symbol == intent.symbol and item.magic == intent.magic
+                    and item.type == side and abs(item.volume - float(intent.volume)) < 1e-9
+                    and (opened_msc or 0) >= start)
+
+        for position in self.mt5.positions_get(symbol=intent.symbol) or ():
+            ticket = getattr(position, "identifier", None) or position.ticket
+            if mine(position, ticket, getattr(position, "time_msc", 0) or position.time * 1000):
+                return DONE, ticket, position
+        # History is queried in server time, which the last tick carries
+        since, until = start // 1000, server_msc // 1000 + 60
+        for deal in self.mt5.history_deals_get(since, until) or ():
+            if getattr(deal, "entry", 0) == 0 and mine(deal, deal.order, getattr(deal, "time_msc", 0) or deal.time * 1000):
+                return DONE, deal.order, deal
+        history_orders = getattr(self.mt5, "history_orders_get", None)
+        for order in (history_orders(since, until) if history_orders is not None else None) or ():
+            if order.state in _NOT_EXECUTED_STATES and mine(order, order.ticket, getattr(order, "time_setup_msc", 0)):
+                return TRANSIENT, order.ticket, order
+        return UNKNOWN, None, None
+
+    def _claim(self, ticket):
+        """Mark a fill (or rejected order) as accounted for, so no other intent takes it as its own."""
+        if not ticket:
+            return
+        self._claimed[ticket] = True
+        if len(self._claimed) > _CLAIMS_KEPT:
+            del self._claimed[next(iter(self._claimed))]
+
+    def _reconcile(self, intent, elapsed):
+        """Look an unknown outcome up on the terminal; (class, position/deal/order or None)."""
+        self._count("reconciled")
+        try:
+            with self._claim_lock:  # one intent at a time claims what it found
+                kind, ticket, found = self._call(self._find, intent, elapsed)
+                if kind != UNKNOWN:
+                    self._claim(ticket)
+            return kind, found
+        except Exception as e:
+            logger.error(f"Reconciling {intent.symbol} {intent.side} {intent.volume} failed: {e}")
+            return UNKNOWN, None
+
+    def _route_one(self, intent, submitted):
+        budget = intent.budget if intent.budget is not None else self.budget
+        deadline = submitted + budget
+        delays = backoff_delays(self.backoff_base, self.backoff_factor, self.backoff_max)
+        price, first_price = intent.price, intent.price
+        type_filling = intent.type_filling
+        first_sent = None
+        history = []
+        result, retcode, outcome = None, -1, "no_quote"
+        executed = None
+        attempts = 0
+        while attempts < self.max_attempts:
+            if price is None:
+                price = self._quote(intent)
+                if price is None:
+                    retcode, outcome = -1, "no_quote"
+                    history.append(outcome)
+                    if not self._wait(next(delays), deadline):
+                        break
+                    continue
+            if first_price is None:
+                first_price = price
+            attempts += 1
+            request = self._request(intent, price, price - first_price, type_filling)
+            if first_sent is None:
+                first_sent = self.clock()
+            self._count("attempts")
+            result, retcode, error = self._order_send(intent, request)
+            outcome, kind = classify(retcode)
+            history.append(outcome)
+            if error:
+                logger.warning(f"order_send {intent.symbol} {intent.side} returned no result: {error}")
+            self.symbol_cache.check_retcode(intent.symbol, retcode)
+            if kind == UNKNOWN:
+                kind, found = self._reconcile(intent, self.clock() - first_sent)
+                history.append(f"reconciled_{kind}")
+                if kind == DONE:
+                    # Filled after all: report it as done, at the price it was filled at
+                    retcode, outcome = 10009, "done_reconciled"
+                    executed = getattr(found, "price_open", None) or getattr(found, "price", None)
+                    break
+                if kind == UNKNOWN:
+                    logger.error(f"Order {intent.symbol} {intent.side} {intent.volume}: {outcome} "
+                                 f"(retcode {retcode}) and not found on the terminal; not resending")
+                    outcome = "unreconciled"
+                    break
+            if kind == DONE or kind == FATAL:
+                break
+            if kind == REPRICE:
+                price = None  # fresh tick on the next attempt, no delay
+                if self.clock() >= deadline:
+                    outcome = "budget_exceeded"
+                    break
+                continue
+            if kind == RESPEC:
+                # check_retcode dropped the spec; reloading it is a terminal call
+                type_filling = self._call(self.symbol_cache.filling_type, intent.symbol)
+                continue
+            if not self._wait(next(delays), deadline):  # TRANSIENT
+                outcome = "budget_exceeded"
+                break
+        ok = classify(retcode)[1] == DONE
+        self._count("done" if ok else outcome)
+        if ok and outcome != "done_reconciled":
+            with self._claim_lock:
+                self._claim(result_dict(result).get("order"))
+        executed = executed or result_dict(result).get("price") or None
+        elapsed = self.clock() - submitted
+        if not ok:
+            logger.warning(f"Order {intent.symbol} {intent.side} {intent.volume} failed: {outcome} "
+                           f"(retcode {retcode}) after {attempts} attempts, {elapsed:.3f}s: {history}")
+        return RouteResult(intent, ok, retcode, outcome, attempts, price, executed, elapsed, result, history)
+
+    def _wait(self, delay, deadline):
+        """Sleep a jittered delay unless that would end past the deadline; False if it would."""
+        delay = self.rng.uniform(0, delay)
+        if self.clock() + delay >= deadline:
+            return False
+        self.sleep(delay)
+        return True
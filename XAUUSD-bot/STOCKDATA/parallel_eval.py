@@ -0,0 +1,194 @@
+"""
+parallel_eval.py
+Fan (symbol, strategy) evaluations out to a process pool.
+
+All symbols' bars are packed once per cycle into one shared-memory block of MT5
+rates records; workers attach to it and evaluate on zero-copy read-only views,
+so only the small task tuple and the resulting signal cross process boundaries.
+The signals come back to the caller, which stays the only place that sends
+orders.  Every task reports its run time inside the worker and its queueing
+overhead, so scaling across cores can be checked on the trading box.
+
+Strategies are registered by import path so worker processes (spawned on
+Windows) can resolve them:
+
+    register_strategy("ote", "STOCKDATA.modules.ote:check_ote_signal")
+
+A strategy function receives the closed bars (structured array view) and,
+if an engine class is registered, a per-worker engine for that
+(symbol, strategy) pair, which then only consumes new bars.
+"""
+
+import importlib
+import logging
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from STOCKDATA.bar_cache import RATES_DTYPE
+
+logger = logging.getLogger("parallel_eval")
+
+StrategySpec = namedtuple("StrategySpec", "target engine engine_kwargs")
+EvalResult = namedtuple("EvalResult", "symbol strategy signal error worker_pid run_ms roundtrip_ms")
+
+STRATEGIES = {
+    "moving_average_crossover": StrategySpec(
+        "STOCKDATA.modules.moving_average_crossover:check_for_signal",
+        "STOCKDATA.modules.indicator_engine:EMACrossEngine", {"fast": 9, "slow": 21}),
+    "macd": StrategySpec(
+        "STOCKDATA.modules.macd:check_macd_signal",
+        "STOCKDATA.modules.indicator_engine:MACDEngine", {"fast": 12, "slow": 26, "signal": 9}),
+}
+
+
+def register_strategy(name, target, engine=None, engine_kwargs=None):
+    """target / engine are 'package.module:attribute' paths."""
+    STRATEGIES[name] = StrategySpec(target, engine, engine_kwargs or {})
+
+
+def _resolve(path):
+    module, _, attr = path.partition(":")
+    return getattr(importlib.import_module(module), attr)
+
+
+# ----------------------------------------------------------------------
+# Shared bars
+# ----------------------------------------------------------------------
+class SharedBars:
+    """
+    One shared-memory block holding every symbol's rates back to back.
+    The block is reused across cycles and only reallocated when it has to grow.
+    """
+
+    def __init__(self):
+        self._shm = None
+        self.layout = {}
+
+    def pack(self, rates_by_symbol):
+        total = sum(len(r) for r in rates_by_symbol.values())
+        nbytes = max(total, 1) * RATES_DTYPE.itemsize
+        if self._shm is None or self._shm.size < nbytes:
+            self.close()
+            self._shm = shared_memory.SharedMemory(create=True, size=nbytes * 2)
+        buf = np.ndarray((self._shm.size // RATES_DTYPE.itemsize,), dtype=RATES_DTYPE, buffer=self._shm.buf)
+        layout = {}
+        pos = 0
+        for symbol, rates in rates_by_symbol.items():
+            n = len(rates)
+            buf[pos:pos + n] = rates
+            layout[symbol] = (pos, n)
+            pos += n
+        self.layout = layout
+        return self._shm.name, layout
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+# Worker-process state: the attached block and per-(symbol, strategy) engines
+_attached = {"name": None, "shm": None, "array": None}
+_engines = {}
+
+
+def _attach(name):
+    if _attached["name"] != name:
+        if _attached["shm"] is not None:
+            _attached["array"] = None
+            _attached["shm"].close()
+        shm = shared_memory.SharedMemory(name=name)
+        arr = np.ndarray((shm.size // RATES_DTYPE.itemsize,), dtype=RATES_DTYPE, buffer=shm.buf)
+        arr.flags.writeable = False
+        _attached.update(name=name, shm=shm, array=arr)
+    return _attached["array"]
+
+
+def _evaluate_task(shm_name, start, length, symbol, strategy, spec, closed_only):
+    t0 = time.perf_counter()
+    try:
+        rates = _attach(shm_name)[start:start + length]
+        if closed_only:
+            rates = rates[:-1]
+        fn = _resolve(spec.target)
+        if spec.engine:
+            key = (symbol, strategy)
+            engine = _engines.get(key)
+            if engine is None:
+                engine = _engines[key] = _resolve(spec.engine)(**spec.engine_kwargs)
+            signal = fn(rates, engine)
+        else:
+            signal = fn(rates)
+        error = None
+    except Exception as e:
+        signal, error = None, f"{type(e).__name__}: {e}"
+    return signal, error, os.getpid(), (time.perf_counter() - t0) * 1000.0
+
+
+# ----------------------------------------------------------------------
+# Evaluator
+# ----------------------------------------------------------------------
+class ParallelEvaluator:
+    """
+    max_workers: pool size (defaults to the CPU count).
+    closed_only: drop the forming bar before evaluating, as the strategy loops do.
+    """
+
+    def __init__(self, max_workers=None, closed_only=True, strategies=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.closed_only = closed_only
+        self.strategies = strategies if strategies is not None else STRATEGIES
+        self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        self._bars = SharedBars()
+        self.last_wall_ms = 0.0
+
+    def evaluate(self, rates_by_symbol, pairs):
+        """
+        rates_by_symbol: {symbol: MT5 rates array}; pairs: iterable of (symbol, strategy).
+        Returns a list of EvalResult in the order of pairs.
+        """
+        t0 = time.perf_counter()
+        name, layout = self._bars.pack(rates_by_symbol)
+        futures = []
+        for symbol, strategy in pairs:
+            start, length = layout[symbol]
+            spec = self.strategies[strategy]
+            futures.append((symbol, strategy, time.perf_counter(), self._pool.submit(
+                _evaluate_task, name, start, length, symbol, strategy, spec, self.closed_only)))
+        results = []
+        for symbol, strategy, submitted, fut in futures:
+            signal, error, pid, run_ms = fut.result()
+            if error:
+                logger.error(f"{strategy} on {symbol} failed: {error}")
+            results.append(EvalResult(symbol, strategy, signal, error, pid, run_ms,
+                                      (time.perf_counter() - submitted) * 1000.0))
+        self.last_wall_ms = (time.perf_counter() - t0) * 1000.0
+        return results
+
+    def timing_report(self, results):
+        """Per-task and aggregate timings; parallel efficiency = CPU ms / (wall ms x workers)."""
+        busy = sum(r.run_ms for r in results)
+        workers = len({r.worker_pid for r in results})
+        lines = [f"{r.symbol:<8} {r.strategy:<26} {str(r.signal):<5} run={r.run_ms:7.2f}ms "
+                 f"roundtrip={r.roundtrip_ms:7.2f}ms pid={r.worker_pid}" for r in results]
+        wall = self.last_wall_ms or 1e-9
+        lines.append(f"{len(results)} tasks on {workers} workers: wall={wall:.2f}ms "
+                     f"busy={busy:.2f}ms speedup={busy / wall:.2f}x "
+                     f"efficiency={busy / (wall * self.max_workers):.0%}")
+        return "\n".join(lines)
+
+    def close(self):
+        self._pool.shutdown()
+        self._bars.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
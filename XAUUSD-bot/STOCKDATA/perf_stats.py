@@ -0,0 +1,414 @@
+"""
+perf_stats.py
+Online performance statistics and daily risk gates.
+
+The trade log carried Win Rate / Total Loss Amount / Total Profit Amount /
+Profitability on every row, recomputed from the history each time a trade was
+written.  PerfStats keeps the same numbers - plus expectancy, equity curve,
+max drawdown and win/loss streaks - as running aggregates overall, per
+strategy, per symbol and per day, and updates them in O(1) per closed trade.
+
+State is snapshotted to JSON atomically (trade_journal.write_atomic) every
+snapshot_every trades and on close(), so a restart or another process (the
+risk gate, the dashboard) loads the current numbers instead of re-reading the
+history.  RiskGate applies config.json's risk_settings (max_daily_loss,
+max_daily_profit, max_daily_trades, and an optional max_drawdown) to them; if
+the settings cannot be read it blocks every entry rather than trade unguarded.
+ClosedTradeRecorder feeds a PositionBook's closed positions into the stats.
+
+    stats = PerfStats("trades/perf_stats.json")
+    stats.record_open("macd", "XAUUSD")
+    stats.record_close({"strategy": "macd", "symbol": "XAUUSD", "profit": -12.5,
+                        "exit_time": "2025-08-04 07:10:00"})
+    gate = RiskGate(stats, load_risk_settings())
+    allowed, reason = gate.check()
+"""
+
+import collections
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from STOCKDATA.trade_journal import write_atomic
+
+logger = logging.getLogger("perf_stats")
+
+_BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SNAPSHOT = os.path.join(_BASE_DIR, "trades", "perf_stats.json")
+CONFIG_PATH = os.path.join(_BASE_DIR, "config.json")
+SNAPSHOT_VERSION = 1
+
+_STAT_FIELDS = ("trades", "opened", "wins", "losses", "gross_profit", "gross_loss", "equity", "peak",
+                "max_drawdown", "streak", "max_win_streak", "max_loss_streak", "best", "worst")
+
+
+def _day(value):
+    """YYYY-MM-DD for a timestamp string / datetime / epoch seconds; today (UTC) if missing."""
+    if value in (None, ""):
+        return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone.utc).strftime("%Y-%m-%d")
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d")
+    return str(value)[:10]
+
+
+class StatBlock:
+    """Running aggregates for one slice of trades (overall, a strategy, a symbol or a day)."""
+
+    __slots__ = _STAT_FIELDS
+
+    def __init__(self, state=None):
+        state = state or {}
+        for name in _STAT_FIELDS:
+            setattr(self, name, state.get(name, 0.0 if name in ("gross_profit", "gross_loss", "equity", "peak",
+                                                                  "max_drawdown", "best", "worst") else 0))
+
+    def apply(self, profit):
+        self.trades += 1
+        if profit > 0:
+            self.wins += 1
+            self.gross_profit += profit
+            self.streak = self.streak + 1 if self.streak > 0 else 1
+            self.max_win_streak = max(self.max_win_streak, self.streak)
+        elif profit < 0:
+            self.losses += 1
+            self.gross_loss += -profit
+            self.streak = self.streak - 1 if self.streak < 0 else -1
+            self.max_loss_streak = max(self.max_loss_streak, -self.streak)
+        # Equity relative to the start of the slice; drawdown measured from its running peak
+        self.equity += profit
+        self.peak = max(self.peak, self.equity)
+        self.max_drawdown = max(self.max_drawdown, self.peak - self.equity)
+        self.best = profit if self.trades == 1 else max(self.best, profit)
+        self.worst = profit if self.trades == 1 else min(self.worst, profit)
+
+    # ------------------------------------------------------------------
+    # Derived values
+    # ------------------------------------------------------------------
+    @property
+    def net_profit(self):
+        return self.gross_profit - self.gross_loss
+
+    @property
+    def win_rate(self):
+        return self.wins / self.trades if self.trades else 0.0
+
+    @property
+    def expectancy(self):
+        """Average profit per closed trade."""
+        return self.net_profit / self.trades if self.trades else 0.0
+
+    @property
+    def avg_win(self):
+        return self.gross_profit / self.wins if self.wins else 0.0
+
+    @property
+    def avg_loss(self):
+        return self.gross_loss / self.losses if self.losses else 0.0
+
+    @property
+    def profit_factor(self):
+        if self.gross_loss:
+            return self.gross_profit / self.gross_loss
+        return float("inf") if self.gross_profit else 0.0
+
+    @property
+    def drawdown(self):
+        """Current distance below the equity peak."""
+        return self.peak - self.equity
+
+    def state(self):
+        return {name: getattr(self, name) for name in _STAT_FIELDS}
+
+    def summary(self):
+        out = self.state()
+        out.update({"net_profit": self.net_profit, "win_rate": self.win_rate, "expectancy": self.expectancy,
+                    "avg_win": self.avg_win, "avg_loss": self.avg_loss, "drawdown": self.drawdown,
+                    "profit_factor": self.profit_factor if self.gross_loss or not self.gross_profit else None})
+        return out
+
+    def as_legacy(self):
+        """The aggregate columns trade_log.csv carried on every row."""
+        return {
+            "Win Rate": f"{self.win_rate:.2%}",
+            "Total Loss Amount": round(self.gross_loss, 2),
+            "Total Profit Amount": round(self.gross_profit, 2),
+            "Total Trades": self.trades,
+            "Profitability": round(self.net_profit, 2),
+        }
+
+
+class PerfStats:
+    """
+    path: snapshot file (None = in memory only); loaded on start if it exists.
+    snapshot_every: closed trades between automatic snapshots (0 = only on snapshot()/close()).
+    curve_points: how many (exit_time, equity) points of the overall equity curve to keep.
+    days_kept: per-day blocks older than this many days are dropped.
+    """
+
+    def __init__(self, path=DEFAULT_SNAPSHOT, snapshot_every=1, curve_points=5000, days_kept=400):
+        self.path = path
+        self.snapshot_every = snapshot_every
+        self.days_kept = days_kept
+        self.total = StatBlock()
+        self.by_strategy = {}
+        self.by_symbol = {}
+        self.by_day = {}
+        self.curve = collections.deque(maxlen=curve_points)
+        self._lock = threading.Lock()
+        self._since_snapshot = 0
+        if path and os.path.exists(path):
+            self._load(path)
+
+    @staticmethod
+    def _block(table, key):
+        block = table.get(key)
+        if block is None:
+            block = table[key] = StatBlock()
+        return block
+
+    # ------------------------------------------------------------------
+    # Updates
+    # ------------------------------------------------------------------
+    def record_open(self, strategy=None, symbol=None, when=None):
+        """Count a new position towards today's (or when's) trade count for max_daily_trades."""
+        with self._lock:
+            self._block(self.by_day, _day(when)).opened += 1
+            self.total.opened += 1
+            if strategy:
+                self._block(self.by_strategy, strategy).opened += 1
+            if symbol:
+                self._block(self.by_symbol, symbol).opened += 1
+            if self.path and self.snapshot_every:
+                self._snapshot()  # a restart must not forget today's trade count
+
+    def record_close(self, trade):
+        """
+        Apply one closed trade: a dict with profit and optionally strategy, symbol and
+        exit_time (journal / trade_store / archive keys all work).  O(1).
+        """
+        profit = trade.get("profit")
+        if profit in (None, ""):
+            return False
+        profit = float(profit)
+        when = trade.get("exit_time") or trade.get("timestamp")
+        day = _day(when)
+        strategy = trade.get("strategy")
+        symbol = trade.get("symbol")
+        with self._lock:
+            self.total.apply(profit)
+            self._block(self.by_day, day).apply(profit)
+            if strategy:
+                self._block(self.by_strategy, strategy).apply(profit)
+            if symbol:
+                self._block(self.by_symbol, symbol).apply(profit)
+            self.curve.append((str(when or day), self.total.equity))
+            if len(self.by_day) > self.days_kept:
+                for old in sorted(self.by_day)[:len(self.by_day) - self.days_kept]:
+                    del self.by_day[old]
+            self._since_snapshot += 1
+            if self.path and self.snapshot_every and self._since_snapshot >= self.snapshot_every:
+                self._snapshot()
+        return True
+
+    @classmethod
+    def rebuild(cls, trades, path=None, **kwargs):
+        """Stats from a trade history (TradeJournal, archive rows, ...) in one streaming pass."""
+        stats = cls(path=None, **kwargs)
+        for trade in trades:
+            stats.record_close(trade)
+        stats.path = path
+        if path:
+            stats.snapshot()
+        return stats
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def day(self, day=None):
+        """StatBlock for a day (default today, UTC); empty if nothing happened."""
+        return self.by_day.get(_day(day)) or StatBlock()
+
+    def strategy(self, name):
+        return self.by_strategy.get(name) or StatBlock()
+
+    def symbol(self, name):
+        return self.by_symbol.get(name) or StatBlock()
+
+    def summary(self):
+        with self._lock:
+            return {
+                "total": self.total.summary(),
+                "by_strategy": {k: v.summary() for k, v in self.by_strategy.items()},
+                "by_symbol": {k: v.summary() for k, v in self.by_symbol.items()},
+                "by_day": {k: v.summary() for k, v in sorted(self.by_day.items())},
+            }
+
+    # ------------------------------------------------------------------
+    # Snapshots
+    # ------------------------------------------------------------------
+    def _state(self):
+        return {
+            "version": SNAPSHOT_VERSION,
+            "written_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "total": self.total.state(),
+            "by_strategy": {k: v.state() for k, v in self.by_strategy.items()},
+            "by_symbol": {k: v.state() for k, v in self.by_symbol.items()},
+            "by_day": {k: v.state() for k, v in self.by_day.items()},
+            "curve": list(self.curve),
+        }
+
+    def _snapshot(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        write_atomic(self.path, json.dumps(self._state(), separators=(",", ":")).encode())
+        self._since_snapshot = 0
+
+    def snapshot(self):
+        with self._lock:
+            self._snapshot()
+
+    def _load(self, path):
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable stats snapshot {path}: {e}")
+            return
+        if state.get("version") != SNAPSHOT_VERSION:
+            logger.warning(f"Ignoring stats snapshot {path} with version {state.get('version')}")
+            return
+        self.total = StatBlock(state["total"])
+        self.by_strategy = {k: StatBlock(v) for k, v in state["by_strategy"].items()}
+        self.by_symbol = {k: StatBlock(v) for k, v in state["by_symbol"].items()}
+        self.by_day = {k: StatBlock(v) for k, v in state["by_day"].items()}
+        self.curve.extend(tuple(p) for p in state.get("curve", []))
+
+    def close(self):
+        if self.path:
+            self.snapshot()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ----------------------------------------------------------------------
+# Risk gates
+# ----------------------------------------------------------------------
+def load_risk_settings(path=CONFIG_PATH):
+    """config.json's risk_settings ({} if it has none); None if the file is missing or not valid JSON."""
+    try:
+        with open(path) as f:
+            settings = json.load(f).get("risk_settings", {})
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not read risk settings from {path}: {e}")
+        return None
+    if not isinstance(settings, dict):
+        logger.error(f"risk_settings in {path} is not an object")
+        return None
+    return settings
+
+
+class RiskGate:
+    """
+    Blocks new entries once today's closed PnL reaches -max_daily_loss or
+    +max_daily_profit, today's opened trades reach max_daily_trades, or the
+    overall drawdown reaches max_drawdown.  Unset (or zero) limits are not enforced.
+    settings: risk_settings dict; None loads them from path.  Fails closed: if path
+    cannot be read every check is refused.
+    """
+
+    def __init__(self, stats, settings=None, path=CONFIG_PATH):
+        self.stats = stats
+        settings = settings if settings is not None else load_risk_settings(path)
+        self.error = None if settings is not None else f"risk settings unreadable ({path})"
+        settings = settings or {}
+        self.max_daily_loss = settings.get("max_daily_loss")
+        self.max_daily_profit = settings.get("max_daily_profit")
+        self.max_daily_trades = settings.get("max_daily_trades")
+        self.max_drawdown = settings.get("max_drawdown")
+
+    def check(self, day=None):
+        """(allowed, reason) for opening a new trade."""
+        if self.error:
+            return False, self.error
+        today = self.stats.day(day)
+        if self.max_daily_loss and today.net_profit <= -self.max_daily_loss:
+            return False, f"daily loss {-today.net_profit:.2f} reached limit {self.max_daily_loss}"
+        if self.max_daily_profit and today.net_profit >= self.max_daily_profit:
+            return False, f"daily profit {today.net_profit:.2f} reached target {self.max_daily_profit}"
+        if self.max_daily_trades and today.opened >= self.max_daily_trades:
+            return False, f"{today.opened} trades today reached limit {self.max_daily_trades}"
+        if self.max_drawdown and self.stats.total.drawdown >= self.max_drawdown:
+            return False, f"drawdown {self.stats.total.drawdown:.2f} reached limit {self.max_drawdown}"
+        return True, ""
+
+    def allowed(self, day=None):
+        return self.check(day)[0]
+
+
+class ClosedTradeRecorder:
+    """
+    PositionBook subscriber: each closed position (of magic, if given) becomes a
+    PerfStats.record_close.  Profit is realised from the position's exit deals
+    (profit + swap + commission + fee); the last seen floating profit if the
+    terminal has no history for it yet.
+    journal: optional TradeJournal the closed trade is also appended to.
+    """
+
+    def __init__(self, mt5, stats, strategy, magic=None, journal=None):
+        self.mt5 = mt5
+        self.stats = stats
+        self.strategy = strategy
+        self.magic = magic
+        self.journal = journal
+
+    def _realised(self, position):
+        try:
+            deals = self.mt5.history_deals_get(position=position.ticket) or ()
+        except Exception as e:
+            logger.warning(f"history_deals_get for {position.ticket} failed: {e}")
+            deals = ()
+        exits = [d for d in deals if d.entry != 0]  # DEAL_ENTRY_IN is 0
+        if not exits:
+            return position.profit + position.swap
+        return sum(d.profit + d.swap + d.commission + getattr(d, "fee", 0.0) for d in exits)
+
+    def __call__(self, diff, book):
+        for position in diff.closed:
+            if self.magic is not None and position.magic != self.magic:
+                continue
+            record = {"strategy": self.strategy, "symbol": position.symbol,
+                      "profit": self._realised(position), "exit_time": time.time(),
+                      "ticket": position.ticket}
+            self.stats.record_close(record)
+            if self.journal is not None:
+                try:
+                    self.journal.append(dict(record, side="buy" if position.type == 0 else "sell",
+                                             lot=position.volume, entry_price=position.price_open,
+                                             exit_price=position.price_current, sl=position.sl,
+                                             tp=position.tp, comment=position.comment))
+                except OSError as e:
+                    logger.error(f"Trade journal write for {position.ticket} failed: {e}")
+
+
+def main():
+    """python -m STOCKDATA.perf_stats [snapshot] - print the snapshot's summary and today's gate as JSON."""
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SNAPSHOT
+    stats = PerfStats(path, snapshot_every=0)
+    allowed, reason = RiskGate(stats).check()
+    json.dump({"summary": stats.summary(), "gate": {"allowed": allowed, "reason": reason}},
+              sys.stdout, indent=2, default=str)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
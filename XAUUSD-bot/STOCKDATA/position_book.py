@@ -0,0 +1,239 @@
+"""
+position_book.py
+One positions snapshot per cycle, indexed, with opened/closed/modified diffs.
+
+has_open_trade_for_magic (in each strategy module) and mt5_utils.safe_positions_get
+each called positions_get() and scanned the result, and safe_positions_get
+called account_info() first just to see whether the terminal was connected.
+PositionBook fetches all positions with one positions_get() per refresh,
+indexes them by symbol, (symbol, magic) and (symbol, magic, comment), and
+compares the snapshot with the previous one.  Opened, closed and modified (SL /
+TP / volume) positions are handed to subscribers - the duplicate-trade check,
+trailing-SL logic and the logs/positions_*.txt report all read from the same
+snapshot.
+
+A failed positions_get() (None) keeps the previous snapshot and emits no diff,
+so a dropped connection never looks like every position closing.
+
+    book = PositionBook(mt5, max_age=1.0)
+    book.subscribe(PositionReportWriter("logs"))
+    book.refresh()
+    book.has("XAUUSD", magic=112233)
+"""
+
+import collections
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from STOCKDATA.log_sink import get_sink
+
+logger = logging.getLogger("position_book")
+
+# Fields whose change makes a position "modified"
+WATCHED_FIELDS = ("sl", "tp", "volume")
+
+PositionDiff = collections.namedtuple("PositionDiff", ["opened", "closed", "modified"])
+
+
+def _magic(position):
+    try:
+        return int(position.magic)
+    except (AttributeError, TypeError, ValueError):
+        return None  # some brokers don't expose magic
+
+
+class PositionBook:
+    """
+    mt5: MetaTrader5 module (or the data hub client).
+    max_age: queries refresh the snapshot first if it is older than this many seconds.
+    """
+
+    def __init__(self, mt5, max_age=1.0):
+        self.mt5 = mt5
+        self.max_age = max_age
+        self.by_ticket = {}
+        self.refreshed_at = 0.0
+        self.ok = False
+        self._by_symbol = {}
+        self._by_magic = {}
+        self._by_key = {}
+        self._subscribers = []
+        self._lock = threading.RLock()
+        self.stats = {"refreshes": 0, "failures": 0}
+
+    def subscribe(self, callback):
+        """
+        callback(diff, book) is called after every refresh that changed something.
+        The first successful refresh is the baseline: positions already open then
+        are in book.by_ticket but not reported as opened.
+        """
+        self._subscribers.append(callback)
+
+    # ------------------------------------------------------------------
+    # Refresh
+    # ------------------------------------------------------------------
+    def refresh(self):
+        """Fetch all positions once, re-index and diff; returns the PositionDiff (None on failure)."""
+        with self._lock:
+            try:
+                positions = self.mt5.positions_get()
+            except Exception as e:
+                logger.error(f"positions_get failed: {e}")
+                positions = None
+            self.refreshed_at = time.monotonic()
+            if positions is None:
+                self.stats["failures"] += 1
+                self.ok = False
+                return None
+            self.stats["refreshes"] += 1
+            self.ok = True
+            current = {p.ticket: p for p in positions}
+            diff = self._diff(self.by_ticket, current)
+            baseline = self.stats["refreshes"] == 1
+            self.by_ticket = current
+            self._index()
+        if not baseline and (diff.opened or diff.closed or diff.modified):
+            for callback in self._subscribers:
+                try:
+                    callback(diff, self)
+                except Exception as e:
+                    logger.error(f"Position subscriber {callback!r} failed: {e}")
+        return diff
+
+    @staticmethod
+    def _diff(old, new):
+        opened = [p for t, p in new.items() if t not in old]
+        closed = [p for t, p in old.items() if t not in new]
+        modified = []
+        for ticket, p in new.items():
+            before = old.get(ticket)
+            if before is not None and any(getattr(before, f) != getattr(p, f) for f in WATCHED_FIELDS):
+                modified.append((before, p))
+        return PositionDiff(opened, closed, modified)
+
+    def _index(self):
+        by_symbol, by_magic, by_key = {}, {}, {}
+        for p in self.by_ticket.values():
+            magic = _magic(p)
+            by_symbol.setdefault(p.symbol, []).append(p)
+            by_magic.setdefault((p.symbol, magic), []).append(p)
+            by_key.setdefault((p.symbol, magic, p.comment), []).append(p)
+        self._by_symbol, self._by_magic, self._by_key = by_symbol, by_magic, by_key
+
+    def _fresh(self):
+        if time.monotonic() - self.refreshed_at > self.max_age:
+            self.refresh()
+
+    # ------------------------------------------------------------------
+    # Queries (all served from the snapshot)
+    # ------------------------------------------------------------------
+    def positions(self, symbol=None, magic=None, comment=None):
+        """Positions matching symbol / magic / exact comment, as a tuple like positions_get()."""
+        self._fresh()
+        if symbol is None:
+            found = self.by_ticket.values()
+            if magic is not None:
+                found = [p for p in found if _magic(p) == magic]
+            if comment is not None:
+                found = [p for p in found if p.comment == comment]
+            return tuple(found)
+        if magic is None:
+            found = self._by_symbol.get(symbol, ())
+            return tuple(p for p in found if comment is None or p.comment == comment)
+        if comment is None:
+            return tuple(self._by_magic.get((symbol, magic), ()))
+        return tuple(self._by_key.get((symbol, magic, comment), ()))
+
+    def has(self, symbol, magic=None, comment_contains=None):
+        """
+        True if a position for symbol carries magic; positions without a usable
+        magic fall back to comment_contains matching their comment.
+        """
+        self._fresh()
+        if magic is not None and self._by_magic.get((symbol, magic)):
+            return True
+        if magic is None and comment_contains is None:
+            return bool(self._by_symbol.get(symbol))
+        if comment_contains is not None:
+            for p in self._by_magic.get((symbol, None), ()):
+                if comment_contains in (p.comment or ""):
+                    return True
+        return False
+
+    def get(self, ticket):
+        self._fresh()
+        return self.by_ticket.get(ticket)
+
+    def __len__(self):
+        return len(self.by_ticket)
+
+
+class PositionReportWriter:
+    """
+    Subscriber writing diffs to log_dir/positions_YYYY-MM-DD.txt in the existing
+    block format (POSITION OPENED / CLOSED / SL_UPDATED / TP_UPDATED / MODIFIED),
+    through the background log sink.
+    magic: only report this bot's positions (several bots share one file);
+    positions without a usable magic fall back to comment_contains, as in has().
+    on_new_day: called with the previous day's report path once a diff is
+    written to a new day's file.
+    """
+
+    def __init__(self, log_dir="logs", sink=None, magic=None, comment_contains=None, on_new_day=None):
+        self.log_dir = log_dir
+        self.sink = sink or get_sink()
+        self.magic = magic
+        self.comment_contains = comment_contains
+        self.on_new_day = on_new_day
+        self._path = None
+
+    def mine(self, p):
+        if self.magic is None:
+            return True
+        magic = _magic(p)
+        if magic is not None:
+            return magic == self.magic
+        return self.comment_contains is not None and self.comment_contains in (p.comment or "")
+
+    def __call__(self, diff, book):
+        now = datetime.now(timezone.utc)
+        path = os.path.join(self.log_dir, f"positions_{now:%Y-%m-%d}.txt")
+        if path != self._path:
+            previous, self._path = self._path, path
+            if previous is not None and self.on_new_day is not None:
+                self.on_new_day(previous)
+        for p in diff.opened:
+            if self.mine(p):
+                self.sink.write(path, self.format("OPENED", p, now))
+        for p in diff.closed:
+            if self.mine(p):
+                self.sink.write(path, self.format("CLOSED", p, now))
+        for before, p in diff.modified:
+            if not self.mine(p):
+                continue
+            changed = [f for f in WATCHED_FIELDS if getattr(before, f) != getattr(p, f)]
+            event = {("sl",): "SL_UPDATED", ("tp",): "TP_UPDATED"}.get(tuple(changed), "MODIFIED")
+            self.sink.write(path, self.format(event, p, now))
+
+    @staticmethod
+    def format(event, p, now):
+        rule = "=" * 50
+        side = "BUY" if getattr(p, "type", 0) == 0 else "SELL"
+        return "\n".join([
+            rule, f"POSITION {event}", rule,
+            f"Time: {now:%Y-%m-%d %H:%M:%S} UTC",
+            f"Ticket: {p.ticket}",
+            f"Symbol: {p.symbol}",
+            f"Type: {side}",
+            f"Current Price: {p.price_current:.5f}",
+            f"Open Price: {p.price_open:.5f}",
+            f"Stop Loss: {p.sl:.5f}",
+            f"Take Profit: {p.tp:.5f}",
+            f"Profit: ${p.profit:.2f}",
+            f"Volume: {p.volume}",
+            f"Comment: {p.comment}",
+            rule, "",
+        ])
@@ -0,0 +1,250 @@
+"""
+scheduler.py
+Bar-close event scheduler replacing fixed sleep polling.
+
+The bots used to sleep 5-60 s between polls, so a signal on the M5 close was
+seen with up to a minute of random lag and most wakeups found nothing new.
+BarCloseScheduler knows each job's timeframe and wakes right after the bar
+closes (plus a small settle delay for the terminal to publish it, plus optional
+jitter).  Symbols sharing a timeframe are coalesced into one wakeup, and
+timeframes whose closes coincide (M5 and M15 at :15) fire on the same wakeup.
+
+Waking on the clock does not mean the terminal has the new bar yet: it only
+appears with the first tick after the close.  fresh_bars() re-polls a fetch
+until the forming bar has moved on, so the bar that just closed is not taken
+for the forming one (and its signal lost until the next close).
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger("scheduler")
+
+# MetaTrader5 timeframe constants: minutes below 0x4000, hours in 0x4000 | h,
+# weeks in 0x8000 | w.  Months have no fixed length and are not supported.
+_HOUR_FLAG = 0x4000
+_WEEK_FLAG = 0x8000
+_MONTH_FLAG = 0xC000
+# Weekly bars open on Sunday 00:00 server time; the Unix epoch was a Thursday
+_WEEK_ANCHOR = 3 * 86400
+
+CATCH_UP_MODES = ("latest", "all", "skip")
+
+
+def timeframe_seconds(timeframe):
+    """Bar length in seconds for an MT5 timeframe constant or name ('TIMEFRAME_M15', 'H1')."""
+    if isinstance(timeframe, str):
+        name = timeframe.upper().replace("TIMEFRAME_", "")
+        unit, qty = name[0], name[1:]
+        if name.startswith("MN") or not qty.isdigit():
+            raise ValueError(f"Unsupported timeframe {timeframe}")
+        return int(qty) * {"M": 60, "H": 3600, "D": 86400, "W": 7 * 86400}[unit]
+    tf = int(timeframe)
+    if tf & _MONTH_FLAG == _MONTH_FLAG:
+        raise ValueError("Monthly timeframe has no fixed bar length")
+    if tf & _WEEK_FLAG:
+        return (tf & ~_WEEK_FLAG) * 7 * 86400
+    if tf & _HOUR_FLAG:
+        return (tf & ~_HOUR_FLAG) * 3600
+    return tf * 60
+
+
+class _Group:
+    """All jobs of one timeframe."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.anchor = _WEEK_ANCHOR if seconds % (7 * 86400) == 0 else 0
+        self.jobs = []  # (callback, symbols)
+        self.last_close = None
+
+
+class BarCloseScheduler:
+    """
+    settle: seconds after the close before waking (lets the terminal finalise the bar).
+    jitter: extra random 0..jitter seconds so several processes don't hit the terminal together.
+    catch_up: what to do when a wakeup comes late and closes were missed -
+      "latest" fires once for the most recent close, "all" fires every missed close
+      in order, "skip" drops late closes and waits for the next one.
+    max_lateness: a close older than this (seconds) counts as missed.
+    server_offset: broker server time minus UTC, seconds (bars align to server time).
+    new_bar_poll / new_bar_timeout: fresh_bars() re-poll interval and how long it waits
+      for the first tick of the new bar (no ticks: market closed or illiquid).
+    """
+
+    def __init__(self, settle=0.5, jitter=0.0, catch_up="latest", max_lateness=None,
+                 server_offset=0, new_bar_poll=1.0, new_bar_timeout=30.0, clock=time.time, sleep=None, rng=None):
+        if catch_up not in CATCH_UP_MODES:
+            raise ValueError(f"catch_up must be one of {CATCH_UP_MODES}")
+        self.settle = settle
+        self.jitter = jitter
+        self.catch_up = catch_up
+        self.max_lateness = max_lateness
+        self.server_offset = server_offset
+        self.new_bar_poll = new_bar_poll
+        self.new_bar_timeout = new_bar_timeout
+        self.clock = clock
+        self._stop = threading.Event()
+        self.sleep = sleep or self._stop.wait
+        self.rng = rng or random.Random()
+        self._groups = {}
+        self._seen = {}  # key -> (fetched at, open time of the forming bar then)
+
+    # ------------------------------------------------------------------
+    # Bar arithmetic
+    # ------------------------------------------------------------------
+    def last_close(self, seconds, now=None, anchor=0):
+        """UTC timestamp of the most recent bar close at or before now."""
+        now = self.clock() if now is None else now
+        shifted = now + self.server_offset - anchor
+        return (shifted // seconds) * seconds - self.server_offset + anchor
+
+    def next_close(self, timeframe, now=None):
+        seconds = timeframe_seconds(timeframe)
+        anchor = _WEEK_ANCHOR if seconds % (7 * 86400) == 0 else 0
+        return self.last_close(seconds, now, anchor) + seconds
+
+    def delay_until_close(self, timeframe):
+        """Seconds from now until just after the current bar closes (settle + jitter included)."""
+        return max(self.next_close(timeframe) + self.settle + self._jitter() - self.clock(), 0.0)
+
+    def sleep_until_close(self, timeframe, wake_on=()):
+        """
+        Block until just after the current bar of this timeframe closes.
+        wake_on is accepted for TickStream compatibility; a clock has no intrabar events.
+        """
+        delay = self.delay_until_close(timeframe)
+        if delay > 0:
+            self.sleep(delay)
+
+    # ------------------------------------------------------------------
+    # New-bar check
+    # ------------------------------------------------------------------
+    def new_bar_missing(self, key, timeframe, rates, now=None):
+        """True if a close passed since note_bars(key, ...) but rates still end in the same forming bar."""
+        seen = self._seen.get(key)
+        if seen is None or rates is None or not len(rates):
+            return False
+        now = self.clock() if now is None else now
+        return self.next_close(timeframe, seen[0]) <= now and int(rates["time"][-1]) <= seen[1]
+
+    def note_bars(self, key, rates, fetched_at):
+        """Remember the forming bar of rates, fetched (started) at fetched_at."""
+        if rates is not None and len(rates):
+            self._seen[key] = (fetched_at, int(rates["time"][-1]))
+
+    def fresh_bars(self, key, timeframe, fetch):
+        """
+        fetch() -> rates (forming bar last), re-polled every new_bar_poll seconds
+        while the bar that closed since the previous call still shows as forming.
+        Gives up after new_bar_timeout and returns the last fetch.
+        """
+        started = self.clock()
+        rates = fetch()
+        deadline = started + self.new_bar_timeout
+        while self.new_bar_missing(key, timeframe, rates) and self.clock() < deadline:
+            self.sleep(self.new_bar_poll)
+            started = self.clock()
+            rates = fetch()
+        if self.new_bar_missing(key, timeframe, rates):
+            logger.info(f"No new {key} bar {self.new_bar_timeout:.0f}s after the close; using the last fetch")
+        self.note_bars(key, rates, started)
+        return rates
+
+    async def fresh_bars_async(self, key, timeframe, fetch):
+        """fresh_bars on an event loop: fetch() returns an awaitable, re-polls wait with asyncio.sleep."""
+        started = self.clock()
+        rates = await fetch()
+        deadline = started + self.new_bar_timeout
+        while self.new_bar_missing(key, timeframe, rates) and self.clock() < deadline:
+            await asyncio.sleep(self.new_bar_poll)
+            started = self.clock()
+            rates = await fetch()
+        if self.new_bar_missing(key, timeframe, rates):
+            logger.info(f"No new {key} bar {self.new_bar_timeout:.0f}s after the close; using the last fetch")
+        self.note_bars(key, rates, started)
+        return rates
+
+    def _jitter(self):
+        return self.rng.uniform(0, self.jitter) if self.jitter > 0 else 0.0
+
+    # ------------------------------------------------------------------
+    # Jobs
+    # ------------------------------------------------------------------
+    def add(self, timeframe, callback, symbols=()):
+        """
+        Call callback(symbols, close_time) after every close of timeframe.
+        Registering the same callback again for the same timeframe just adds
+        symbols, so they share one wakeup and one call.
+        """
+        seconds = timeframe_seconds(timeframe)
+        group = self._groups.get(seconds)
+        if group is None:
+            group = self._groups[seconds] = _Group(seconds)
+            group.last_close = self.last_close(seconds, anchor=group.anchor)
+        for job in group.jobs:
+            if job[0] is callback:
+                job[1].extend(s for s in symbols if s not in job[1])
+                return
+        group.jobs.append((callback, list(symbols)))
+
+    def next_wakeup(self, now=None):
+        """Earliest time something is due (next close + settle)."""
+        if not self._groups:
+            return None
+        now = self.clock() if now is None else now
+        return min(g.last_close + g.seconds for g in self._groups.values()) + self.settle
+
+    def delay_until_wakeup(self):
+        """Seconds from now until next_wakeup() (jitter included); None without jobs."""
+        wake = self.next_wakeup()
+        if wake is None:
+            return None
+        return max(wake + self._jitter() - self.clock(), 0.0)
+
+    def run_pending(self, now=None):
+        """Fire every group whose bar has closed since it last fired. Returns the number of calls."""
+        now = self.clock() if now is None else now
+        calls = 0
+        for group in self._groups.values():
+            latest = self.last_close(group.seconds, now - self.settle, group.anchor)
+            if latest <= group.last_close:
+                continue
+            missed = int((latest - group.last_close) // group.seconds)
+            if self.catch_up == "all":
+                closes = [group.last_close + group.seconds * i for i in range(1, missed + 1)]
+            else:
+                closes = [latest]
+            if self.max_lateness is not None:
+                closes = [c for c in closes if now - c <= self.max_lateness]
+            if self.catch_up == "skip" and missed > 1:
+                closes = []
+            if missed > 1:
+                logger.info(f"{missed} closes of {group.seconds}s bars passed since last wakeup ({self.catch_up})")
+            group.last_close = latest
+            for close_time in closes:
+                for callback, symbols in group.jobs:
+                    try:
+                        callback(list(symbols), close_time)
+                    except Exception as e:
+                        logger.error(f"Scheduled job {getattr(callback, '__name__', callback)} failed: {e}")
+                    calls += 1
+        return calls
+
+    def run_forever(self):
+        """Sleep until the next close, fire, repeat; stop() ends the loop."""
+        while not self._stop.is_set():
+            delay = self.delay_until_wakeup()
+            if delay is None:
+                return
+            if delay > 0:
+                self.sleep(delay)
+            if self._stop.is_set():
+                break
+            self.run_pending()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,434 @@
+"""
+simulator.py
+Deterministic in-process MT5 backend that replays recorded bars (and ticks).
+
+SimulatedMT5 has the MetaTrader5 module API (see broker.BACKEND_CALLS) and its
+constants, so the bots, BarCache, PositionBook, the data hub and the async
+runtime run against it unchanged.  Time only moves when step() is called:
+each step closes the forming bar, opens the next one and checks open
+positions' SL/TP against the new bar (SL first, like the backtester's default).
+
+Quotes are the forming bar's close as bid, ask = bid + spread; with recorded
+ticks the latest tick at or before the simulated clock is used instead.
+Market orders fill at the quote plus FillModel slippage (the same model the
+backtester uses), after latency seconds (+ uniform jitter) of simulated time;
+real_sleep=True also sleeps that long so wall-clock benchmarks see it.
+Slippage beyond the request's deviation is a requote.  Everything random
+comes from one seeded generator, so a run is reproducible.
+
+    sim = SimulatedMT5({"XAUUSD": load_rates("XAUUSD_M5.csv")}, timeframe=mt5.TIMEFRAME_M5,
+                       latency=0.05, fill=FillModel(slippage_points=2, slippage_jitter=3))
+    set_backend(sim)      # before importing strategy modules
+    sim.step()            # next bar
+"""
+
+import collections
+import os
+import threading
+import time
+
+import numpy as np
+
+from STOCKDATA import offline_mt5
+from STOCKDATA.backtest import FillModel, load_rates
+from STOCKDATA.bar_cache import RATES_DTYPE
+
+TerminalInfo = collections.namedtuple("TerminalInfo", "connected trade_allowed name")
+Tick = collections.namedtuple("Tick", "time bid ask last volume time_msc flags volume_real")
+SymbolInfo = collections.namedtuple("SymbolInfo", [
+    "name", "visible", "select", "point", "digits", "spread", "trade_contract_size", "trade_tick_size",
+    "trade_tick_value", "volume_min", "volume_max", "volume_step", "trade_stops_level", "trade_freeze_level",
+    "filling_mode", "trade_mode", "bid", "ask", "currency_profit",
+])
+AccountInfo = collections.namedtuple("AccountInfo", [
+    "login", "balance", "equity", "profit", "margin", "margin_free", "leverage", "currency", "server",
+])
+TradePosition = collections.namedtuple("TradePosition", [
+    "ticket", "time", "time_msc", "time_update", "time_update_msc", "type", "magic", "identifier",
+    "reason", "volume", "price_open", "sl", "tp", "price_current", "swap", "profit", "symbol", "comment",
+    "external_id",
+])
+TradeDeal = collections.namedtuple("TradeDeal", [
+    "ticket", "order", "time", "time_msc", "type", "entry", "magic", "position_id", "reason", "volume",
+    "price", "commission", "swap", "profit", "fee", "symbol", "comment", "external_id",
+])
+OrderSendResult = collections.namedtuple("OrderSendResult", [
+    "retcode", "deal", "order", "volume", "price", "bid", "ask", "comment", "request_id",
+    "retcode_external", "request",
+])
+TradeRequest = collections.namedtuple("TradeRequest", [
+    "action", "magic", "order", "symbol", "volume", "price", "stoplimit", "sl", "tp", "deviation", "type",
+    "type_filling", "type_time", "expiration", "comment", "position", "position_by",
+])
+
+TICK_DTYPE = np.dtype([("time", "<i8"), ("bid", "<f8"), ("ask", "<f8")])
+# Layout of MetaTrader5.copy_ticks_* results
+MT5_TICK_DTYPE = np.dtype([("time", "<i8"), ("bid", "<f8"), ("ask", "<f8"), ("last", "<f8"), ("volume", "<u8"),
+                           ("time_msc", "<i8"), ("flags", "<u4"), ("volume_real", "<f8")])
+DEFAULT_SPEC = {"point": 0.01, "digits": 2, "trade_contract_size": 100.0, "volume_min": 0.01,
+                "volume_max": 100.0, "volume_step": 0.01, "trade_stops_level": 0, "filling_mode": 3}
+_CONSTANTS = {k: getattr(offline_mt5, k) for k in dir(offline_mt5) if k.isupper() and k != "OFFLINE"}
+
+
+class SimulatedMT5:
+    """
+    bars: {symbol: RATES_DTYPE array} of one timeframe, oldest first.
+    timeframe: the TIMEFRAME_* constant of the bars (other timeframes get None).
+    start: bars visible before the first step() (the forming bar is bars[start - 1]).
+    ticks: optional {symbol: TICK_DTYPE array} of recorded quotes (a time_msc field is used if present);
+           they are served by symbol_info_tick and copy_ticks_from/copy_ticks_range.
+    specs: {symbol: {...}} overrides of DEFAULT_SPEC (point, digits, contract size, ...).
+    fill: backtest.FillModel for spread and slippage (default: recorded spread, no slippage).
+    latency / latency_jitter: simulated order round-trip in seconds.
+    """
+
+    def __init__(self, bars, timeframe=offline_mt5.TIMEFRAME_M5, start=300, ticks=None, specs=None,
+                 fill=None, latency=0.0, latency_jitter=0.0, real_sleep=False, balance=10000.0,
+                 leverage=100, seed=0):
+        self.__dict__.update(_CONSTANTS)
+        self.bars = {s: np.ascontiguousarray(b, dtype=RATES_DTYPE) for s, b in bars.items()}
+        self.timeframe = timeframe
+        self.cursor = min(start, min(len(b) for b in self.bars.values()))
+        self.ticks = ticks or {}
+        self.specs = {s: dict(DEFAULT_SPEC, **(specs or {}).get(s, {})) for s in self.bars}
+        self.fill = fill or FillModel()
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.real_sleep = real_sleep
+        self.rng = np.random.default_rng(seed)
+        self.balance = balance
+        self.leverage = leverage
+        self.clock_offset = 0.0  # simulated seconds spent inside the current bar (order latency)
+        self.positions = {}
+        self.deals = []
+        self._next_ticket = 1000
+        self._selected = set(self.bars)
+        self._error = (1, "Success")
+        self._lock = threading.RLock()
+        self.stats = collections.Counter()
+
+    @classmethod
+    def from_path(cls, path, **kwargs):
+        """Bars from one file (symbol from its name up to the first '_') or a directory of them."""
+        files = [os.path.join(path, f) for f in sorted(os.listdir(path))] if os.path.isdir(path) else [path]
+        bars = {}
+        for file in files:
+            if file.lower().endswith((".csv", ".txt", ".parquet", ".pq")):
+                bars[os.path.basename(file).split("_")[0].split(".")[0].upper()] = load_rates(file)
+        if not bars:
+            raise ValueError(f"No bar files in {path}")
+        return cls(bars, **kwargs)
+
+    # ------------------------------------------------------------------
+    # Clock
+    # ------------------------------------------------------------------
+    def now(self):
+        """Simulated epoch seconds: open time of the forming bar plus time spent in it."""
+        first = next(iter(self.bars.values()))
+        return int(first["time"][self.cursor - 1] + self.clock_offset)
+
+    def remaining(self):
+        return min(len(b) for b in self.bars.values()) - self.cursor
+
+    def step(self, n=1):
+        """Advance n bars, checking SL/TP of open positions on every new bar; returns bars advanced."""
+        with self._lock:
+            n = min(n, self.remaining())
+            for _ in range(n):
+                self.cursor += 1
+                self.clock_offset = 0.0
+                self._check_exits()
+            return n
+
+    # ------------------------------------------------------------------
+    # Session
+    # ------------------------------------------------------------------
+    def initialize(self, *args, **kwargs):
+        return True
+
+    def login(self, *args, **kwargs):
+        return True
+
+    def shutdown(self):
+        return True
+
+    def last_error(self):
+        return self._error
+
+    def terminal_info(self):
+        return TerminalInfo(connected=True, trade_allowed=True, name="Simulator")
+
+    def account_info(self):
+        floating = sum(p.profit for p in self._marked_positions())
+        margin = sum(p.volume * self.specs[p.symbol]["trade_contract_size"] * p.price_open / self.leverage
+                     for p in self.positions.values())
+        equity = self.balance + floating
+        return AccountInfo(login=1, balance=self.balance, equity=equity, profit=floating, margin=margin,
+                           margin_free=equity - margin, leverage=self.leverage, currency="USD", server="Simulator")
+
+    # ------------------------------------------------------------------
+    # Symbols and quotes
+    # ------------------------------------------------------------------
+    def symbols_get(self, group=None):
+        return tuple(self.symbol_info(s) for s in self.bars)
+
+    def symbol_select(self, symbol, enable=True):
+        if symbol not in self.bars:
+            return False
+        (self._selected.add if enable else self._selected.discard)(symbol)
+        return True
+
+    def symbol_info(self, symbol):
+        if symbol not in self.bars:
+            self._error = (-1, f"Unknown symbol {symbol}")
+            return None
+        spec = self.specs[symbol]
+        tick = self.symbol_info_tick(symbol)
+        return SymbolInfo(name=symbol, visible=symbol in self._selected, select=symbol in self._selected,
+                          point=spec["point"], digits=spec["digits"],
+                          spread=int(round((tick.ask - tick.bid) / spec["point"])),
+                          trade_contract_size=spec["trade_contract_size"], trade_tick_size=spec["point"],
+                          trade_tick_value=spec["trade_contract_size"] * spec["point"],
+                          volume_min=spec["volume_min"], volume_max=spec["volume_max"],
+                          volume_step=spec["volume_step"], trade_stops_level=spec["trade_stops_level"],
+                          trade_freeze_level=0, filling_mode=spec["filling_mode"], trade_mode=4,
+                          bid=tick.bid, ask=tick.ask, currency_profit="USD")
+
+    def symbol_info_tick(self, symbol):
+        bars = self.bars.get(symbol)
+        if bars is None:
+            self._error = (-1, f"Unknown symbol {symbol}")
+            return None
+        now = self.now()
+        recorded = self.ticks.get(symbol)
+        if recorded is not None and len(recorded):
+            i = max(int(np.searchsorted(recorded["time"], now, side="right")) - 1, 0)
+            bid, ask = float(recorded["bid"][i]), float(recorded["ask"][i])
+        else:
+            bar = bars[self.cursor - 1]
+            point = self.specs[symbol]["point"]
+            bid = round(float(bar["close"]), self.specs[symbol]["digits"])
+            spread = self.fill.spread_points if self.fill.spread_points is not None else int(bar["spread"])
+            ask = round(bid + spread * point, self.specs[symbol]["digits"])
+        return Tick(time=now, bid=bid, ask=ask, last=0.0, volume=0, time_msc=now * 1000, flags=6,
+                    volume_real=0.0)
+
+    def _recorded_ticks(self, symbol, lo, hi, count=None):
+        """Recorded ticks with lo <= time <= min(hi, now), as copy_ticks_* returns them."""
+        recorded = self.ticks.get(symbol)
+        if recorded is None:
+            self._error = (-2, f"No recorded ticks for {symbol}")
+            return np.zeros(0, dtype=MT5_TICK_DTYPE)
+        times = recorded["time"]
+        start = int(np.searchsorted(times, lo, side="left"))
+        end = int(np.searchsorted(times, min(hi, self.now()), side="right"))
+        if count is not None:
+            end = min(end, start + count)
+        out = np.zeros(end - start, dtype=MT5_TICK_DTYPE)
+        for field in ("time", "bid", "ask"):
+            out[field] = recorded[field][start:end]
+        names = recorded.dtype.names
+        out["time_msc"] = recorded["time_msc"][start:end] if "time_msc" in names else out["time"] * 1000
+        out["flags"] = 6  # bid and ask changed
+        return out
+
+    def copy_ticks_from(self, symbol, date_from, count, flags=None):
+        return self._recorded_ticks(symbol, _epoch(date_from), self.now(), count)
+
+    def copy_ticks_range(self, symbol, date_from, date_to, flags=None):
+        return self._recorded_ticks(symbol, _epoch(date_from), _epoch(date_to))
+
+    # ------------------------------------------------------------------
+    # Bars (forming bar last, as the terminal returns them)
+    # ------------------------------------------------------------------
+    def _series(self, symbol, timeframe):
+        if timeframe != self.timeframe or symbol not in self.bars:
+            self._error = (-2, f"No {symbol} bars for timeframe {timeframe}")
+            return None
+        return self.bars[symbol][:self.cursor]
+
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        series = self._series(symbol, timeframe)
+        if series is None:
+            return None
+        end = len(series) - start_pos
+        return series[max(end - count, 0):max(end, 0)].copy()
+
+    def copy_rates_from(self, symbol, timeframe, date_from, count):
+        series = self._series(symbol, timeframe)
+        if series is None:
+            return None
+        end = int(np.searchsorted(series["time"], _epoch(date_from), side="right"))
+        return series[max(end - count, 0):end].copy()
+
+    def copy_rates_range(self, symbol, timeframe, date_from, date_to):
+        series = self._series(symbol, timeframe)
+        if series is None:
+            return None
+        lo = int(np.searchsorted(series["time"], _epoch(date_from), side="left"))
+        hi = int(np.searchsorted(series["time"], _epoch(date_to), side="right"))
+        return series[lo:hi].copy()
+
+    # ------------------------------------------------------------------
+    # Trading
+    # ------------------------------------------------------------------
+    def _marked_positions(self):
+        out = []
+        for p in self.positions.values():
+            tick = self.symbol_info_tick(p.symbol)
+            price = tick.bid if p.type == self.POSITION_TYPE_BUY else tick.ask
+            out.append(p._replace(price_current=price, profit=self._profit(p, price)))
+        return out
+
+    def _profit(self, position, price):
+        sign = 1 if position.type == self.POSITION_TYPE_BUY else -1
+        return round(sign * (price - position.price_open) * position.volume
+                     * self.specs[position.symbol]["trade_contract_size"], 2)
+
+    def positions_get(self, symbol=None, group=None, ticket=None):
+        with self._lock:
+            positions = self._marked_positions()
+        if symbol is not None:
+            positions = [p for p in positions if p.symbol == symbol]
+        if ticket is not None:
+            positions = [p for p in positions if p.ticket == ticket]
+        return tuple(positions)
+
+    def orders_get(self, symbol=None, group=None, ticket=None):
+        return ()  # only market execution is simulated
+
+    def history_deals_get(self, date_from=None, date_to=None, group=None, ticket=None, position=None):
+        deals = self.deals
+        if position is not None:
+            deals = [d for d in deals if d.position_id == position]
+        if ticket is not None:
+            deals = [d for d in deals if d.order == ticket]
+        if date_from is not None and date_to is not None:
+            lo, hi = _epoch(date_from), _epoch(date_to)
+            deals = [d for d in deals if lo <= d.time <= hi]
+        return tuple(deals)
+
+    def _ticket(self):
+        self._next_ticket += 1
+        return self._next_ticket
+
+    def _wait(self):
+        delay = self.latency + (self.rng.uniform(0, self.latency_jitter) if self.latency_jitter else 0.0)
+        self.clock_offset += delay
+        if self.real_sleep and delay > 0:
+            time.sleep(delay)
+
+    def order_send(self, request):
+        self.stats["order_send"] += 1
+        req = TradeRequest(**{f: request.get(f, 0) for f in TradeRequest._fields})
+        with self._lock:
+            self._wait()
+            if req.symbol not in self.bars:
+                return self._result(self.TRADE_RETCODE_INVALID, req, "unknown symbol")
+            spec = self.specs[req.symbol]
+            if req.action == self.TRADE_ACTION_SLTP:
+                return self._modify(req)
+            if req.action != self.TRADE_ACTION_DEAL:
+                return self._result(self.TRADE_RETCODE_INVALID, req, "only market deals are simulated")
+            if not spec["volume_min"] <= req.volume <= spec["volume_max"]:
+                return self._result(self.TRADE_RETCODE_INVALID_VOLUME, req, "invalid volume")
+            if req.position:
+                return self._close(req)
+            tick = self.symbol_info_tick(req.symbol)
+            buy = req.type == self.ORDER_TYPE_BUY
+            slip = self.fill.slippage()
+            price = round((tick.ask + slip * spec["point"]) if buy else (tick.bid - slip * spec["point"]),
+                          spec["digits"])
+            if req.price and req.deviation and abs(price - req.price) / spec["point"] > req.deviation:
+                return self._result(self.TRADE_RETCODE_REQUOTE, req, "requote", bid=tick.bid, ask=tick.ask)
+            ticket = self._ticket()
+            now = self.now()
+            self.positions[ticket] = TradePosition(
+                ticket=ticket, time=now, time_msc=now * 1000, time_update=now, time_update_msc=now * 1000,
+                type=self.POSITION_TYPE_BUY if buy else self.POSITION_TYPE_SELL, magic=req.magic,
+                identifier=ticket, reason=3, volume=req.volume, price_open=price, sl=req.sl or 0.0,
+                tp=req.tp or 0.0, price_current=price, swap=0.0, profit=0.0, symbol=req.symbol,
+                comment=req.comment or "", external_id="")
+            deal = self._deal(ticket, req.type, 0, req.magic, req.volume, price, 0.0, req.symbol, req.comment)
+            return self._result(self.TRADE_RETCODE_DONE, req, "Request executed", deal=deal, order=ticket,
+                                volume=req.volume, price=price, bid=tick.bid, ask=tick.ask)
+
+    def _modify(self, req):
+        position = self.positions.get(req.position)
+        if position is None:
+            return self._result(self.TRADE_RETCODE_INVALID, req, "position not found")
+        self.positions[req.position] = position._replace(sl=req.sl, tp=req.tp, time_update=self.now())
+        return self._result(self.TRADE_RETCODE_DONE, req, "Request executed", order=req.position)
+
+    def _close(self, req):
+        position = self.positions.get(req.position)
+        if position is None:
+            return self._result(self.TRADE_RETCODE_INVALID, req, "position not found")
+        tick = self.symbol_info_tick(position.symbol)
+        slip = self.fill.slippage() * self.specs[position.symbol]["point"]
+        price = tick.bid - slip if position.type == self.POSITION_TYPE_BUY else tick.ask + slip
+        deal = self._exit(position, price, "close")
+        return self._result(self.TRADE_RETCODE_DONE, req, "Request executed", deal=deal, order=req.position,
+                            volume=position.volume, price=price, bid=tick.bid, ask=tick.ask)
+
+    def _exit(self, position, price, comment):
+        profit = self._profit(position, price)
+        self.balance += profit
+        del self.positions[position.ticket]
+        closing_type = self.ORDER_TYPE_SELL if position.type == self.POSITION_TYPE_BUY else self.ORDER_TYPE_BUY
+        return self._deal(position.ticket, closing_type, 1, position.magic, position.volume, price, profit,
+                          position.symbol, comment)
+
+    def _deal(self, position_id, type, entry, magic, volume, price, profit, symbol, comment):
+        ticket = self._ticket()
+        now = self.now()
+        self.deals.append(TradeDeal(ticket=ticket, order=position_id, time=now, time_msc=now * 1000, type=type,
+                                    entry=entry, magic=magic, position_id=position_id, reason=3, volume=volume,
+                                    price=price, commission=0.0, swap=0.0, profit=profit, fee=0.0,
+                                    symbol=symbol, comment=comment or "", external_id=""))
+        return ticket
+
+    def _result(self, retcode, req, comment, deal=0, order=0, volume=0.0, price=0.0, bid=0.0, ask=0.0):
+        self.stats[f"retcode_{retcode}"] += 1
+        if retcode != self.TRADE_RETCODE_DONE:
+            self._error = (retcode, comment)
+        return OrderSendResult(retcode=retcode, deal=deal, order=order, volume=volume, price=price, bid=bid,
+                               ask=ask, comment=comment, request_id=self.stats["order_send"],
+                               retcode_external=0, request=req)
+
+    def _check_exits(self):
+        """SL/TP against the bar that just opened, SL first when both are inside its range."""
+        for position in list(self.positions.values()):
+            bar = self.bars[position.symbol][self.cursor - 1]
+            buy = position.type == self.POSITION_TYPE_BUY
+            spread = (self.fill.spread_points if self.fill.spread_points is not None else int(bar["spread"])) \
+                * self.specs[position.symbol]["point"]
+            # Buys exit on the bid, sells on the ask (bid + spread)
+            low, high = (bar["low"], bar["high"]) if buy else (bar["low"] + spread, bar["high"] + spread)
+            if position.sl and (low <= position.sl if buy else high >= position.sl):
+                self._exit(position, position.sl, "sl")
+            elif position.tp and (high >= position.tp if buy else low <= position.tp):
+                self._exit(position, position.tp, "tp")
+
+
+def _epoch(value):
+    if hasattr(value, "timestamp"):
+        return int(value.timestamp())
+    return int(value)
+
+
+def synthetic_bars(n, seed=0, start_price=2000.0, step_seconds=300, start_time=1_700_000_000, volatility=0.6):
+    """Reproducible random-walk M5-style bars for benchmarks and tests."""
+    rng = np.random.default_rng(seed)
+    close = start_price + np.cumsum(rng.normal(0, volatility, n))
+    open_ = np.concatenate([[start_price], close[:-1]])
+    wick = np.abs(rng.normal(0, volatility / 2, (2, n)))
+    bars = np.zeros(n, dtype=RATES_DTYPE)
+    bars["time"] = start_time + np.arange(n, dtype=np.int64) * step_seconds
+    bars["open"] = np.round(open_, 2)
+    bars["close"] = np.round(close, 2)
+    bars["high"] = np.round(np.maximum(open_, close) + wick[0], 2)
+    bars["low"] = np.round(np.minimum(open_, close) - wick[1], 2)
+    bars["tick_volume"] = rng.integers(50, 500, n)
+    bars["spread"] = 20
+    return bars
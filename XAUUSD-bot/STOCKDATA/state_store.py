@@ -0,0 +1,297 @@
+"""
+state_store.py
+Embedded key-value store for the bot's hot runtime state.
+
+active_trades.json, last_executed_candle.json and last_trade_times.json were
+rewritten whole (json.dump over the live file) on every save: the cost grew
+with the file (last_trade_times.json is ~190 KB) and a crash mid-write left a
+truncated file.  Here state is a set of named tables of typed keys - str, int,
+float, bool or tuples of those, e.g. ("XAUUSD", "ote") instead of the
+stringified "('XAUUSD', 'ote')" - and only keys changed since the last flush
+are written, as CRC-framed lines appended to state.log (same framing as
+trade_journal).  When the log outgrows the snapshot it is compacted: the
+whole state goes to state.json via write_atomic and the log is emptied.
+Replaying the log is idempotent, so a crash at any point loses at most the
+unflushed changes and never corrupts what is on disk.
+
+    store = StateStore("logs/state")
+    candles = store.table("last_executed_candle")
+    candles[("XAUUSD", "ote")] = "2025-09-23T12:35:00+00:00"
+    trades = store.table("active_trades")
+    trades.update_fields(150901647838, trailing_sl_level=199.26)
+    store.flush()
+
+migrate_legacy() imports the old JSON files once; open_bot_state() gives each
+bot its own store with them imported (two processes must not share a store).
+"""
+
+import ast
+import json
+import logging
+import os
+import threading
+from collections.abc import MutableMapping
+
+from STOCKDATA.trade_journal import decode_line, encode_line, write_atomic
+
+logger = logging.getLogger("state_store")
+
+_BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DIR = os.path.join(_BASE_DIR, "logs", "state")
+SNAPSHOT_FILE = "state.json"
+LOG_FILE = "state.log"
+_SCALARS = (str, int, float, bool)
+
+
+def encode_key(key):
+    """Typed key -> JSON text (tuples become arrays)."""
+    if isinstance(key, tuple):
+        if not all(isinstance(k, _SCALARS) for k in key):
+            raise TypeError(f"tuple keys may only hold str/int/float/bool: {key!r}")
+        return json.dumps(list(key), separators=(",", ":"))
+    if isinstance(key, _SCALARS):
+        return json.dumps(key)
+    raise TypeError(f"unsupported state key type {type(key).__name__}: {key!r}")
+
+
+def decode_key(text):
+    value = json.loads(text)
+    return tuple(value) if isinstance(value, list) else value
+
+
+class StateTable(MutableMapping):
+    """Dict view of one table; assignments and deletions are remembered until the next flush."""
+
+    def __init__(self, store, name):
+        self._store = store
+        self.name = name
+        self._data = {}
+        self._dirty = set()
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        encode_key(key)  # reject unsupported key types at the call site
+        with self._store._lock:
+            self._data[key] = value
+            self._dirty.add(key)
+
+    def __delitem__(self, key):
+        with self._store._lock:
+            del self._data[key]
+            self._dirty.add(key)
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"StateTable({self.name!r}, {len(self._data)} keys, {len(self._dirty)} dirty)"
+
+    def touch(self, key):
+        """Mark a key dirty after mutating its value in place (e.g. a nested dict)."""
+        with self._store._lock:
+            if key in self._data:
+                self._dirty.add(key)
+
+    def update_fields(self, key, **fields):
+        """Update fields of a dict value (created if missing) and mark the key dirty."""
+        with self._store._lock:
+            self._data.setdefault(key, {}).update(fields)
+            self._dirty.add(key)
+
+
+class StateStore:
+    """
+    directory: holds state.json and state.log (created if missing).
+    compact_ratio / compact_min_bytes: compact once the log is larger than
+    compact_ratio times the snapshot and at least compact_min_bytes.
+    fsync: fsync the log on every flush (turn off for tests / throwaway state).
+    """
+
+    def __init__(self, directory=DEFAULT_DIR, compact_ratio=1.0, compact_min_bytes=256 * 1024, fsync=True):
+        self.directory = directory
+        self.compact_ratio = compact_ratio
+        self.compact_min_bytes = compact_min_bytes
+        self.fsync = fsync
+        self._lock = threading.RLock()
+        self._tables = {}
+        self._snapshot_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        self._snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self._log_path = os.path.join(directory, LOG_FILE)
+        self._load()
+        self._log = open(self._log_path, "ab")
+
+    def table(self, name):
+        with self._lock:
+            table = self._tables.get(name)
+            if table is None:
+                table = self._tables[name] = StateTable(self, name)
+            return table
+
+    def tables(self):
+        return sorted(self._tables)
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+    def _load(self):
+        if os.path.exists(self._snapshot_path):
+            with open(self._snapshot_path, "rb") as f:
+                raw = f.read()
+            self._snapshot_bytes = len(raw)
+            for name, entries in json.loads(raw).items():
+                self.table(name)._data.update((decode_key(k), v) for k, v in entries.items())
+        if not os.path.exists(self._log_path):
+            return
+        good, replayed = 0, 0
+        with open(self._log_path, "rb") as f:
+            for line in f:
+                change = decode_line(line)
+                if change is None:
+                    break
+                good += len(line)
+                replayed += 1
+                data = self.table(change["t"])._data
+                key = decode_key(change["k"])
+                if change.get("d"):
+                    data.pop(key, None)
+                else:
+                    data[key] = change["v"]
+        size = os.path.getsize(self._log_path)
+        if good < size:
+            # Torn tail from a crash mid-flush: keep everything up to the last good line
+            logger.warning(f"Truncating {size - good} bytes of torn data in {self._log_path}")
+            with open(self._log_path, "r+b") as f:
+                f.truncate(good)
+        if replayed:
+            logger.info(f"Replayed {replayed} state changes from {self._log_path}")
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+    def flush(self):
+        """Append the dirty keys of every table to the log; compact if it has grown too large."""
+        with self._lock:
+            chunks = []
+            for table in self._tables.values():
+                for key in table._dirty:
+                    if key in table._data:
+                        change = {"t": table.name, "k": encode_key(key), "v": table._data[key]}
+                    else:
+                        change = {"t": table.name, "k": encode_key(key), "d": 1}
+                    chunks.append(encode_line(change))
+                table._dirty.clear()
+            if not chunks:
+                return 0
+            self._log.write(b"".join(chunks))
+            self._log.flush()
+            if self.fsync:
+                os.fsync(self._log.fileno())
+            log_bytes = self._log.tell()
+            if log_bytes >= self.compact_min_bytes and log_bytes > self.compact_ratio * self._snapshot_bytes:
+                self._compact()
+            return len(chunks)
+
+    def compact(self):
+        """Write the full state to state.json and empty the log."""
+        with self._lock:
+            self.flush()
+            self._compact()
+
+    def _compact(self):
+        state = {name: {encode_key(k): v for k, v in table._data.items()}
+                 for name, table in self._tables.items()}
+        raw = json.dumps(state, separators=(",", ":"), default=str).encode()
+        write_atomic(self._snapshot_path, raw)
+        self._snapshot_bytes = len(raw)
+        # The snapshot already holds every logged change, so a crash before this truncate only replays them again
+        self._log.close()
+        self._log = open(self._log_path, "wb")
+        if self.fsync:
+            os.fsync(self._log.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._log is not None:
+                self.flush()
+                self._log.close()
+                self._log = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_bot_state(name, directory=DEFAULT_DIR):
+    """
+    Store for one bot at directory/<name> (a store has one writing process), with
+    the legacy JSON files imported into it on first use.
+    """
+    store = StateStore(os.path.join(directory, name))
+    migrate_legacy(store)
+    return store
+
+
+# ----------------------------------------------------------------------
+# One-time import of the legacy JSON files
+# ----------------------------------------------------------------------
+def _legacy_key(text):
+    """Keys of the old files: "('XAUUSD', 'ote')" -> tuple, "150901647838" -> int, otherwise str."""
+    if text.startswith("(") and text.endswith(")"):
+        try:
+            value = ast.literal_eval(text)
+            if isinstance(value, tuple):
+                return value
+        except (ValueError, SyntaxError):
+            pass
+    if text.isdigit():
+        return int(text)
+    return text
+
+
+LEGACY_FILES = {
+    "last_executed_candle": os.path.join(_BASE_DIR, "logs", "last_executed_candle.json"),
+    "active_trades": os.path.join(_BASE_DIR, "logs", "active_trades.json"),
+    "last_trade_times": os.path.join(_BASE_DIR, "last_trade_times.json"),
+}
+
+
+def migrate_legacy(store, files=None, force=False):
+    """
+    Import the legacy JSON state files into store (once; recorded in the
+    "_migrations" table).  last_trade_times.json holds several maps
+    (last_trade_times, partial_trade_tracking_map, ...); each becomes a table.
+    The old files are left in place.  Returns {table: keys imported}.
+    """
+    done = store.table("_migrations")
+    imported = {}
+    for name, path in (files or LEGACY_FILES).items():
+        if done.get(name) and not force:
+            continue
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except ValueError as e:
+            logger.error(f"Skipping unreadable legacy state file {path}: {e}")
+            continue
+        nested = isinstance(data, dict) and data and all(isinstance(v, dict) for v in data.values()) \
+            and name == "last_trade_times"
+        for table_name, entries in (data.items() if nested else [(name, data)]):
+            table = store.table(table_name)
+            for key, value in entries.items():
+                table[_legacy_key(key)] = value
+            imported[table_name] = len(entries)
+        done[name] = path
+    store.compact()
+    if imported:
+        logger.info(f"Migrated legacy state: {imported}")
+    return imported
@@ -0,0 +1,147 @@
+"""
+symbol_cache.py
+Cached symbol metadata (point, digits, volume limits, stop level, filling modes).
+
+send_order and points_to_price called mt5.symbol_info() on every order just to
+read .point, and the strategy loops fetched it again every iteration, although
+none of these fields change during a session.  SymbolCache loads the static
+part of SymbolInfo once per symbol - preload() at startup for all configured
+symbols - and serves it from memory until ttl expires or invalidate() is
+called (e.g. after a retcode that suggests the broker changed the contract
+spec).  Live fields (bid/ask/spread) are deliberately not cached.
+
+    SYMBOLS = SymbolCache(mt5)
+    SYMBOLS.preload(configured_symbols(["XAUUSD"]))   # config.json's symbols plus the bot's own
+    point = SYMBOLS.point("XAUUSD")
+    volume = SYMBOLS.normalize_volume("XAUUSD", 0.037)
+"""
+
+import collections
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger("symbol_cache")
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.json")
+
+SymbolMeta = collections.namedtuple("SymbolMeta", [
+    "name", "point", "digits", "trade_contract_size", "trade_tick_size", "trade_tick_value",
+    "volume_min", "volume_max", "volume_step", "trade_stops_level", "trade_freeze_level",
+    "filling_mode", "trade_mode", "visible", "loaded_at",
+])
+
+# Retcodes after which the cached spec may be stale (invalid volume / stops / fill, trading disabled)
+STALE_RETCODES = {10014, 10016, 10017, 10030}
+
+# symbol_info().filling_mode bits -> ORDER_FILLING_* values, in order of preference
+_FILLING_BITS = ((1, "ORDER_FILLING_FOK"), (2, "ORDER_FILLING_IOC"))
+
+
+def load_symbols(path=CONFIG_PATH):
+    """config.json's symbols; [] if the file is missing or not valid JSON."""
+    try:
+        with open(path) as f:
+            return json.load(f).get("symbols", [])
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read symbols from {path}: {e}")
+        return []
+
+
+def configured_symbols(extra=(), path=CONFIG_PATH):
+    """extra followed by config.json's symbols, each once."""
+    return list(dict.fromkeys([*extra, *load_symbols(path)]))
+
+
+class SymbolCache:
+    """
+    mt5: MetaTrader5 module (or the data hub client / offline stand-in).
+    ttl: seconds a loaded spec is trusted before symbol_info() is asked again.
+    """
+
+    def __init__(self, mt5, ttl=3600.0):
+        self.mt5 = mt5
+        self.ttl = ttl
+        self._meta = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "loads": 0}
+
+    def _load(self, symbol):
+        info = self.mt5.symbol_info(symbol)
+        if info is None:
+            return None
+        fields = {name: getattr(info, name, None) for name in SymbolMeta._fields[1:-1]}
+        meta = SymbolMeta(name=symbol, loaded_at=time.monotonic(), **fields)
+        with self._lock:
+            self._meta[symbol] = meta
+            self.stats["loads"] += 1
+        return meta
+
+    def get(self, symbol, refresh=False):
+        """SymbolMeta for symbol (None if the terminal does not know it); loads on miss or expiry."""
+        meta = self._meta.get(symbol)
+        if meta is None or refresh or time.monotonic() - meta.loaded_at > self.ttl:
+            return self._load(symbol)
+        self.stats["hits"] += 1
+        return meta
+
+    def preload(self, symbols):
+        """Select and load every symbol; returns {symbol: SymbolMeta or None}."""
+        loaded = {}
+        for symbol in symbols:
+            meta = self._load(symbol)
+            if meta is not None and not meta.visible:
+                self.mt5.symbol_select(symbol, True)
+                meta = self._load(symbol)
+            if meta is None or not meta.visible:
+                logger.warning(f"Symbol {symbol} not available")
+            loaded[symbol] = meta
+        return loaded
+
+    def invalidate(self, symbol=None):
+        """Forget one symbol (or all); the next get() reloads it."""
+        with self._lock:
+            if symbol is None:
+                self._meta.clear()
+            else:
+                self._meta.pop(symbol, None)
+
+    def check_retcode(self, symbol, retcode):
+        """Invalidate symbol if an order result suggests its spec changed."""
+        if retcode in STALE_RETCODES:
+            logger.info(f"Retcode {retcode} for {symbol}: reloading symbol spec")
+            self.invalidate(symbol)
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+    def _require(self, symbol):
+        meta = self.get(symbol)
+        if meta is None:
+            raise RuntimeError(f"Symbol info missing for {symbol}")
+        return meta
+
+    def point(self, symbol):
+        return self._require(symbol).point
+
+    def normalize_price(self, symbol, price):
+        return round(price, self._require(symbol).digits)
+
+    def normalize_volume(self, symbol, volume):
+        """Round volume down to volume_step and clamp it to [volume_min, volume_max]."""
+        meta = self._require(symbol)
+        step = meta.volume_step or 0.01
+        volume = math.floor(volume / step + 1e-9) * step
+        volume = min(max(volume, meta.volume_min or step), meta.volume_max or volume)
+        return round(volume, max(0, -int(math.floor(math.log10(step)))))
+
+    def filling_type(self, symbol):
+        """Preferred ORDER_FILLING_* the symbol allows (RETURN if neither FOK nor IOC is flagged)."""
+        mode = self._require(symbol).filling_mode or 0
+        for bit, name in _FILLING_BITS:
+            if mode & bit:
+                return getattr(self.mt5, name)
+        return getattr(self.mt5, "ORDER_FILLING_RETURN")
@@ -0,0 +1,391 @@
+"""
+tick_stream.py
+Tick-stream mode: tick ring buffers, bars built from ticks, intrabar events.
+
+The strategies only see closed bars and use ticks for nothing but the spread
+check.  TickStream polls copy_ticks_from() (falling back to
+symbol_info_tick() when the terminal returns no tick history) for just the
+ticks newer than the last one it saw, appends them to a fixed-size ring per
+symbol and feeds them to one BarBuilder per timeframe, which keeps the forming
+bar up to date and closes it when a tick of the next bar arrives (or, in a
+quiet market, when the clock passes its end).  Memory per symbol is bounded by
+the tick capacity plus max_bars per timeframe.
+
+Every poll turns the new ticks into events handed to subscribers:
+
+    bar_close         a bar of one of the timeframes closed (detail: timeframe, bar)
+    spread_wide       spread rose above max_spread_points
+    spread_normal     spread fell back to normal_ratio x max_spread_points or less
+    stop_hunt_high    the forming bar swept the high of the last hunt_lookback bars
+    stop_hunt_low     by at least hunt_points and price is back inside the range
+
+sleep_until_close() has the BarCloseScheduler signature, so a loop can swap one
+for the other; wait_for() wakes on any event type, e.g. as soon as the spread
+normalises instead of after a fixed sleep.
+
+    stream = TickStream(mt5, ["XAUUSD"], timeframes=(mt5.TIMEFRAME_M5,), max_spread_points=40)
+    stream.subscribe(lambda event, stream: print(event))
+    stream.wait_for(("spread_normal",), timeout=30, symbol="XAUUSD")
+    rates = stream.rates("XAUUSD", mt5.TIMEFRAME_M5, 300)   # forming bar last
+"""
+
+import collections
+import logging
+import threading
+import time
+
+import numpy as np
+
+from STOCKDATA.bar_cache import RATES_DTYPE, BarRing
+from STOCKDATA.scheduler import _WEEK_ANCHOR, timeframe_seconds
+from STOCKDATA.symbol_cache import SymbolCache
+
+logger = logging.getLogger("tick_stream")
+
+# 44 bytes per tick: 10k ticks are ~440 KB per symbol
+TICK_DTYPE = np.dtype([
+    ("time", "<i8"),
+    ("time_msc", "<i8"),
+    ("bid", "<f8"),
+    ("ask", "<f8"),
+    ("last", "<f8"),
+    ("volume", "<f8"),
+    ("flags", "<u4"),
+])
+
+EVENT_TYPES = ("bar_close", "spread_wide", "spread_normal", "stop_hunt_high", "stop_hunt_low")
+
+Event = collections.namedtuple("Event", "type symbol time_msc price detail")
+
+
+def to_ticks(raw):
+    """MT5 tick array (copy_ticks_*) or a single symbol_info_tick() result -> TICK_DTYPE array."""
+    if raw is None:
+        return np.zeros(0, dtype=TICK_DTYPE)
+    if not hasattr(raw, "dtype"):  # Tick namedtuple
+        raw = [raw]
+        get = lambda field: np.array([getattr(t, field, 0) or 0 for t in raw])
+    else:
+        names = raw.dtype.names or ()
+        get = lambda field: raw[field] if field in names else np.zeros(len(raw))
+    ticks = np.zeros(len(raw), dtype=TICK_DTYPE)
+    ticks["time"] = get("time")
+    msc = get("time_msc")
+    ticks["time_msc"] = np.where(msc > 0, msc, ticks["time"] * 1000)
+    ticks["bid"] = get("bid")
+    ticks["ask"] = get("ask")
+    ticks["last"] = get("last")
+    ticks["volume"] = get("volume_real")
+    ticks["flags"] = get("flags")
+    return ticks
+
+
+class BarBuilder:
+    """
+    Bars of one timeframe built from bid ticks, in the copy_rates layout.
+    Closed bars go to a BarRing of max_bars; the forming bar is kept apart and
+    updated in place.  spread is the narrowest spread of the bar in points.
+    """
+
+    def __init__(self, timeframe, max_bars=500, point=None):
+        self.timeframe = timeframe
+        self.seconds = timeframe_seconds(timeframe)
+        self.anchor = _WEEK_ANCHOR if self.seconds % (7 * 86400) == 0 else 0
+        self.point = point
+        self.closed = BarRing(max_bars)
+        self.forming = None  # 1-record RATES_DTYPE array
+
+    def seed(self, rates):
+        """Start from copy_rates history (forming bar last) so rates() has a full window from the first tick."""
+        if len(rates):
+            self.closed.clear()
+            self.closed.extend(rates[:-1])
+            self.forming = np.array(rates[-1:], dtype=RATES_DTYPE)
+
+    def bucket(self, times):
+        return (times - self.anchor) // self.seconds * self.seconds + self.anchor
+
+    def update(self, ticks):
+        """Fold ticks (TICK_DTYPE, oldest first) in; returns the bars this closed (oldest first)."""
+        if not len(ticks):
+            return []
+        buckets = self.bucket(ticks["time"])
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1, [len(ticks)]))
+        closed = []
+        for lo, hi in zip(starts[:-1], starts[1:]):
+            opened_at = int(buckets[lo])
+            latest = int(self.forming["time"][0]) if self.forming is not None else self.closed.last_time
+            if latest is not None and (opened_at < latest or (self.forming is None and opened_at == latest)):
+                continue  # late ticks of a bar already closed
+            bid = ticks["bid"][lo:hi]
+            spread = int(round(float(np.min(ticks["ask"][lo:hi] - bid)) / self.point)) if self.point else 0
+            if self.forming is not None and opened_at == self.forming["time"][0]:
+                bar = self.forming
+                bar["high"] = max(bar["high"][0], bid.max())
+                bar["low"] = min(bar["low"][0], bid.min())
+                bar["close"] = bid[-1]
+                bar["tick_volume"] = int(bar["tick_volume"][0]) + int(hi - lo)
+                bar["spread"] = min(int(bar["spread"][0]), spread)
+                continue
+            if self.forming is not None:
+                closed.append(self._close())
+            bar = np.zeros(1, dtype=RATES_DTYPE)
+            bar["time"] = opened_at
+            bar["open"] = bid[0]
+            bar["high"] = bid.max()
+            bar["low"] = bid.min()
+            bar["close"] = bid[-1]
+            bar["tick_volume"] = hi - lo
+            bar["spread"] = spread
+            self.forming = bar
+        return closed
+
+    def close_due(self, now):
+        """Close the forming bar if its period ended before now (no tick of the next bar needed)."""
+        if self.forming is not None and self.forming["time"][0] + self.seconds <= now:
+            return [self._close()]
+        return []
+
+    def _close(self):
+        bar = self.forming
+        self.closed.extend(bar)
+        self.forming = None
+        return bar[0]
+
+    def rates(self, count=None):
+        """Closed bars plus the forming one (last), like copy_rates_from_pos(symbol, tf, 0, count)."""
+        closed = self.closed.view()
+        if self.forming is not None:
+            closed = np.concatenate((closed, self.forming))
+        return closed if count is None else closed[-count:]
+
+
+class _SymbolState:
+    def __init__(self, capacity):
+        self.ticks = BarRing(capacity, dtype=TICK_DTYPE)
+        self.last_msc = None
+        self.seen_at_last = 0  # ticks already taken with time_msc == last_msc
+        self.builders = {}
+        self.spread_wide = False
+        self.hunted = set()  # (event type, bar time) already reported
+
+
+class TickStream:
+    """
+    mt5: MetaTrader5 module (or hub client / simulator); needs copy_ticks_from or symbol_info_tick.
+    symbols, timeframes: what to stream and which bars to build.
+    capacity: ticks kept per symbol; max_bars: closed bars kept per (symbol, timeframe).
+    max_spread_points / normal_ratio: spread_wide above max, spread_normal at or below ratio x max.
+    hunt_lookback / hunt_points: stop-hunt reference range (closed bars of the first timeframe)
+    and how far beyond it the wick has to reach.
+    server_offset: broker server time minus UTC, seconds (tick times are server time);
+      None estimates it from the first quote, to the nearest half hour.
+    """
+
+    def __init__(self, mt5, symbols, timeframes=(5,), capacity=10000, max_bars=500, max_spread_points=None,
+                 normal_ratio=0.8, hunt_lookback=12, hunt_points=0, poll_interval=0.1, batch=5000,
+                 server_offset=None, symbol_cache=None, clock=time.time, sleep=None):
+        self.mt5 = mt5
+        self.timeframes = tuple(timeframes)
+        self.max_bars = max_bars
+        self.max_spread_points = max_spread_points
+        self.normal_ratio = normal_ratio
+        self.hunt_lookback = hunt_lookback
+        self.hunt_points = hunt_points
+        self.poll_interval = poll_interval
+        self.batch = batch
+        self.server_offset = server_offset
+        self.symbol_cache = symbol_cache or SymbolCache(mt5)
+        self.clock = clock
+        self._stop = threading.Event()
+        self.sleep = sleep or self._stop.wait
+        self._capacity = capacity
+        self._symbols = {}
+        self._subscribers = []
+        self.stats = collections.Counter()
+        for symbol in symbols:
+            self.add_symbol(symbol)
+
+    def add_symbol(self, symbol):
+        if symbol not in self._symbols:
+            state = self._symbols[symbol] = _SymbolState(self._capacity)
+            point = self._point(symbol)
+            state.builders = {tf: BarBuilder(tf, self.max_bars, point) for tf in self.timeframes}
+
+    def _point(self, symbol):
+        meta = self.symbol_cache.get(symbol)
+        return meta.point if meta is not None else None
+
+    def seed(self, symbol, timeframe, rates):
+        """Load bar history for (symbol, timeframe), e.g. from BarCache.get(); ticks then extend it."""
+        self._symbols[symbol].builders[timeframe].seed(rates)
+
+    def subscribe(self, callback):
+        """callback(event, stream) for every event of every poll."""
+        self._subscribers.append(callback)
+
+    # ------------------------------------------------------------------
+    # Polling
+    # ------------------------------------------------------------------
+    def _offset_from(self, quote):
+        """Set server_offset from a quote's server time if it was not given."""
+        if self.server_offset is None and quote is not None and quote.time:
+            self.server_offset = int(round((quote.time - self.clock()) / 1800.0)) * 1800
+            logger.info(f"Broker server offset estimated at {self.server_offset / 3600:+.1f}h")
+
+    def _fetch(self, symbol, state):
+        """Ticks newer than the last one taken, as TICK_DTYPE."""
+        if state.last_msc is None:
+            # Start at the current quote: asking for history from "now" in the wrong
+            # time zone would replay hours of old ticks and stale bar closes
+            quote = self.mt5.symbol_info_tick(symbol)
+            self.stats["quote_polls"] += 1
+            self._offset_from(quote)
+            return to_ticks(quote)
+        ticks = None
+        copy_ticks = getattr(self.mt5, "copy_ticks_from", None)
+        if copy_ticks is not None:
+            since = state.last_msc // 1000
+            try:
+                ticks = copy_ticks(symbol, since, self.batch, self.mt5.COPY_TICKS_INFO)
+            except Exception as e:
+                logger.error(f"copy_ticks_from({symbol}) failed: {e}")
+        if ticks is None or not len(ticks):
+            self.stats["quote_polls"] += 1
+            ticks = self.mt5.symbol_info_tick(symbol)
+        ticks = to_ticks(ticks)
+        if not len(ticks):
+            return ticks
+        msc = ticks["time_msc"]
+        # Same-millisecond ticks come back again from a since-second query; skip the ones already taken
+        same = np.flatnonzero(msc == state.last_msc)
+        keep = msc > state.last_msc
+        keep[same[state.seen_at_last:]] = True
+        return ticks[keep]
+
+    def poll(self):
+        """Take new ticks for every symbol, update bars and dispatch events; returns the events."""
+        events = []
+        fetched = {symbol: self._fetch(symbol, state) for symbol, state in self._symbols.items()}
+        now = self.clock() + (self.server_offset or 0)
+        for symbol, state in self._symbols.items():
+            ticks = fetched[symbol]
+            if len(ticks):
+                self.stats["ticks"] += len(ticks)
+                state.ticks.extend(ticks)
+                last = int(ticks["time_msc"][-1])
+                taken = int(np.count_nonzero(ticks["time_msc"] == last))
+                state.seen_at_last = state.seen_at_last + taken if last == state.last_msc else taken
+                state.last_msc = last
+                events.extend(self._spread_events(symbol, state, ticks))
+            for tf, builder in state.builders.items():
+                for bar in builder.update(ticks) + builder.close_due(now):
+                    events.append(Event("bar_close", symbol, int(bar["time"] + builder.seconds) * 1000,
+                                        float(bar["close"]), {"timeframe": tf, "bar": bar}))
+            if len(ticks):
+                events.extend(self._hunt_events(symbol, state, ticks))
+        for event in events:
+            self.stats[event.type] += 1
+            for callback in self._subscribers:
+                try:
+                    callback(event, self)
+                except Exception as e:
+                    logger.error(f"Tick event subscriber {callback!r} failed: {e}")
+        return events
+
+    def _spread_events(self, symbol, state, ticks):
+        if not self.max_spread_points:
+            return []
+        builder = next(iter(state.builders.values()), None)
+        point = builder.point if builder is not None else None
+        if not point:
+            return []
+        spread = (ticks["ask"] - ticks["bid"]) / point
+        wide = spread > self.max_spread_points
+        normal = spread <= self.max_spread_points * self.normal_ratio
+        events, i = [], 0
+        # Only the transitions are walked; between them the state holds (hysteresis band in between)
+        while i < len(ticks):
+            hits = np.flatnonzero((normal if state.spread_wide else wide)[i:])
+            if not len(hits):
+                break
+            i += int(hits[0])
+            state.spread_wide = not state.spread_wide
+            kind = "spread_wide" if state.spread_wide else "spread_normal"
+            events.append(Event(kind, symbol, int(ticks["time_msc"][i]), float(ticks["bid"][i]),
+                                {"spread_points": float(spread[i])}))
+        return events
+
+    def _hunt_events(self, symbol, state, ticks):
+        """Wick beyond the recent range with price back inside it, checked on the forming bar each poll."""
+        builder = state.builders[self.timeframes[0]]
+        recent = builder.closed.view(self.hunt_lookback)
+        bar = builder.forming
+        if bar is None or len(recent) < self.hunt_lookback or not builder.point:
+            return []
+        events = []
+        reach = self.hunt_points * builder.point
+        bid = float(ticks["bid"][-1])
+        opened_at = int(bar["time"][0])
+        top, bottom = float(recent["high"].max()), float(recent["low"].min())
+        for kind, swept, back_inside, level in (
+                ("stop_hunt_high", bar["high"][0] >= top + reach, bid < top, top),
+                ("stop_hunt_low", bar["low"][0] <= bottom - reach, bid > bottom, bottom)):
+            if swept and back_inside and (kind, opened_at) not in state.hunted:
+                state.hunted.add((kind, opened_at))
+                extreme = float(bar["high"][0] if kind == "stop_hunt_high" else bar["low"][0])
+                events.append(Event(kind, symbol, int(ticks["time_msc"][-1]), bid,
+                                    {"level": level, "extreme": extreme, "timeframe": builder.timeframe}))
+        state.hunted = {key for key in state.hunted if key[1] >= opened_at}
+        return events
+
+    # ------------------------------------------------------------------
+    # Waiting
+    # ------------------------------------------------------------------
+    def wait_for(self, types, timeout=None, symbol=None, timeframe=None):
+        """Poll until an event of one of types (for symbol / timeframe, if given) or timeout; returns it or None."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._stop.is_set():
+            for event in self.poll():
+                if event.type not in types or (symbol is not None and event.symbol != symbol):
+                    continue
+                if timeframe is not None and event.type == "bar_close" and event.detail["timeframe"] != timeframe:
+                    continue
+                return event
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            self.sleep(self.poll_interval)
+        return None
+
+    def sleep_until_close(self, timeframe, wake_on=()):
+        """Block until a bar of timeframe closes, or earlier on an event in wake_on; returns the event."""
+        return self.wait_for(("bar_close",) + tuple(wake_on), timeframe=timeframe)
+
+    def stop(self):
+        self._stop.set()
+
+    # ------------------------------------------------------------------
+    # Data
+    # ------------------------------------------------------------------
+    def ticks(self, symbol, n=None):
+        """Newest n ticks of symbol (read-only view, oldest first)."""
+        return self._symbols[symbol].ticks.view(n)
+
+    def rates(self, symbol, timeframe, count=None):
+        return self._symbols[symbol].builders[timeframe].rates(count)
+
+    def spread_points(self, symbol):
+        state = self._symbols[symbol]
+        point = next(iter(state.builders.values())).point
+        if not len(state.ticks) or not point:
+            return None
+        last = state.ticks.view(1)[0]
+        return float(last["ask"] - last["bid"]) / point
+
+    def memory_bytes(self):
+        """Bytes held by tick and bar buffers."""
+        total = 0
+        for state in self._symbols.values():
+            total += state.ticks._buf.nbytes
+            total += sum(b.closed._buf.nbytes for b in state.builders.values())
+        return total
@@ -0,0 +1,405 @@
+"""
+trade_archive.py
+One-shot importer compacting the historical trade artifacts into a columnar archive.
+
+Sources (all streamed line by line):
+  trades/trade_log.csv and its .bak_* / .backup_* copies -> "trades"
+  trades/trades_YYYY-MM-DD.txt "TRADE EXECUTED" blocks   -> "executions"
+  logs/positions_YYYY-MM-DD.txt "POSITION ..." blocks     -> "positions"
+
+The CSV backups are mostly full copies of each other, so identical raw lines are
+skipped before parsing; the remaining rows are keyed by trade identity (ticket,
+or strategy/type/entry time/SL/TP/comment for the rows written before tickets
+were logged) and the version from the newest file wins.  The log went through
+several column layouts (with and without ticket / symbol, aggregate columns vs
+slippage/latency) which are mapped onto one typed schema; the running aggregate
+columns are dropped since they can be derived.
+
+Output: <out>/<dataset>/date=YYYY-MM-DD/part.parquet (zstd) when pyarrow is
+installed, otherwise part.npz (compressed NumPy), plus manifest.json.
+
+    python -m STOCKDATA.trade_archive            # import into trades/archive
+    load_archive("trades", start="2025-08-01")   # -> DataFrame
+
+The bots call refresh_in_background() at startup and when their daily
+positions report rolls over; it re-imports on a daemon thread only if a source
+file changed since the archive was written.
+"""
+
+import csv
+import glob
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # fall back to compressed .npz partitions
+    pa = pq = None
+
+logger = logging.getLogger("trade_archive")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_OUT = os.path.join(ROOT, "trades", "archive")
+
+# dataset -> [(column, kind)]; kind is time / float / int / str.  The first time column partitions.
+SCHEMAS = {
+    "trades": [
+        ("entry_time", "time"), ("ticket", "int"), ("symbol", "str"), ("strategy", "str"),
+        ("trade_type", "str"), ("lot_size", "float"), ("stop_loss", "float"), ("take_profit", "float"),
+        ("comment", "str"), ("risk_amount", "float"), ("equity_before", "float"), ("equity_after", "float"),
+        ("exit_time", "time"), ("profit", "float"), ("win_loss", "str"), ("slippage", "float"),
+        ("latency", "float"),
+    ],
+    "executions": [
+        ("time", "time"), ("strategy", "str"), ("symbol", "str"), ("type", "str"),
+        ("entry_price", "float"), ("stop_loss", "float"), ("take_profit_1", "float"),
+        ("take_profit_2", "float"), ("lot_size", "float"), ("risk_amount", "float"),
+        ("reward_amount", "float"), ("risk_reward_ratio", "float"),
+    ],
+    "positions": [
+        ("time", "time"), ("event", "str"), ("ticket", "int"), ("symbol", "str"), ("type", "str"),
+        ("current_price", "float"), ("open_price", "float"), ("stop_loss", "float"),
+        ("take_profit", "float"), ("profit", "float"), ("volume", "float"), ("comment", "str"),
+    ],
+}
+
+_MISSING_TIME = np.iinfo(np.int64).min
+_MISSING_INT = -1
+
+# trade_log.csv layouts, by the shape of the row
+_LAYOUT_AGGREGATES = ["strategy", "trade_type", "lot_size", "entry_time", "stop_loss", "take_profit", "comment",
+                      "risk_amount", "equity_before", "equity_after", "exit_time", "profit", "win_loss"]
+_LAYOUT_LATENCY = _LAYOUT_AGGREGATES + ["slippage", "latency"]
+_LAYOUT_TICKET = ["ticket"] + _LAYOUT_LATENCY
+_LAYOUT_TICKET_SYMBOL = ["ticket", "symbol", "strategy", "trade_type", "lot_size", "entry_time", "stop_loss",
+                         "take_profit", "comment", "risk_amount", "equity_before", "equity_after", "slippage",
+                         "latency", "exit_time", "profit", "win_loss"]
+_SIDES = ("BUY", "SELL")
+
+
+# ----------------------------------------------------------------------
+# Value parsing
+# ----------------------------------------------------------------------
+def _to_epoch(text):
+    text = text.strip().replace(" UTC", "")
+    if not text:
+        return _MISSING_TIME
+    try:
+        return int(datetime.strptime(text[:19], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp())
+    except ValueError:
+        return _MISSING_TIME
+
+
+def _to_float(text):
+    text = text.strip().lstrip("$").replace(",", "")
+    try:
+        return float(text) if text else np.nan
+    except ValueError:
+        return np.nan
+
+
+def _to_int(text):
+    text = text.strip()
+    return int(text) if text.isdigit() else _MISSING_INT
+
+
+_CONVERT = {"time": _to_epoch, "float": _to_float, "int": _to_int, "str": str.strip}
+_EMPTY = {"time": _MISSING_TIME, "float": np.nan, "int": _MISSING_INT, "str": ""}
+
+
+def _typed(dataset, raw):
+    return {col: _CONVERT[kind](raw[col]) if raw.get(col) not in (None, "") else _EMPTY[kind]
+            for col, kind in SCHEMAS[dataset]}
+
+
+# ----------------------------------------------------------------------
+# CSV trade logs
+# ----------------------------------------------------------------------
+def _csv_layout(row):
+    if row[0].isdigit():
+        if len(row) > 3 and row[3] in _SIDES:  # ticket, symbol, strategy, BUY/SELL, ...
+            return _LAYOUT_TICKET_SYMBOL
+        return _LAYOUT_TICKET
+    if len(row) > 13 and "%" in row[13]:
+        return _LAYOUT_AGGREGATES
+    return _LAYOUT_LATENCY
+
+
+def _backup_order(path):
+    """Oldest first: backups by their timestamp suffix, the live log last."""
+    match = re.search(r"(\d{9,})", os.path.basename(path))
+    return (0, int(match.group(1))) if match else (1, 0)
+
+
+def trade_log_paths(trades_dir):
+    paths = glob.glob(os.path.join(trades_dir, "trade_log.csv.*")) + [os.path.join(trades_dir, "trade_log.csv")]
+    return sorted((p for p in paths if os.path.isfile(p)), key=_backup_order)
+
+
+def iter_trade_log_rows(paths, stats=None):
+    """Yield typed trade rows from the CSV logs; raw lines already seen are not parsed again."""
+    seen_lines = set()
+    stats = stats if stats is not None else {}
+    for path in paths:
+        with open(path, newline="", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                stats["lines"] = stats.get("lines", 0) + 1
+                if line in seen_lines:
+                    continue
+                seen_lines.add(line)
+                row = next(csv.reader([line]), None)
+                if not row or row[0] == "Strategy":
+                    continue
+                layout = _csv_layout(row)
+                raw = dict(zip(layout, row))
+                if not raw.get("strategy") or not raw.get("entry_time"):
+                    continue  # stray fragments such as "67,,,,"
+                yield _typed("trades", raw)
+
+
+def _trade_identity(row):
+    if row["ticket"] != _MISSING_INT:
+        return row["ticket"]
+    return (row["strategy"], row["trade_type"], row["entry_time"], row["stop_loss"], row["take_profit"],
+            row["comment"])
+
+
+def dedupe_trades(rows):
+    """Latest version of each trade (rows from newer files replace older ones)."""
+    latest = {}
+    for row in rows:
+        latest[_trade_identity(row)] = row
+    return list(latest.values())
+
+
+# ----------------------------------------------------------------------
+# Block reports (TRADE EXECUTED / POSITION ...)
+# ----------------------------------------------------------------------
+def iter_blocks(path):
+    """
+    Yield (title, {field: value}) for each block:
+        =====
+        TITLE
+        =====
+        Key: value
+        - Key: value
+        =====
+    """
+    title, fields, state = None, {}, "idle"
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("====="):
+                if state == "idle":
+                    state = "title"
+                elif state == "header":
+                    state = "body"
+                elif state == "body":
+                    yield title, fields
+                    title, fields, state = None, {}, "idle"
+                continue
+            if state == "title":
+                title, state = line, "header"
+            elif state == "body" and ":" in line:
+                key, _, value = line.lstrip("- ").partition(":")
+                fields[key.strip().lower().replace("/", "_").replace(" ", "_")] = value.strip()
+
+
+def iter_executions(paths):
+    for path in paths:
+        for title, fields in iter_blocks(path):
+            if title != "TRADE EXECUTED":
+                continue
+            fields["take_profit_1"] = fields.pop("take_profit_1", fields.get("take_profit", ""))
+            yield _typed("executions", fields)
+
+
+def iter_position_events(paths):
+    for path in paths:
+        for title, fields in iter_blocks(path):
+            if not title or not title.startswith("POSITION"):
+                continue
+            fields["event"] = title.split(" ", 1)[1] if " " in title else ""
+            yield _typed("positions", fields)
+
+
+def _dedupe_exact(rows):
+    seen = set()
+    for row in rows:
+        key = tuple((k, v) for k, v in row.items() if not (isinstance(v, float) and v != v))
+        if key not in seen:
+            seen.add(key)
+            yield row
+
+
+# ----------------------------------------------------------------------
+# Archive I/O
+# ----------------------------------------------------------------------
+def _columns(dataset, rows):
+    out = {}
+    for col, kind in SCHEMAS[dataset]:
+        values = [r[col] for r in rows]
+        if kind in ("time", "int"):
+            out[col] = np.array(values, dtype=np.int64)
+        elif kind == "float":
+            out[col] = np.array(values, dtype=np.float64)
+        else:
+            out[col] = np.array(values, dtype=str) if values else np.array([], dtype="U1")
+    return out
+
+
+def _write_partition(directory, columns, dataset):
+    os.makedirs(directory, exist_ok=True)
+    if pa is not None:
+        arrays = {}
+        for col, kind in SCHEMAS[dataset]:
+            values = columns[col]
+            if kind == "time":
+                arrays[col] = pa.array(values.astype("datetime64[s]"), mask=values == _MISSING_TIME)
+            else:
+                arrays[col] = pa.array(values)
+        pq.write_table(pa.table(arrays), os.path.join(directory, "part.parquet"), compression="zstd")
+    else:
+        np.savez_compressed(os.path.join(directory, "part.npz"), **columns)
+
+
+def write_archive(out_dir, datasets, sources=None):
+    """Replace out_dir with date partitions of each {dataset: rows}. Returns the manifest."""
+    tmp = f"{out_dir}.tmp{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    manifest = {"format": "parquet" if pa is not None else "npz", "created": time.time(),
+                "sources": sources or {}, "datasets": {}}
+    for dataset, rows in datasets.items():
+        time_col = SCHEMAS[dataset][0][0]
+        by_day = {}
+        for row in rows:
+            stamp = row[time_col]
+            day = (datetime.fromtimestamp(stamp, timezone.utc).strftime("%Y-%m-%d")
+                   if stamp != _MISSING_TIME else "unknown")
+            by_day.setdefault(day, []).append(row)
+        for day, day_rows in by_day.items():
+            day_rows.sort(key=lambda r: r[time_col])
+            _write_partition(os.path.join(tmp, dataset, f"date={day}"), _columns(dataset, day_rows), dataset)
+        manifest["datasets"][dataset] = {"rows": sum(len(r) for r in by_day.values()),
+                                         "partitions": sorted(by_day)}
+    with open(os.path.join(tmp, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp, out_dir)
+    return manifest
+
+
+def load_archive(dataset, start=None, end=None, columns=None, archive_dir=DEFAULT_OUT):
+    """
+    DataFrame of one dataset, reading only the partitions whose date is within
+    [start, end] ('YYYY-MM-DD').  Time columns come back as datetime64 (UTC).
+    """
+    base = os.path.join(archive_dir, dataset)
+    parts = []
+    for name in sorted(os.listdir(base)):
+        day = name.split("=", 1)[1]
+        if day != "unknown" and ((start and day < start) or (end and day > end)):
+            continue
+        directory = os.path.join(base, name)
+        if os.path.exists(os.path.join(directory, "part.parquet")):
+            parts.append(pq.read_table(os.path.join(directory, "part.parquet"), columns=columns).to_pandas())
+        else:
+            with np.load(os.path.join(directory, "part.npz")) as npz:
+                parts.append(pd.DataFrame({c: npz[c] for c in (columns or npz.files)}))
+    if not parts:
+        return pd.DataFrame(columns=columns or [c for c, _ in SCHEMAS[dataset]])
+    df = pd.concat(parts, ignore_index=True)
+    for col, kind in SCHEMAS[dataset]:
+        if kind == "time" and col in df.columns and df[col].dtype == np.int64:
+            df[col] = df[col].to_numpy().astype("datetime64[s]")  # the missing marker is NaT
+    return df
+
+
+def source_paths(root=ROOT):
+    """{dataset: paths} of the artifacts the archive is built from."""
+    return {
+        "trades": trade_log_paths(os.path.join(root, "trades")),
+        "executions": sorted(glob.glob(os.path.join(root, "trades", "trades_*.txt"))),
+        "positions": sorted(glob.glob(os.path.join(root, "logs", "positions_*.txt"))),
+    }
+
+
+def import_history(root=ROOT, out_dir=DEFAULT_OUT):
+    """Parse every historical artifact under root and write the archive. Returns the manifest."""
+    t0 = time.perf_counter()
+    stats = {}
+    sources = source_paths(root)
+    log_paths = sources["trades"]
+    trades = dedupe_trades(iter_trade_log_rows(log_paths, stats))
+    executions = list(_dedupe_exact(iter_executions(sources["executions"])))
+    positions = list(_dedupe_exact(iter_position_events(sources["positions"])))
+    manifest = write_archive(out_dir, {"trades": trades, "executions": executions, "positions": positions},
+                             {"trade_log_files": len(log_paths), "csv_lines": stats.get("lines", 0)})
+    logger.info(f"Imported {len(trades)} trades from {stats.get('lines', 0)} CSV lines in {len(log_paths)} files, "
+                f"{len(executions)} executions, {len(positions)} position events "
+                f"in {time.perf_counter() - t0:.1f}s")
+    return manifest
+
+
+def archive_stale(root=ROOT, out_dir=DEFAULT_OUT):
+    """True if there is no archive yet or a source file was modified after it was written."""
+    try:
+        with open(os.path.join(out_dir, "manifest.json")) as f:
+            created = json.load(f)["created"]
+    except (OSError, ValueError, KeyError):
+        return True
+    for paths in source_paths(root).values():
+        for path in paths:
+            try:
+                if os.path.getmtime(path) > created:
+                    return True
+            except OSError:
+                continue
+    return False
+
+
+_refresh_lock = threading.Lock()
+
+
+def refresh_archive(root=ROOT, out_dir=DEFAULT_OUT):
+    """Re-import if the archive is stale. Returns the manifest, or None if nothing ran."""
+    if not _refresh_lock.acquire(blocking=False):
+        return None  # an import is already running in this process
+    try:
+        if not archive_stale(root, out_dir):
+            return None
+        return import_history(root, out_dir)
+    except Exception as e:  # another process replacing the archive at the same moment, unreadable logs, ...
+        logger.error(f"Trade archive refresh failed: {e}")
+        return None
+    finally:
+        _refresh_lock.release()
+
+
+def refresh_in_background(root=ROOT, out_dir=DEFAULT_OUT):
+    """refresh_archive on a daemon thread, so a bot never waits for the import."""
+    thread = threading.Thread(target=refresh_archive, args=(root, out_dir), name="trade-archive", daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+    out_dir = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_OUT
+    manifest = import_history(ROOT, out_dir)
+    print(json.dumps({k: v["rows"] for k, v in manifest["datasets"].items()}))
+
+
+if __name__ == "__main__":
+    main()
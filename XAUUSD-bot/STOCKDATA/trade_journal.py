@@ -0,0 +1,342 @@
+"""
+trade_journal.py
+Segmented append-only trade journal with checkpoints.
+
+trades/trade_log.csv was kept safe by copying the whole file before every
+rewrite (350+ trade_log.csv.bak_* copies) and every row repeated the running
+Win Rate / Total Profit / Total Trades / Profitability columns.  Here each trade
+event is one line appended to the current segment (journal-000001.log, ...), so
+writing a trade costs O(1) and the journal grows linearly with trades.
+
+Line format: "<crc32 hex> <json>\\n".  After a crash the torn or corrupt tail
+of the last segment is cut off at the last good line.  Every checkpoint_every
+records the running summary and the journal position are written to
+checkpoint.json atomically (temp file, fsync, rename), so opening the journal
+only replays the records after the checkpoint.
+
+Records are dicts; a record with a "profit" value is a closed trade and counts
+towards the summary.  Suggested keys: ticket, strategy, symbol, side, lot,
+entry_time, entry_price, sl, tp, comment, risk, equity_before, equity_after,
+exit_time, exit_price, profit.
+"""
+
+import csv
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+
+logger = logging.getLogger("trade_journal")
+
+FSYNC_MODES = ("always", "batch", "never")
+SEGMENT_PREFIX = "journal-"
+SEGMENT_SUFFIX = ".log"
+CHECKPOINT_FILE = "checkpoint.json"
+
+LEGACY_COLUMNS = ["Strategy", "Trade Type", "Lot Size", "Entry Time", "Stop Loss", "Target", "Comment",
+                  "Risk Amount", "Equity Before Trade", "Equity After Trade", "Exit Time", "Profit",
+                  "Win/Loss", "Win Rate", "Total Loss Amount", "Total Profit Amount", "Total Trades",
+                  "Profitability"]
+
+
+def encode_line(record):
+    """record as one CRC-framed journal line (bytes); state_store uses the same framing."""
+    payload = json.dumps(record, separators=(",", ":"), default=str)
+    return f"{zlib.crc32(payload.encode()):08x} {payload}\n".encode()
+
+
+def decode_line(line):
+    """Record for a journal line, or None if the line is torn or corrupt."""
+    if not line.endswith(b"\n") or len(line) < 10:
+        return None
+    crc, payload = line[:8], line[9:-1]
+    try:
+        if int(crc, 16) != zlib.crc32(payload):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+def _fsync_dir(path):
+    if os.name == "nt":
+        return  # directories cannot be opened for fsync on Windows
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_atomic(path, data):
+    """Write bytes so readers see either the old or the new file, never a partial one."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(os.path.dirname(os.path.abspath(path)))
+
+
+class JournalSummary:
+    """Running aggregates, updated in O(1) per closed trade."""
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.trades = state.get("trades", 0)
+        self.wins = state.get("wins", 0)
+        self.losses = state.get("losses", 0)
+        self.total_profit = state.get("total_profit", 0.0)
+        self.total_loss = state.get("total_loss", 0.0)
+        self.by_strategy = state.get("by_strategy", {})
+
+    def apply(self, record):
+        profit = record.get("profit")
+        if profit in (None, ""):
+            return
+        profit = float(profit)
+        self.trades += 1
+        if profit > 0:
+            self.wins += 1
+            self.total_profit += profit
+        elif profit < 0:
+            self.losses += 1
+            self.total_loss += -profit
+        strat = self.by_strategy.setdefault(str(record.get("strategy", "")), [0, 0, 0.0])
+        strat[0] += 1
+        strat[1] += profit > 0
+        strat[2] += profit
+
+    @property
+    def win_rate(self):
+        return self.wins / self.trades if self.trades else 0.0
+
+    @property
+    def profitability(self):
+        """Net profit (total profit minus total loss)."""
+        return self.total_profit - self.total_loss
+
+    def state(self):
+        return {"trades": self.trades, "wins": self.wins, "losses": self.losses,
+                "total_profit": self.total_profit, "total_loss": self.total_loss,
+                "by_strategy": self.by_strategy}
+
+    def as_dict(self):
+        """The aggregates the CSV log used to carry on every row."""
+        return {
+            "Win Rate": f"{self.win_rate:.2%}",
+            "Total Loss Amount": round(self.total_loss, 2),
+            "Total Profit Amount": round(self.total_profit, 2),
+            "Total Trades": self.trades,
+            "Profitability": round(self.profitability, 2),
+        }
+
+
+class TradeJournal:
+    """
+    directory: where segments and the checkpoint live (created if missing).
+    segment_bytes: roll over to a new segment once the current one reaches this size.
+    checkpoint_every: records between checkpoints.
+    fsync: "always" (each record durable before append() returns), "batch"
+      (at most fsync_interval seconds of records at risk: a record not synced by a
+      later append is synced by a timer) or "never" (OS decides).
+    """
+
+    def __init__(self, directory, segment_bytes=4 * 1024 * 1024, checkpoint_every=500,
+                 fsync="always", fsync_interval=1.0):
+        if fsync not in FSYNC_MODES:
+            raise ValueError(f"fsync must be one of {FSYNC_MODES}")
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.checkpoint_every = checkpoint_every
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.summary = JournalSummary()
+        self.records = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._segment = 0
+        self._since_checkpoint = 0
+        self._last_sync = time.monotonic()
+        self._dirty = False
+        self._timer = None
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    # ------------------------------------------------------------------
+    # Segments
+    # ------------------------------------------------------------------
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{number:06d}{SEGMENT_SUFFIX}")
+
+    def segments(self):
+        numbers = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                try:
+                    numbers.append(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+                except ValueError:
+                    continue
+        return sorted(numbers)
+
+    def _open_segment(self, number):
+        if self._file is not None:
+            self._sync(force=True)
+            self._file.close()
+        self._segment = number
+        self._file = open(self._segment_path(number), "ab")
+        _fsync_dir(self.directory)
+
+    def _scan(self, number, offset=0):
+        """Yield (record, end offset) for the good lines of a segment from offset."""
+        with open(self._segment_path(number), "rb") as f:
+            f.seek(offset)
+            for line in f:
+                record = decode_line(line)
+                if record is None:
+                    return
+                offset += len(line)
+                yield record, offset
+
+    # ------------------------------------------------------------------
+    # Recovery / checkpoints
+    # ------------------------------------------------------------------
+    def _recover(self):
+        checkpoint_path = os.path.join(self.directory, CHECKPOINT_FILE)
+        segment, offset = 1, 0
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                checkpoint = json.load(f)
+            self.summary = JournalSummary(checkpoint["summary"])
+            self.records = checkpoint["records"]
+            segment, offset = checkpoint["segment"], checkpoint["offset"]
+        numbers = [n for n in self.segments() if n >= segment] or [segment]
+        replayed = 0
+        for number in numbers:
+            if not os.path.exists(self._segment_path(number)):
+                break
+            start = offset if number == segment else 0
+            end = start
+            for record, end in self._scan(number, start):
+                self.summary.apply(record)
+                self.records += 1
+                replayed += 1
+            size = os.path.getsize(self._segment_path(number))
+            if end < size:
+                # Torn write from a crash: drop everything after the last good line
+                logger.warning(f"Truncating {size - end} bytes of torn data in segment {number}")
+                with open(self._segment_path(number), "r+b") as f:
+                    f.truncate(end)
+                    os.fsync(f.fileno())
+        if replayed:
+            logger.info(f"Replayed {replayed} journal records after checkpoint")
+        self._open_segment(numbers[-1])
+        self._since_checkpoint = replayed
+
+    def checkpoint(self):
+        """Persist the summary and journal position; later opens replay only what follows."""
+        with self._lock:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        self._sync(force=True)
+        state = {"summary": self.summary.state(), "records": self.records,
+                 "segment": self._segment, "offset": self._file.tell(), "written_at": time.time()}
+        write_atomic(os.path.join(self.directory, CHECKPOINT_FILE), json.dumps(state).encode())
+        self._since_checkpoint = 0
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+    def _sync(self, force=False):
+        self._file.flush()
+        if self.fsync == "never":
+            return
+        now = time.monotonic()
+        if force or self.fsync == "always" or now - self._last_sync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._last_sync = now
+            self._dirty = False
+            return
+        self._dirty = True
+        if self._timer is None:
+            # Idle journal: nothing else would sync this record, so do it when the interval is up
+            self._timer = threading.Timer(self._last_sync + self.fsync_interval - now, self._timed_sync)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _timed_sync(self):
+        with self._lock:
+            self._timer = None
+            if self._file is not None and self._dirty:
+                try:
+                    self._sync(force=True)
+                except OSError as e:
+                    logger.error(f"Journal fsync failed: {e}")
+
+    def append(self, record):
+        """Append one trade event. O(1): one line write, plus the fsync policy."""
+        data = encode_line(record)
+        with self._lock:
+            if self._file.tell() + len(data) > self.segment_bytes and self._file.tell() > 0:
+                self._open_segment(self._segment + 1)
+            self._file.write(data)
+            self._sync()
+            self.summary.apply(record)
+            self.records += 1
+            self._since_checkpoint += 1
+            if self._since_checkpoint >= self.checkpoint_every:
+                self._checkpoint()
+
+    def close(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._file is not None:
+                self._checkpoint()
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+    def __iter__(self):
+        """All records, oldest first."""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+        for number in self.segments():
+            for record, _ in self._scan(number):
+                yield record
+
+    def export_csv(self, path):
+        """Write the journal in the old trade_log.csv layout, aggregates computed while streaming."""
+        running = JournalSummary()
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(LEGACY_COLUMNS)
+            for r in self:
+                running.apply(r)
+                profit = r.get("profit")
+                closed = profit not in (None, "")
+                aggregates = running.as_dict()
+                writer.writerow([
+                    r.get("strategy", ""), str(r.get("side", "")).upper(), r.get("lot", ""),
+                    r.get("entry_time", ""), r.get("sl", ""), r.get("tp", ""), r.get("comment", ""),
+                    r.get("risk", ""), r.get("equity_before", ""), r.get("equity_after", ""),
+                    r.get("exit_time", ""), profit if closed else "",
+                    ("Win" if float(profit) > 0 else "Loss") if closed else "",
+                    aggregates["Win Rate"], aggregates["Total Loss Amount"],
+                    aggregates["Total Profit Amount"], aggregates["Total Trades"],
+                    aggregates["Profitability"],
+                ])
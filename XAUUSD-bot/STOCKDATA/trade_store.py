@@ -0,0 +1,284 @@
+"""
+trade_store.py
+SQLite trade store (trades/trades.db) tuned for the dashboard queries.
+
+The database runs in WAL mode, so the dashboard can read while the bot writes.
+Trades are upserted on ticket in batches: one prepared INSERT ... ON CONFLICT
+statement and one transaction per batch, and a later event for the same ticket
+(e.g. the exit) only fills in the columns it carries.  Per-strategy and
+per-symbol daily PnL live in rollup tables that are refreshed for just the
+(day, key) pairs a batch touched, each refresh bounded by a composite index
+that also covers the profit column, so analytics never scan the trades table
+or the CSV.
+
+    store = TradeStore()
+    store.upsert({"ticket": 1507716, "symbol": "XAUUSD", "strategy": "ote",
+                  "trade_type": "BUY", "timestamp": "2025-08-04 06:04:23"})
+    store.upsert({"ticket": 1507716, "exit_time": "2025-08-04 07:10:00", "profit": 12.4})
+    store.flush()
+    store.strategy_pnl(since="2025-08-01")
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+logger = logging.getLogger("trade_store")
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "trades", "trades.db")
+
+# Column set of schema.sql (older databases are migrated up to it)
+COLUMNS = {
+    "ticket": "INTEGER", "timestamp": "TEXT", "entry_time": "TEXT", "exit_time": "TEXT",
+    "symbol": "TEXT", "strategy": "TEXT", "trade_type": "TEXT",
+    "lot_size": "REAL", "requested_price": "REAL", "executed_price": "REAL",
+    "stop_loss": "REAL", "take_profit": "REAL",
+    "profit": "REAL", "win_loss": "TEXT", "risk_amount": "REAL",
+    "equity_before": "REAL", "equity_after": "REAL", "equity": "TEXT",
+    "slippage": "REAL", "latency": "REAL", "comment": "TEXT",
+    "order_result": "TEXT", "order_comment": "TEXT",
+}
+
+_ROLLUP_COLUMNS = """
+  trades INTEGER NOT NULL,
+  wins INTEGER NOT NULL,
+  losses INTEGER NOT NULL,
+  gross_profit REAL NOT NULL,
+  gross_loss REAL NOT NULL,
+  net_profit REAL NOT NULL,
+  lots REAL NOT NULL"""
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS trades (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  {", ".join(f"{name} {kind}{' UNIQUE' if name == 'ticket' else ''}" for name, kind in COLUMNS.items())}
+);
+CREATE TABLE IF NOT EXISTS daily_strategy_pnl (
+  day TEXT NOT NULL,
+  strategy TEXT NOT NULL,{_ROLLUP_COLUMNS},
+  PRIMARY KEY (day, strategy)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS daily_symbol_pnl (
+  day TEXT NOT NULL,
+  symbol TEXT NOT NULL,{_ROLLUP_COLUMNS},
+  PRIMARY KEY (day, symbol)
+) WITHOUT ROWID;
+"""
+
+# Composite indexes carrying profit/lot_size so rollup refreshes never touch the table rows
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_trades_strategy_ts ON trades(strategy, timestamp, profit, lot_size);
+CREATE INDEX IF NOT EXISTS idx_trades_symbol_exit ON trades(symbol, exit_time, profit, lot_size);
+CREATE INDEX IF NOT EXISTS idx_trades_timestamp ON trades(timestamp);
+CREATE INDEX IF NOT EXISTS idx_trades_type ON trades(trade_type);
+"""
+
+# Per-strategy PnL is booked on the trade's day (timestamp), per-symbol PnL on its exit day
+_ROLLUPS = {
+    "daily_strategy_pnl": ("strategy", "timestamp"),
+    "daily_symbol_pnl": ("symbol", "exit_time"),
+}
+
+
+def _day_bounds(day):
+    """[day, next day) as text bounds; timestamps are 'YYYY-MM-DD HH:MM:SS[ UTC]'."""
+    return day, day + "\x7f"
+
+
+class TradeStore:
+    """
+    path: database file (created and migrated as needed).
+    batch_size / flush_interval: upserts are buffered until this many are pending
+    or the oldest has waited this long (checked on each upsert); flush() forces it.
+    """
+
+    def __init__(self, path=DEFAULT_DB, batch_size=200, flush_interval=1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._oldest = None
+        self._lock = threading.RLock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints, safe with WAL
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self._migrate()
+
+    def _migrate(self):
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+            existing = {row["name"] for row in self.conn.execute("PRAGMA table_info(trades)")}
+            for name, kind in COLUMNS.items():
+                if name not in existing:
+                    self.conn.execute(f"ALTER TABLE trades ADD COLUMN {name} {kind}")
+            # Older writers only filled entry_time; the indexes key on timestamp
+            self.conn.execute("UPDATE trades SET timestamp = entry_time WHERE timestamp IS NULL AND entry_time IS NOT NULL")
+            self.conn.executescript(INDEXES)
+        if not self.conn.execute("SELECT 1 FROM daily_strategy_pnl LIMIT 1").fetchone():
+            self.rebuild_rollups()
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+    def upsert(self, record):
+        """Queue one trade (must carry ticket); later records for a ticket fill in its other columns."""
+        row = {k: v for k, v in record.items() if k in COLUMNS and v is not None}
+        if row.get("ticket") is None:
+            raise ValueError("trade record needs a ticket")
+        if "timestamp" not in row and "entry_time" in row:
+            row["timestamp"] = row["entry_time"]
+        with self._lock:
+            merged = self._pending.setdefault(row["ticket"], {})
+            merged.update(row)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if len(self._pending) >= self.batch_size or time.monotonic() - self._oldest >= self.flush_interval:
+                self.flush()
+
+    def upsert_many(self, records):
+        for record in records:
+            self.upsert(record)
+        self.flush()
+
+    def flush(self):
+        """Write pending upserts in one transaction and refresh the rollups they touched."""
+        with self._lock:
+            if not self._pending:
+                return 0
+            batch = list(self._pending.values())
+            self._pending = {}
+            self._oldest = None
+            # Group by column set so each group is one prepared executemany
+            groups = {}
+            for row in batch:
+                groups.setdefault(tuple(sorted(row)), []).append(row)
+            with self.conn:
+                touched = self._rollup_keys([row["ticket"] for row in batch])
+                for cols, rows in groups.items():
+                    updates = ", ".join(f"{c} = excluded.{c}" for c in cols if c != "ticket") or "ticket = ticket"
+                    sql = (f"INSERT INTO trades ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+                           f"ON CONFLICT(ticket) DO UPDATE SET {updates}")
+                    self.conn.executemany(sql, [tuple(r[c] for c in cols) for r in rows])
+                for table, keys in self._rollup_keys([row["ticket"] for row in batch]).items():
+                    keys |= touched[table]
+                    for key, day in keys:
+                        self._refresh_rollup(table, key, day)
+            return len(batch)
+
+    def _rollup_keys(self, tickets):
+        keys = {table: set() for table in _ROLLUPS}
+        for i in range(0, len(tickets), 500):
+            chunk = tickets[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT strategy, timestamp, symbol, exit_time FROM trades WHERE ticket IN ({', '.join('?' * len(chunk))})",
+                chunk).fetchall()
+            for row in rows:
+                for table, (key_col, time_col) in _ROLLUPS.items():
+                    if row[key_col] is not None and row[time_col]:
+                        keys[table].add((row[key_col], row[time_col][:10]))
+        return keys
+
+    def _refresh_rollup(self, table, key, day):
+        key_col, time_col = _ROLLUPS[table]
+        lo, hi = _day_bounds(day)
+        self.conn.execute(f"DELETE FROM {table} WHERE day = ? AND {key_col} = ?", (day, key))
+        self.conn.execute(
+            f"""INSERT INTO {table} (day, {key_col}, trades, wins, losses, gross_profit, gross_loss, net_profit, lots)
+                SELECT ?, ?, COUNT(*), SUM(profit > 0), SUM(profit < 0),
+                       TOTAL(CASE WHEN profit > 0 THEN profit END), TOTAL(CASE WHEN profit < 0 THEN -profit END),
+                       TOTAL(profit), TOTAL(lot_size)
+                FROM trades WHERE {key_col} = ? AND {time_col} >= ? AND {time_col} < ? AND profit IS NOT NULL
+                HAVING COUNT(*) > 0""",
+            (day, key, key, lo, hi))
+
+    def rebuild_rollups(self):
+        """Recompute every rollup row from the trades table."""
+        with self._lock, self.conn:
+            for table, (key_col, time_col) in _ROLLUPS.items():
+                self.conn.execute(f"DELETE FROM {table}")
+                self.conn.execute(
+                    f"""INSERT INTO {table} (day, {key_col}, trades, wins, losses, gross_profit, gross_loss, net_profit, lots)
+                        SELECT substr({time_col}, 1, 10), {key_col}, COUNT(*), SUM(profit > 0), SUM(profit < 0),
+                               TOTAL(CASE WHEN profit > 0 THEN profit END), TOTAL(CASE WHEN profit < 0 THEN -profit END),
+                               TOTAL(profit), TOTAL(lot_size)
+                        FROM trades WHERE profit IS NOT NULL AND {key_col} IS NOT NULL AND {time_col} IS NOT NULL
+                        GROUP BY 1, 2""")
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.conn.close()
+
+    # ------------------------------------------------------------------
+    # Dashboard queries (rollups and index range scans only)
+    # ------------------------------------------------------------------
+    def _rows(self, sql, params=()):
+        with self._lock:
+            return [dict(r) for r in self.conn.execute(sql, params)]
+
+    def strategy_pnl(self, since=None, until=None):
+        """Totals per strategy over [since, until] days (YYYY-MM-DD)."""
+        return self._rows(
+            """SELECT strategy, SUM(trades) AS trades, SUM(wins) AS wins, SUM(losses) AS losses,
+                      SUM(gross_profit) AS gross_profit, SUM(gross_loss) AS gross_loss,
+                      SUM(net_profit) AS net_profit, 1.0 * SUM(wins) / SUM(trades) AS win_rate
+               FROM daily_strategy_pnl WHERE day >= ? AND day <= ? GROUP BY strategy ORDER BY net_profit DESC""",
+            (since or "", until or "9999"))
+
+    def daily_pnl(self, strategy=None, symbol=None, since=None):
+        """One row per day, optionally for one strategy or one symbol."""
+        if symbol is not None:
+            table, key_col, key = "daily_symbol_pnl", "symbol", symbol
+        else:
+            table, key_col, key = "daily_strategy_pnl", "strategy", strategy
+        where = "day >= ?" + (f" AND {key_col} = ?" if key is not None else "")
+        params = (since or "",) + ((key,) if key is not None else ())
+        return self._rows(
+            f"""SELECT day, SUM(trades) AS trades, SUM(wins) AS wins, SUM(net_profit) AS net_profit
+                FROM {table} WHERE {where} GROUP BY day ORDER BY day""", params)
+
+    def account_summary(self):
+        """All-time totals from the rollups (what /api/account shows)."""
+        rows = self._rows(
+            """SELECT SUM(trades) AS trades, SUM(wins) AS wins, SUM(losses) AS losses,
+                      SUM(gross_profit) AS gross_profit, SUM(gross_loss) AS gross_loss, SUM(net_profit) AS net_profit
+               FROM daily_strategy_pnl""")
+        summary = rows[0]
+        trades = summary["trades"] or 0
+        summary["win_rate"] = (summary["wins"] or 0) / trades if trades else 0.0
+        return summary
+
+    def recent_trades(self, limit=50, strategy=None):
+        """Newest trades first (served from the timestamp indexes)."""
+        if strategy is not None:
+            return self._rows("SELECT * FROM trades WHERE strategy = ? ORDER BY timestamp DESC LIMIT ?",
+                              (strategy, limit))
+        return self._rows("SELECT * FROM trades ORDER BY timestamp DESC LIMIT ?", (limit,))
+
+
+def main():
+    """python -m STOCKDATA.trade_store [summary|strategies|daily|recent] - JSON for the dashboard server."""
+    command = sys.argv[1] if len(sys.argv) > 1 else "summary"
+    store = TradeStore(os.environ.get("TRADES_DB", DEFAULT_DB))
+    try:
+        result = {
+            "summary": store.account_summary,
+            "strategies": store.strategy_pnl,
+            "daily": store.daily_pnl,
+            "recent": store.recent_trades,
+        }[command]()
+    finally:
+        store.close()
+    print(json.dumps(result, default=str))
+
+
+if __name__ == "__main__":
+    main()
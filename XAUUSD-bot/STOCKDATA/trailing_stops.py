@@ -0,0 +1,387 @@
+"""
+trailing_stops.py
+Vectorised trailing stops with a minimum step and a rate-limited SL modify queue.
+
+active_trades keeps trailing_sl_level / trailing_sl_distance / atr per ticket,
+and the trailing logic sent an SL modification whenever the level moved at
+all - the positions_*.txt reports are mostly "POSITION SL_UPDATED" blocks a
+few points apart, each one a broker round-trip.  TrailingStopManager
+recomputes the level of every tracked open ticket in one numpy pass over the
+PositionBook snapshot (price_current is the bid for buys and the ask for
+sells, so no extra quotes are fetched):
+
+    level   = price - distance (buy) / price + distance (sell), only ever tightened
+    allowed = at least the broker's stop level away from price
+    send    = only if the SL moves by at least max(min_step_points, stops_level) points
+
+The ratchet itself is unchanged - the level never loosens and trails at the
+same distance - so the broker SL lags the computed level by less than one
+step.  Modifications go into a queue keyed by ticket: a newer level for a
+ticket still waiting replaces the queued one, and drain() sends at most
+`rate` per second (burst `burst`).  Requotes and transient errors stay queued,
+fatal retcodes drop the entry; closed positions are forgotten via the
+PositionBook diff, and tickets already gone at the first snapshot (closed while
+nothing was running, so no diff ever reports them) are dropped on the first
+update.
+
+ActiveTradeRecorder is the writer: subscribed to the same PositionBook, it
+registers each position a strategy opens (by its magic) in active_trades,
+trailing at the position's initial SL distance unless trail_points is given.
+
+    trades = STATE.table("active_trades")
+    trailing = TrailingStopManager(mt5, POSITIONS, trades, symbol_cache=SYMBOLS)
+    POSITIONS.subscribe(ActiveTradeRecorder(mt5, trades, "macd", magic=112233, symbol_cache=SYMBOLS))
+    POSITIONS.refresh()
+    trailing.step()          # recompute + drain
+
+    python -m STOCKDATA.trailing_stops --interval 1     # standalone, on the state store's active_trades
+    python -m STOCKDATA.trailing_stops --strategy macd=112233:150   # trail only MACD trades, 150 points
+"""
+
+import argparse
+import collections
+import json
+import logging
+import threading
+import time
+
+import numpy as np
+
+from STOCKDATA.order_router import DONE, FATAL, classify
+from STOCKDATA.symbol_cache import SymbolCache
+
+logger = logging.getLogger("trailing_stops")
+
+# Retcode 10025 "no changes": the broker already has this SL
+_NO_CHANGES = 10025
+
+Modify = collections.namedtuple("Modify", "ticket symbol sl tp queued_at")
+
+# name=magic of the strategy modules (their CONFIG["magic"]), trailed by the standalone runner by default
+DEFAULT_STRATEGIES = ("moving_average_crossover=987654", "macd=112233")
+
+
+class TokenBucket:
+    """rate tokens per second, at most burst stored."""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+
+    def take(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class TrailingStopManager:
+    """
+    mt5: MetaTrader5 module (or hub client / simulator).
+    book: PositionBook refreshed by the caller once per cycle.
+    trades: mapping ticket -> active_trades record (StateTable or dict); needs
+      direction and trailing_sl_distance (or atr, times atr_multiplier).
+    min_step_points: smallest SL move worth a modification, in points.
+    rate / burst: modifications sent per second.
+    """
+
+    def __init__(self, mt5, book, trades, symbol_cache=None, min_step_points=10, atr_multiplier=1.5,
+                 rate=5.0, burst=10, dry_run=False, clock=time.monotonic):
+        self.mt5 = mt5
+        self.book = book
+        self.trades = trades
+        self.symbol_cache = symbol_cache or SymbolCache(mt5)
+        self.min_step_points = min_step_points
+        self.atr_multiplier = atr_multiplier
+        self.dry_run = dry_run
+        self.clock = clock
+        self.bucket = TokenBucket(rate, burst, clock)
+        self.queue = collections.OrderedDict()  # ticket -> Modify, oldest first
+        self._lock = threading.Lock()
+        self._pruned = False
+        self.stats = collections.Counter()
+        book.subscribe(self._on_diff)
+
+    def _on_diff(self, diff, book):
+        for position in diff.closed:
+            self.forget(position.ticket)
+
+    def forget(self, ticket):
+        """Drop a closed ticket from the queue and from the tracked trades."""
+        with self._lock:
+            self.queue.pop(ticket, None)
+        if ticket in self.trades:
+            del self.trades[ticket]
+
+    def _prune(self):
+        """Forget tracked tickets missing from the first snapshot: they closed before it, unreported."""
+        gone = [ticket for ticket in list(self.trades) if ticket not in self.book.by_ticket]
+        for ticket in gone:
+            self.forget(ticket)
+        self._pruned = True
+        if gone:
+            self.stats["pruned"] += len(gone)
+            logger.info(f"Dropped {len(gone)} tracked trades no longer open: {gone}")
+
+    # ------------------------------------------------------------------
+    # Recompute
+    # ------------------------------------------------------------------
+    def _distance(self, record):
+        distance = record.get("trailing_sl_distance")
+        if not distance and record.get("atr"):
+            distance = record["atr"] * self.atr_multiplier
+        return distance
+
+    def _gather(self):
+        """Parallel lists for the tracked tickets that are open and have a usable distance."""
+        rows = []
+        for ticket, record in list(self.trades.items()):
+            position = self.book.by_ticket.get(ticket)
+            distance = self._distance(record) if isinstance(record, dict) else None
+            if position is None or not distance:
+                continue
+            meta = self.symbol_cache.get(position.symbol)
+            if meta is None or not meta.point:
+                continue
+            side = 1.0 if position.type == self.mt5.POSITION_TYPE_BUY else -1.0
+            level = record.get("trailing_sl_level") or position.sl or 0.0
+            rows.append((ticket, position.symbol, position.tp, side, position.price_current, distance, level,
+                         position.sl or 0.0, meta.point, meta.trade_stops_level or 0, meta.digits or 5))
+        return rows
+
+    def update(self):
+        """Recompute every tracked ticket's level in one pass; queue the SLs worth sending. Returns count queued."""
+        if not self._pruned and self.book.ok:
+            self._prune()
+        rows = self._gather()
+        if not rows:
+            return 0
+        tickets, symbols, tps, *columns = zip(*rows)
+        side, price, distance, level, sl, point, stops, digits = (np.asarray(c, dtype=np.float64) for c in columns)
+        has_sl = sl > 0
+        tracked = level
+
+        # Ratchet: never loosen the tracked level
+        candidate = price - side * distance
+        level = np.where(tracked > 0, np.where(side > 0, np.maximum(tracked, candidate),
+                                               np.minimum(tracked, candidate)), candidate)
+        # Broker minimum distance from the current price
+        limit = price - side * stops * point
+        target = np.where(side > 0, np.minimum(level, limit), np.maximum(level, limit))
+        target = np.round(target / point) * point
+        step = np.maximum(self.min_step_points, stops) * point
+        gain = np.where(has_sl, side * (target - sl), np.inf)
+        send = (gain >= step - point * 1e-6) & (side * (price - target) > 0)
+
+        for i in np.flatnonzero(level != tracked):
+            self._set_fields(tickets[i], trailing_sl_level=float(level[i]))
+        queued = 0
+        now = self.clock()
+        with self._lock:
+            for i in np.flatnonzero(send):
+                ticket = tickets[i]
+                new_sl = round(float(target[i]), int(digits[i]))
+                if ticket in self.queue:
+                    self.stats["coalesced"] += 1
+                self.queue[ticket] = Modify(ticket, symbols[i], new_sl, tps[i], now)
+                self.queue.move_to_end(ticket)
+                queued += 1
+        self.stats["skipped"] += len(rows) - int(send.sum())
+        return queued
+
+    def _set_fields(self, ticket, **fields):
+        update_fields = getattr(self.trades, "update_fields", None)
+        if update_fields is not None:
+            update_fields(ticket, **fields)
+        else:
+            self.trades[ticket].update(fields)
+
+    # ------------------------------------------------------------------
+    # Send
+    # ------------------------------------------------------------------
+    def drain(self):
+        """Send queued modifications, oldest first, as far as the rate limit allows. Returns count sent."""
+        sent = 0
+        while True:
+            with self._lock:
+                if not self.queue:
+                    break
+                if not self.bucket.take():
+                    self.stats["rate_limited"] += 1
+                    break
+                ticket, modify = self.queue.popitem(last=False)
+            self._send(modify)
+            sent += 1
+        return sent
+
+    def _send(self, modify):
+        request = {"action": self.mt5.TRADE_ACTION_SLTP, "position": modify.ticket, "symbol": modify.symbol,
+                   "sl": modify.sl, "tp": modify.tp or 0.0}
+        if self.dry_run:
+            logger.info(f"DRY RUN - SL modify {request}")
+            self.stats["sent"] += 1
+            return
+        try:
+            result = self.mt5.order_send(request)
+        except Exception as e:
+            logger.error(f"SL modify for {modify.ticket} raised: {e}")
+            result = None
+        retcode = getattr(result, "retcode", None)
+        if retcode is None and isinstance(result, dict):
+            retcode = result.get("retcode")
+        retcode = -1 if retcode is None else retcode
+        name, kind = classify(retcode)
+        self.symbol_cache.check_retcode(modify.symbol, retcode)
+        self.stats["sent"] += 1
+        if kind == DONE or retcode == _NO_CHANGES:
+            self.stats["modified"] += 1
+            return
+        if kind == FATAL:
+            self.stats["failed"] += 1
+            logger.warning(f"SL modify for {modify.ticket} to {modify.sl} rejected: {name} ({retcode})")
+            return
+        # Requote / transient: retry on the next drain unless a newer level was queued meanwhile
+        self.stats["retried"] += 1
+        with self._lock:
+            if modify.ticket not in self.queue:
+                self.queue[modify.ticket] = modify
+
+    def step(self):
+        queued = self.update()
+        sent = self.drain()
+        return queued, sent
+
+
+class ActiveTradeRecorder:
+    """
+    PositionBook subscriber registering the positions one strategy opens in active_trades.
+
+    mt5: MetaTrader5 module (or hub client / simulator).
+    trades: the active_trades mapping the TrailingStopManager reads.
+    strategy / magic: the strategy's name and the magic its orders carry.
+    trail_points: trailing distance in points; None trails at the initial SL distance.
+    """
+
+    def __init__(self, mt5, trades, strategy, magic, trail_points=None, symbol_cache=None):
+        self.mt5 = mt5
+        self.trades = trades
+        self.strategy = strategy
+        self.magic = magic
+        self.trail_points = trail_points
+        self.symbol_cache = symbol_cache or SymbolCache(mt5)
+        self.stats = collections.Counter()
+
+    def __call__(self, diff, book):
+        for position in diff.opened:
+            self.register(position)
+
+    def adopt(self, book):
+        """Register the strategy's positions that were already open at the baseline snapshot."""
+        for position in list(book.by_ticket.values()):
+            if position.ticket not in self.trades:
+                self.register(position)
+
+    def _distance(self, position):
+        if self.trail_points:
+            meta = self.symbol_cache.get(position.symbol)
+            return self.trail_points * meta.point if meta is not None and meta.point else None
+        return abs(position.price_open - position.sl) if position.sl else None
+
+    def register(self, position):
+        """Add position to active_trades if it is the strategy's; returns True if it was."""
+        if getattr(position, "magic", None) != self.magic:
+            return False
+        distance = self._distance(position)
+        if not distance:
+            self.stats["no_distance"] += 1
+            logger.warning(f"{self.strategy} position {position.ticket} has no SL to trail from; not tracked")
+            return False
+        self.trades[position.ticket] = {
+            "symbol": position.symbol,
+            "direction": "buy" if position.type == self.mt5.POSITION_TYPE_BUY else "sell",
+            "strategy": self.strategy,
+            "magic": self.magic,
+            "entry_price": position.price_open,
+            "volume": position.volume,
+            "sl": position.sl,
+            "tp": position.tp,
+            "comment": position.comment,
+            "opened_at": int(position.time),
+            "trailing_sl_distance": distance,
+        }
+        self.stats["registered"] += 1
+        logger.info(f"Tracking {self.strategy} position {position.ticket} ({position.symbol}), trailing {distance}")
+        return True
+
+
+def parse_strategy(text):
+    """"name=magic" or "name=magic:trail_points" -> (name, magic, trail_points or None)."""
+    name, _, rest = text.partition("=")
+    magic, _, points = rest.partition(":")
+    if not name or not magic:
+        raise argparse.ArgumentTypeError(f"expected name=magic[:points], got {text!r}")
+    try:
+        return name, int(magic), float(points) if points else None
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected name=magic[:points], got {text!r}")
+
+
+def main():
+    from STOCKDATA.broker import get_backend
+    from STOCKDATA.position_book import PositionBook
+    from STOCKDATA.state_store import StateStore, migrate_legacy
+
+    parser = argparse.ArgumentParser(description="Trail stops of the tracked active trades")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between passes")
+    parser.add_argument("--min-step", type=float, default=10, help="smallest SL move to send, in points")
+    parser.add_argument("--rate", type=float, default=5.0, help="SL modifications per second")
+    parser.add_argument("--strategy", type=parse_strategy, action="append",
+                        help="name=magic[:trail_points] whose new positions are tracked (repeatable; "
+                             f"default {' '.join(DEFAULT_STRATEGIES)})")
+    parser.add_argument("--once", action="store_true", help="one pass, then print stats")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+    mt5 = get_backend()
+    if not mt5.initialize():
+        raise RuntimeError(f"MT5 initialize() failed, code={mt5.last_error()}")
+    store = StateStore()
+    migrate_legacy(store)
+    book = PositionBook(mt5, max_age=args.interval)
+    trades = store.table("active_trades")
+    trailing = TrailingStopManager(mt5, book, trades, min_step_points=args.min_step,
+                                   rate=args.rate, dry_run=args.dry_run)
+    recorders = [ActiveTradeRecorder(mt5, trades, name, magic, points, symbol_cache=trailing.symbol_cache)
+                 for name, magic, points in args.strategy or [parse_strategy(s) for s in DEFAULT_STRATEGIES]]
+    for recorder in recorders:
+        book.subscribe(recorder)
+    adopted = False
+    try:
+        while True:
+            if book.refresh() is not None and not adopted:
+                # The baseline refresh reports nothing as opened
+                for recorder in recorders:
+                    recorder.adopt(book)
+                adopted = True
+            trailing.step()
+            store.flush()
+            if args.once:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.close()
+        mt5.shutdown()
+    print(json.dumps(dict(trailing.stats), indent=2))
+
+
+if __name__ == "__main__":
+    main()
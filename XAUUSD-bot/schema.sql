@@ -1,5 +1,7 @@
 -- SQLite schema for XAUUSD-bot
 PRAGMA foreign_keys = ON;
+-- Run in WAL mode so dashboard reads don't block the bot's writes
+PRAGMA journal_mode = WAL;
 
 CREATE TABLE IF NOT EXISTS trades (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -38,7 +40,38 @@ CREATE TABLE IF NOT EXISTS trades (
 );
 
 -- Helpful indexes
+-- (strategy, timestamp) and (symbol, exit_time) also carry profit/lot_size so the
+-- per-day PnL aggregates are answered from the index alone; they replace the
+-- single-column strategy/symbol indexes (a composite index serves its prefix).
 CREATE INDEX IF NOT EXISTS idx_trades_timestamp ON trades(timestamp);
-CREATE INDEX IF NOT EXISTS idx_trades_symbol ON trades(symbol);
-CREATE INDEX IF NOT EXISTS idx_trades_strategy ON trades(strategy);
-CREATE INDEX IF NOT EXISTS idx_trades_type ON trades(trade_type); 
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_trades_strategy_ts ON trades(strategy, timestamp, profit, lot_size);
+CREATE INDEX IF NOT EXISTS idx_trades_symbol_exit ON trades(symbol, exit_time, profit, lot_size);
+CREATE INDEX IF NOT EXISTS idx_trades_type ON trades(trade_type);
+
+-- Materialized daily rollups, maintained by STOCKDATA/trade_store.py
+-- Strategy PnL is booked on the trade day (timestamp), symbol PnL on the exit day
+CREATE TABLE IF NOT EXISTS daily_strategy_pnl (
+  day TEXT NOT NULL,
+  strategy TEXT NOT NULL,
+  trades INTEGER NOT NULL,
+  wins INTEGER NOT NULL,
+  losses INTEGER NOT NULL,
+  gross_profit REAL NOT NULL,
+  gross_loss REAL NOT NULL,
+  net_profit REAL NOT NULL,
+  lots REAL NOT NULL,
+  PRIMARY KEY (day, strategy)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS daily_symbol_pnl (
+  day TEXT NOT NULL,
+  symbol TEXT NOT NULL,
+  trades INTEGER NOT NULL,
+  wins INTEGER NOT NULL,
+  losses INTEGER NOT NULL,
+  gross_profit REAL NOT NULL,
+  gross_loss REAL NOT NULL,
+  net_profit REAL NOT NULL,
+  lots REAL NOT NULL,
+  PRIMARY KEY (day, symbol)
+) WITHOUT ROWID; 
\ No newline at end of file